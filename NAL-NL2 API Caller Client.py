@@ -1,13 +1,21 @@
+import time
+_T_PROCESS = time.perf_counter()  # 启动基准：进程开始导入本文件的时刻
+
 import json
 import os
-import socket
-import threading
-from dataclasses import dataclass, asdict, field
+import sys
 from typing import List, Dict, Any, Optional
-import requests
 from requests.exceptions import RequestException
 from PySide6 import QtCore, QtGui, QtWidgets
 
+from nal_core import (AppConfig, batch_main, Cancelled, CancelToken, CircuitBreaker, compile_response_map, current_token,
+    DEFAULT_API_DOC_FILE, DEFAULT_CONFIG_FILE, DEFAULT_TEMPLATES_FILE, ensure_templates_file,
+    format_prometheus, FREQS_19, FREQS_9, HealthMonitor, Histogram, Job, JobExecutor, load_app_config,
+    load_main, load_templates_list, map_response_to_fields, MAX_JOB_WORKERS, METRICS_PORT_ENV, MetricsServer,
+    NALClient, proxy_main, RECORD_ENV, replay_main, RequestBuilder, RequestValidationError, RequestValidator,
+    save_app_config, save_snapshot, SessionRecorder, SNAPSHOT_FILE, SNAPSHOT_INTERVAL_S, load_snapshot,
+    STALL_THRESHOLD_ENV, STALL_THRESHOLD_S, StallWatchdog, TRACE_ENV, TRACER)
+
 #Ver2025.12.04-4 增加“输入/输出曲线”标签页; "主页"标签页step1-8初始化按钮追加调用20号函数;
 #Ver2025.12.04-5 “输入/输出曲线”标签页增加了绘制增益曲线的功能，方便直观对比
 #Ver2025.12.05-1 “输入/输出曲线”标签页 图像区Y轴范围向下扩大到-30dB
@@ -19,334 +27,16 @@ from PySide6 import QtCore, QtGui, QtWidgets
 #Ver2025.12.10-1 “主页”tab右侧宽度固定为500像素；左侧RECD/REDD/REUR区域增加全部切换按钮;输入/输出曲线tab微调布局
 #Ver2025.12.10-2 修正“增益/响应曲线”tab里切页不重新load参数的bug；
 
+_T_IMPORTED = time.perf_counter()
+
 APP_NAME = "NAL-NL2 API Caller Client"
 APP_VERSION = "Ver2025.12.10-2"
 
 
-
-DEFAULT_CONFIG_FILE = "nal_nl2_config.json"
-DEFAULT_TEMPLATES_FILE = "function_templates.json"
-
-FREQS_19 = [125,160,200,250,315,400,500,630,800,1000,1250,1600,2000,2500,3150,4000,5000,6300,8000]
-FREQS_9 = [250,500,1000,1500,2000,3000,4000,6000,8000]
-
-DEFAULT_TEMPLATES = {
-    "templates": [
-        {"label": "1 - dllVersion", "function": "dllVersion", "params": []},
-
-        {"label": "2 - RealEarInsertionGain_NL2", "function": "RealEarInsertionGain_NL2",
-         "params": ["AC", "BC", "L", "limiting", "channels", "direction", "mic", "ACother", "noOfAids"]},
-
-        {"label": "3 - RealEarAidedGain_NL2", "function": "RealEarAidedGain_NL2",
-         "params": ["AC", "BC", "L", "limiting", "channels", "direction", "mic", "ACother", "noOfAids"]},
-
-        {"label": "4 - TccCouplerGain_NL2", "function": "TccCouplerGain_NL2",
-         "params": ["AC", "BC", "L", "limiting", "channels", "direction", "mic", "target", "aidType", "ACother", "noOfAids", "tubing", "vent", "RECDmeasType"]},
-
-        {"label": "5 - EarSimulatorGain_NL2", "function": "EarSimulatorGain_NL2",
-         "params": ["AC", "BC", "L", "direction", "mic", "limiting", "channels", "target", "aidType", "ACother", "noOfAids", "tubing", "vent", "RECDmeasType"]}, #5 "tubing","RECDmeasType" NOT USED
-
-        {"label": "6 - RealEarInputOutputCurve_NL2", "function": "RealEarInputOutputCurve_NL2",
-         "params": ["AC", "BC", "graphFreq", "startLevel", "finishLevel", "limiting", "channels", "direction", "mic", "target", "ACother", "noOfAids"]},
-
-        {"label": "7 - TccInputOutputCurve_NL2", "function": "TccInputOutputCurve_NL2",
-         "params": ["AC", "BC", "graphFreq", "startLevel", "finishLevel", "limiting", "channels", "direction", "mic", "target", "aidType", "ACother", "noOfAids", "tubing", "vent", "RECDmeasType"]}, #7 "tubing","RECDmeasType" NOT USED
-
-        {"label": "8 - EarSimulatorInputOutputCurve_NL2", "function": "EarSimulatorInputOutputCurve_NL2",
-         "params": ["AC", "BC", "graphFreq", "startLevel", "finishLevel", "limiting", "channels", "direction", "mic", "target", "aidType", "ACother", "noOfAids", "tubing", "vent", "RECDmeasType"]}, #8 "tubing","RECDmeasType" NOT USED
-
-        {"label": "9 - Speech_o_Gram_NL2", "function": "Speech_o_Gram_NL2",
-         "params": ["AC", "BC", "L", "limiting", "channels", "direction", "mic", "ACother", "noOfAids"]},
-
-        {"label": "10 - AidedThreshold_NL2", "function": "AidedThreshold_NL2",
-         "params": ["AC", "BC", "CT", "dbOption", "ACother", "noOfAids", "limiting", "channels", "direction", "mic"]},
-
-        {"label": "11 - GetREDDindiv", "function": "GetREDDindiv", "params": ["REDD_defValues"]},
-        {"label": "12 - GetREDDindiv9", "function": "GetREDDindiv9", "params": ["REDD_defValues"]},
-        {"label": "13 - GetREURindiv", "function": "GetREURindiv", "params": ["REUR_defValues", "dateOfBirth", "direction", "mic"]},
-        {"label": "14 - GetREURindiv9", "function": "GetREURindiv9", "params": ["REUR_defValues", "dateOfBirth", "direction", "mic"]},
-        {"label": "15 - SetREDDindiv", "function": "SetREDDindiv", "params": ["REDD", "REDD_defValues"]},
-        {"label": "16 - SetREDDindiv9", "function": "SetREDDindiv9", "params": ["REDD9", "REDD_defValues"]},
-        {"label": "17 - SetREURindiv", "function": "SetREURindiv", "params": ["REUR", "REUR_defValues", "dateOfBirth", "direction", "mic"]},
-        {"label": "18 - SetREURindiv9", "function": "SetREURindiv9", "params": ["REUR9", "REUR_defValues", "dateOfBirth", "direction", "mic"]},
-        {"label": "19 - CrossOverFrequencies_NL2", "function": "CrossOverFrequencies_NL2", "params": ["channels", "AC", "BC"]}, #19 "BC" NOT USED, 需要把BC填充为AC的值，以符合Step1-9文档的要求
-        {"label": "20 - CenterFrequencies", "function": "CenterFrequencies", "params": ["CFArray", "channels"]},
-
-        {"label": "21 - CompressionThreshold_NL2", "function": "CompressionThreshold_NL2",
-         "params": ["bandWidth", "selection", "WBCT", "aidType", "direction", "mic", "calcCh"]},
-
-        {"label": "22 - CompressionRatio_NL2", "function": "CompressionRatio_NL2",
-         "params": ["channels", "centreFreq", "AC", "BC", "direction", "mic", "limiting", "ACother", "noOfAids"]},
-
-        {"label": "23 - setBWC", "function": "setBWC", "params": ["channels", "crossOver"]},
-        {"label": "24 - getMPO_NL2 (RESR/SSPL)", "function": "getMPO_NL2", "params": ["type", "AC", "BC", "channels", "limiting"]},
-
-        {"label": "25 - GainAt_NL2", "function": "GainAt_NL2",
-         "params": ["freqRequired", "targetType", "AC", "BC", "L", "limiting", "channels", "direction", "mic",
-                    "ACother", "noOfAids", "bandWidth", "target", "aidType", "tubing", "vent", "RECDmeasType"]},
-
-        {"label": "26 - GetMLE", "function": "GetMLE",  "params": ["aidType", "direction", "mic"]},
-        {"label": "27 - ReturnValues_NL2", "function": "ReturnValues_NL2", "params": []},
-        {"label": "28 - GetTubing_NL2", "function": "GetTubing_NL2", "params": ["tubing"]},
-        {"label": "29 - GetTubing9_NL2", "function": "GetTubing9_NL2", "params": ["tubing"]},
-        {"label": "30 - GetVentOut_NL2", "function": "GetVentOut_NL2", "params": ["vent"]},
-        {"label": "31 - GetVentOut9_NL2", "function": "GetVentOut9_NL2", "params": ["vent"]},
-        {"label": "32 - Get_SI_NL2", "function": "Get_SI_NL2", "params": ["s", "REAG", "MPO"]}, # MPO的位置在原文档里是 Limit,猜测就是MPO
-
-        {"label": "33 - Get_SII", "function": "Get_SII",
-         "params": ["compSpeed", "Speech_thresh", "s", "REAG", "REAGp", "REAGm", "REUR"]}, # compSpeed 的位置在文档里是 nCompSpeed ,猜测是同一个数据
-
-        {"label": "34 - SetAdultChild", "function": "SetAdultChild", "params": ["adultChild", "dateOfBirth"]},
-        {"label": "35 - SetExperience", "function": "SetExperience", "params": ["experience"]},
-        {"label": "36 - SetCompSpeed", "function": "SetCompSpeed", "params": ["compSpeed"]},
-        {"label": "37 - SetTonalLanguage", "function": "SetTonalLanguage", "params": ["tonal"]},
-        {"label": "38 - SetGender", "function": "SetGender", "params": ["gender"]},
-
-        {"label": "39 - GetRECDh_indiv_NL2", "function": "GetRECDh_indiv_NL2",
-         "params": ["RECDmeasType", "dateOfBirth", "aidType", "tubing", "vent", "coupler", "fittingDepth"]}, #39 "aidType" NOT USED
-
-        {"label": "40 - GetRECDh_indiv9_NL2", "function": "GetRECDh_indiv9_NL2",
-         "params": ["RECDmeasType", "dateOfBirth", "aidType", "tubing", "vent", "coupler", "fittingDepth"]},
-
-        {"label": "41 - GetRECDt_indiv_NL2", "function": "GetRECDt_indiv_NL2",
-         "params": ["RECDmeasType", "dateOfBirth", "aidType", "tubing", "vent", "earpiece", "coupler", "fittingDepth"]}, #41 "aidType" NOT USED
-
-        {"label": "42 - GetRECDt_indiv9_NL2", "function": "GetRECDt_indiv9_NL2",
-         "params": ["RECDmeasType", "dateOfBirth", "aidType", "tubing", "vent", "earpiece", "coupler", "fittingDepth"]},
-
-        {"label": "43 - SetRECDh_indiv_NL2", "function": "SetRECDh_indiv_NL2", "params": ["RECDh"]},
-        {"label": "44 - SetRECDh_indiv9_NL2", "function": "SetRECDh_indiv9_NL2", "params": ["RECDh9"]},
-        {"label": "45 - SetRECDt_indiv_NL2", "function": "SetRECDt_indiv_NL2", "params": ["RECDt"]},
-        {"label": "46 - SetRECDt_indiv9_NL2", "function": "SetRECDt_indiv9_NL2", "params": ["RECDt9"]}
-    ]
-}
-
-def ensure_templates_file(path: str):
-    if not os.path.exists(path):
-        with open(path, "w", encoding="utf-8") as f:
-            json.dump(DEFAULT_TEMPLATES, f, ensure_ascii=False, indent=2)
-
-@dataclass
-class AppConfig:
-# Server
-    server_ip: str = "192.168.0.100"
-    server_port: int = 8080
-    server_path: str = "/api/nal2/process"
-
-# ======================================================================================================================
-# 在配置页面出现的参数
-# ======================================================================================================================
-# 用户数据
-    adultChild: int = 0          # 0=成人;1=儿童;2=按dateOfBirth计算 (34i)
-    dateOfBirth: int = 19810101  # yyyymmdd (34i 13i 14i 17i 18i 39i 40i 41i 42i)
-    experience: int = 0          # 0=有经验;1=新用户 (35i)
-    compSpeed: int = 1           # 0=慢;1=快;2=双速 (36i 33i)
-    tonal: int = 0               # 0=非声调;1=声调 (37i)
-    gender: int = 1              # 0=未知;1=男;2=女 (38i)
-    
-# 用户听阈（9 点：250,500,1k,1.5k,2k,3k,4k,6k,8k Hz）
-    AC:      List[float] = field(default_factory=lambda: [45, 40, 40, 999, 65, 999, 70, 70, 55])   # (2i 3i 4i 5i 6i 7i 8i 9i 10i 19i 22i 24i 25i)
-    BC:      List[float] = field(default_factory=lambda: [45, 40, 40, 999, 65, 999, 70, 999, 999]) # (2i 3i 4i 5i 6i 7i 8i 9i 10i 19i 22i 24i 25i) 实际上19号函数文档里标注NOT USED，用AC值代替
-    ACother: List[float] = field(default_factory=lambda: [45, 45, 45, 999, 65, 999, 70, 65, 55])   # (2i 3i 4i 5i 6i 7i 8i 9i 10i 22i 25i)
-
-
-# ==============================
-# 常用参数（多数 API 共享）
-# ==============================
-    channels: int = 18           # 1..18 (2i 3i 4i 5i 6i 7i 8i 10i 19i 20i 22i 23i 24i 25i)
-    bandWidth: int = 0           # 0=宽带;1=窄带 (21i 25i)
-    selection: int = 1           # 计算CT时使用的增益目标。0=REIG;1=REAG;2=2cc;3=EarSimulator (21i)
-    WBCT: int = 52               # 宽带压缩阈         (21i)
-    aidType: int = 3             # 0=CIC;1=ITC;2=ITE;3=BTE (4i 5i 7i 8i 21i 25i 26i 39i 40i 41i 42i) 实际上39、41号函数文档里标注NOT USED
-    direction: int = 0           # 0=0°;1=45°            (2i 3i 4i 5i 6i 7i 8i 9i 10i 13i 14i 17i 18i 21i 22i 25i 26i)
-    mic: int = 1                 # 0=自由场;1=头表面(MRP) (2i 3i 4i 5i 6i 7i 8i 9i 10i 13i 14i 17i 18i 21i 22i 25i 26i)
-    limiting: int = 0            # 0=关;1=宽带;2=多通道 (2i 3i 4i 5i 6i 7i 8i 9i 10i 22i 24i 25i)
-    noOfAids: int = 1            # 0=单耳;1=双耳           (2i 3i 4i 5i 6i 7i 8i 9i 10i 22i 25i)
-    calcCh: List[int] = field(default_factory=lambda: [1] * 19)  # CompressionThreshold 重算标志 (21i)
-
-
-# ==============================
-# 装配/耦合相关（RECD/管路/通气孔等）
-# ==============================
-    tubing: int = 3              # 0=Libby4;1=Libby3;2=#13;3=细管;4=RITC;5=None (4i 5i 7i 8i 25i 28i 29i 39i 40i 41i 42i)  实际上5、7、8号函数文档里标注NOT USED
-    vent: int = 0                # 0=紧;1=封闭;2=封闭穹顶;3=1mm;4=2mm;5=3mm;6=开放穹顶 (4i 5i 7i 8i 25i 30i 31i 39i 40i 41i 42i)
-    coupler: int = 0             # 0=HA1;1=HA2 (39i 40i 41i 42i)
-    fittingDepth: int = 0        # 0=标准;1=深;2=浅 (39i 40i 41i 42i)
-    earpiece: int = 0            # 0=泡棉;1=自制耳模 (41i 42i)
-    RECDmeasType: int = 0        # 0=预测;1=实测 (4i 5i 7i 8i 25i 39i 40i 41i 42i) 实际上4、5、7、8号函数文档里标注NOT USED
-    REDD_defValues: int = 0      # Get/Set REDD: 0=预测;1=客户数据 (11i 12i 15i 16i)
-    REUR_defValues: int = 0      # Get/Set REUR: 0=预测;1=客户数据 (13i 14i 17i 18i)
-
-# ==============================
-# 获取增益或曲线用
-# ==============================
-    L: int = 65                  # 宽带输入电平(dB)          (2i 3i 4i 5i 6i 7i 8i 9i 25i)
-    target: int = 1              # 目标：0=REIG;1=REAG (4i 5i 6i 7i 8i 25i)
-    targetType: int = 1          # GainAt_NL2使用的增益目标: 0=REIG;1=REAG;2=2cc;3=EarSim (25i)
-    freqRequired: int = 9        # 单频点计算索引 0..18 (25i)
-    type: int = 1                # getMPO_NL2 用：0=RESR;1=SSPL (24i)
-    
-    graphFreq: int = 9           # IO 曲线用：0..18 (6i 7i 8i)
-    startLevel: int = 40         # IO 曲线起始 dB (6i 7i 8i)
-    finishLevel: int = 90        # IO 曲线结束 dB (6i 7i 8i)
-    s: int = 2                   # SI/SII 语音级别索引 (32i 33i)
-    dbOption: int = 0            # AidedThreshold: 0=dB HL;1=dB SPL (10i)
-
-# ==============================
-# 频带/分频计算（19 或可变）
-# ==============================
-    CFArray: List[float] = field(default_factory=lambda: [0.0] * 19)   # CrossOverFrequencies 输出；实际用长=channels-1 (19o 20i)
-    crossOver: List[float] = field(default_factory=lambda: [0.0] * 19) # setBWC 输入 (23i)
-    FreqInCh: List[int] = field(default_factory=lambda: [0] * 19)      # 频点所属通道 (19o)
-    centerF: List[int] = field(default_factory=lambda: [0] * 19)       # CenterFrequencies 输出 (20o)
-    centreFreq: List[int] = field(default_factory=lambda: [0] * 19)    # CompressionRatio 输入名 (22i)
-
-# ==============================
-# 阈值/压缩（21,22）
-# ==============================
-    CT: List[float] = field(default_factory=lambda: [0.0] * 19)        # CompressionThreshold_NL2 输出 / AidedThreshold 输入 (21o 10i)
-    CR: List[float] = field(default_factory=lambda: [0.0] * 19)        # CompressionRatio_NL2 输出 (22o)
-
-# ==============================
-# RECD 系列（39-46）
-# ==============================
-    RECDh:  List[float] = field(default_factory=lambda: [0.0] * 19)   # GetRECDh_indiv_NL2 / SetRECDh_indiv_NL2 (39o 43i)
-    RECDh9: List[float] = field(default_factory=lambda: [0.0] * 9)    # GetRECDh_indiv9_NL2 / SetRECDh_indiv9_NL2 (40o 44i)
-    RECDt:  List[float] = field(default_factory=lambda: [0.0] * 19)   # GetRECDt_indiv_NL2 / SetRECDt_indiv_NL2 (41o 45i)
-    RECDt9: List[float] = field(default_factory=lambda: [0.0] * 9)    # GetRECDt_indiv9_NL2 / SetRECDt_indiv9_NL2 (42o 46i)
-
-# ==============================
-# REUR / REDD（11-18）
-# ==============================
-    REDD: List[float] = field(default_factory=lambda: [0.0] * 19)      # GetREDDindiv / SetREDDindiv (11o 15i)
-    REDD9: List[float] = field(default_factory=lambda: [0.0] * 9)      # GetREDDindiv9 / SetREDDindiv9 (12o 16i)
-    REUR: List[float] = field(default_factory=lambda: [0.0] * 19)      # GetREURindiv / SetREURindiv / Get_SII (13o 17i 33i)
-    REUR9: List[float] = field(default_factory=lambda: [0.0] * 9)      # GetREURindiv9 / SetREURindiv9 (14o 18i)
-
-# ==============================
-# 实耳/耦合/耳模拟 增益与曲线（2-8,24-25）
-# ==============================
-    REIG: List[float] = field(default_factory=lambda: [0.0] * 19)      # RealEarInsertionGain_NL2 (2o)
-    REAG: List[float] = field(default_factory=lambda: [0.0] * 19)      # RealEarAidedGain_NL2 / Get_SI_NL2 / Get_SII (3o 32i 33i)
-    TccCG: List[float] = field(default_factory=lambda: [0.0] * 19)     # TccCouplerGain_NL2 (4o)
-    ESG: List[float] = field(default_factory=lambda: [0.0] * 19)       # EarSimulatorGain_NL2 (5o)
-    lineType19: List[int] = field(default_factory=lambda: [0] * 19)    # 画线类型输出 (4o 5o)
-
-    MPO: List[float] = field(default_factory=lambda: [0.0] * 19)       # getMPO_NL2 (24o)
-    gainAt_value: float = 0.0                                         # GainAt_NL2 返回值 (25o)
-
-    REIO: List[float] = field(default_factory=lambda: [0.0] * 100)     # RealEarInputOutputCurve_NL2（限幅）(6o)
-    REIOunl: List[float] = field(default_factory=lambda: [0.0] * 100)  # RealEarInputOutputCurve_NL2（无限幅）(6o)
-    TccIO: List[float] = field(default_factory=lambda: [0.0] * 100)    # TccInputOutputCurve_NL2（限幅）(7o)
-    TccIOunl: List[float] = field(default_factory=lambda: [0.0] * 100) # TccInputOutputCurve_NL2（无限幅）(7o)
-    ESIO: List[float] = field(default_factory=lambda: [0.0] * 100)     # EarSimulatorInputOutputCurve_NL2（限幅）(8o)
-    ESIOunl: List[float] = field(default_factory=lambda: [0.0] * 100)  # EarSimulatorInputOutputCurve_NL2（无限幅）(8o)
-    lineType100: List[int] = field(default_factory=lambda: [0] * 100)  # 画线类型输出 (7o 8o)
-
-
-# ==============================
-# 语音图/指标（9,32,33）
-# ==============================
-    Speech_rms: List[float] = field(default_factory=lambda: [0.0] * 19)    # Speech_o_Gram_NL2 (9o)
-    Speech_max: List[float] = field(default_factory=lambda: [0.0] * 19)    # Speech_o_Gram_NL2 (9o)
-    Speech_min: List[float] = field(default_factory=lambda: [0.0] * 19)    # Speech_o_Gram_NL2 (9o)
-    Speech_thresh: List[float] = field(default_factory=lambda: [0.0] * 19) # Speech_o_Gram_NL2 / Get_SII (9o 33i)
-    Limit: List[float] = field(default_factory=lambda: [0.0] * 19)         # Get_SI_NL2 (32i)
-
-    REAGp: List[float] = field(default_factory=lambda: [0.0] * 19)         # Get_SII (33i)
-    REAGm: List[float] = field(default_factory=lambda: [0.0] * 19)         # Get_SII (33i)
-    SI_value: float = 0.0                                                  # Get_SI_NL2 返回值 (32o)
-    SII_value: float = 0.0                                                 # Get_SII 返回值 (33o)
-
-# ==============================
-# Aided Threshold（10）
-# ==============================
-    AT: List[float] = field(default_factory=lambda: [0.0] * 19)        # AidedThreshold_NL2 (10o)
-
-
-# ==============================
-# 参考数据与修正（26,27,28-31）
-# ==============================
-    MLE: List[float] = field(default_factory=lambda: [0.0] * 19)       # GetMLE (26o)
-    MAF: List[float] = field(default_factory=lambda: [0.0] * 19)       # ReturnValues_NL2 (27o)
-    BWC: List[float] = field(default_factory=lambda: [0.0] * 19)       # ReturnValues_NL2 (27o)
-    ESCD: List[float] = field(default_factory=lambda: [0.0] * 19)      # ReturnValues_NL2 (27o)
-
-    Tubing: List[float] = field(default_factory=lambda: [0.0] * 19)    # GetTubing_NL2 (28o)
-    Tubing9: List[float] = field(default_factory=lambda: [0.0] * 9)    # GetTubing9_NL2 (29o)
-    Ventout: List[float] = field(default_factory=lambda: [0.0] * 19)   # GetVentOut_NL2 (30o)
-    Ventout9: List[float] = field(default_factory=lambda: [0.0] * 9)   # GetVentOut9_NL2 (31o)
-
-# ==============================
-# 版本信息（1）
-# ==============================
-    dll_major: int = 0                                               # dllVersion (1o)
-    dll_minor: int = 0                                               # dllVersion (1o)
-
-
-# —— 新增：增益/响应曲线页缓存（19点） ——
-    gain50_19: List[float] = field(default_factory=lambda: [0.0] * 19)
-    gain65_19: List[float] = field(default_factory=lambda: [0.0] * 19)
-    gain80_19: List[float] = field(default_factory=lambda: [0.0] * 19)
-    gainL_19:  List[float] = field(default_factory=lambda: [0.0] * 19)
-
-    resp50_19: List[float] = field(default_factory=lambda: [0.0] * 19)
-    resp65_19: List[float] = field(default_factory=lambda: [0.0] * 19)
-    resp80_19: List[float] = field(default_factory=lambda: [0.0] * 19)
-    respL_19:  List[float] = field(default_factory=lambda: [0.0] * 19)
- 
-# —— 新增：GainAt_NL2 的增益与响应（19点） ——
-    GainAt_NL2_gain: List[float] = field(default_factory=lambda: [0.0] * 19)
-    GainAt_NL2_resp: List[float] = field(default_factory=lambda: [0.0] * 19)
-
-# ==============================
-# 频点说明（注释）
-# - 9点数组顺序：250, 500, 1000, 1500, 2000, 3000, 4000, 6000, 8000 Hz
-# - 19点数组顺序：125, 160, 200, 250, 315, 400, 500, 630, 800, 1000,
-#                 1250,1600,2000,2500,3150,4000,5000,6300,8000
-# ==============================
-
-class NALClient:
-    def __init__(self):
-        self.ip = ""
-        self.port = 8080
-        self.path = "/api/nal2/process"
-        self.sequence_num = 0
-        self.timeout = 3.0
-        self.session = requests.Session()
-        self.connected = False
-
-    def set_server(self, ip: str, port: int, path: str):
-        self.ip = ip.strip()
-        self.port = int(port)
-        self.path = path.strip() if path.strip() else "/"
-
-    def url(self) -> str:
-        path = self.path
-        if not path.startswith("/"):
-            path = "/" + path
-        return f"http://{self.ip}:{self.port}{path}"
-
-    def connect(self) -> bool:
-        try:
-            with socket.create_connection((self.ip, self.port), timeout=3.0):
-                self.connected = True
-                return True
-        except OSError:
-            self.connected = False
-            return False
-
-    def disconnect(self):
-        self.connected = False
-
-    def post_json(self, body: Dict[str, Any]) -> Dict[str, Any]:
-        body = dict(body)
-        body["sequence_num"] = self.sequence_num
-        self.sequence_num += 1
-        headers = {"Content-Type": "application/json"}
-        resp = self.session.post(self.url(), headers=headers, data=json.dumps(body), timeout=self.timeout)
-        resp.raise_for_status()
-        return resp.json()
+def _ui_span_name(func) -> str:
+    """UI 回调的 span 名称：lambda 统一记为 ui call"""
+    name = getattr(func, "__name__", "")
+    return "ui call" if not name or name == "<lambda>" else name
 
 # 通用方法，在其他类中都可以调用
 class CommonFunc:
@@ -394,10 +84,36 @@ class CommonFunc:
             raise ValueError("数组长度不是 9")
         return arr
 
+    @staticmethod
+    def fill_edits(edits: List[QtWidgets.QLineEdit], data: List[float], n: int):
+        for i in range(n):
+            try:
+                x = data[i]
+                edits[i].setText("" if x is None else f"{float(x):.1f}")
+            except Exception:
+                edits[i].setText("")
+
+    BUSY_STYLE = "QPushButton { color: #b35c00; font-weight: bold; }"
+
+    @staticmethod
+    def set_busy(btn: Optional[QtWidgets.QPushButton], busy: bool):
+        # 只在触发按钮上标记“运行中”；按钮保持可点，再次点击以当前参数重新开始
+        if btn is None:
+            return
+        btn.setStyleSheet(CommonFunc.BUSY_STYLE if busy else "")
+        btn.setToolTip("运行中，再次点击将以当前参数重新开始 (Running; click again to restart)" if busy else "")
+
 class _WheelFocusFilter(QtCore.QObject):
-    # 未聚焦时：把滚轮事件转发给最近的滚动区域（而不是吞掉）
+    # 装在 QApplication 上的唯一一个过滤器（替代逐控件 installEventFilter）：
+    # 主窗口内未聚焦的输入类控件收到滚轮时，把事件转发给最近的滚动区域（而不是吞掉）
+    KINDS = (QtWidgets.QComboBox, QtWidgets.QLineEdit, QtWidgets.QPlainTextEdit, QtWidgets.QTextEdit)
+
+    def __init__(self, window: QtWidgets.QWidget):
+        super().__init__(window)
+        self.window = window
+
     def eventFilter(self, obj, ev):
-        if ev.type() == QtCore.QEvent.Type.Wheel:
+        if ev.type() == QtCore.QEvent.Type.Wheel and isinstance(obj, self.KINDS) and obj.window() is self.window:
             try:
                 if not obj.hasFocus():
                     sa = self._find_scroll_area(obj)
@@ -430,6 +146,31 @@ class _WheelFocusFilter(QtCore.QObject):
             p = p.parent()
         return None
 
+class _LazyPage(QtWidgets.QWidget):
+    # 页签占位：第一次切换到该页时才构建真正的页面
+    def __init__(self, factory):
+        super().__init__()
+        self.factory = factory
+        self.page: Optional[QtWidgets.QWidget] = None
+        lay = QtWidgets.QVBoxLayout(self)
+        lay.setContentsMargins(0, 0, 0, 0)
+
+    def ensure(self) -> QtWidgets.QWidget:
+        if self.page is None:
+            self.page = self.factory()
+            self.layout().addWidget(self.page)
+        return self.page
+
+def _draw_stale_badge(p: QtGui.QPainter, plot: QtCore.QRectF, text: str):
+    # 绘图区右上角的橙色标签：图上数据来自上次会话快照，尚未与服务器核对
+    fm = p.fontMetrics()
+    w, h = fm.horizontalAdvance(text) + 12, fm.height() + 4
+    r = QtCore.QRectF(plot.right() - w - 4, plot.top() + 4, w, h)
+    p.setPen(QtCore.Qt.PenStyle.NoPen); p.setBrush(QtGui.QColor(255, 236, 204))
+    p.drawRoundedRect(r, 3, 3)
+    p.setPen(QtGui.QColor(179, 92, 0)); p.setBrush(QtCore.Qt.BrushStyle.NoBrush)
+    p.drawText(r, QtCore.Qt.AlignmentFlag.AlignCenter, text)
+
 class CurveChart(QtWidgets.QWidget):
     def __init__(self, kind: str, parent=None):
         super().__init__(parent)
@@ -456,6 +197,7 @@ class CurveChart(QtWidgets.QWidget):
             "L":  QtGui.QColor(160, 160, 160), # 灰色
             "GA": QtGui.QColor(0, 0, 0),
         }
+        self.stale_text = ""  # 非空：曲线来自上次会话快照，右上角显示该文字
         self.setMinimumHeight(260)
         self.setAutoFillBackground(True)
 
@@ -474,8 +216,13 @@ class CurveChart(QtWidgets.QWidget):
             self.series[k] = [None]*19
         self.update()
 
+    def setStale(self, text: str):
+        self.stale_text = text
+        self.update()
+
     def paintEvent(self, e: QtGui.QPaintEvent):
         # 关键修复：显式 begin()/end()，避免活跃 QPainter 遗留
+        t_trace = TRACER.begin()
         p = QtGui.QPainter()
         if not p.begin(self):
             return
@@ -534,8 +281,11 @@ class CurveChart(QtWidgets.QWidget):
                 p.setPen(QtGui.QPen(col, 2)); p.drawLine(lx, ly+6, lx+16, ly+6)
                 p.setPen(QtGui.QPen(QtGui.QColor(50,50,50))); p.drawText(lx+20, ly+10, name)
                 ly += 16
+            if self.stale_text:
+                _draw_stale_badge(p, plot, self.stale_text)
         finally:
             p.end()
+            TRACER.complete("chart paint", "ui", t_trace, kind=self.kind)
 
     def _x_positions(self, plot: QtCore.QRectF) -> List[float]:
         w = plot.width(); n = 19; step = w / (n - 1)
@@ -617,6 +367,7 @@ class IOPlotWidget(QtWidgets.QWidget):
         self.base_color = QtGui.QColor(255, 197, 185)  # 默认皮肤色
         # 频率文字（图例下方）
         self.freq_label = ""
+        self.stale_text = ""  # 非空：曲线来自上次会话快照，右上角显示该文字
 
     def setLevels(self, startLevel: int, finishLevel: int):
         self.startLevel = int(startLevel)
@@ -654,6 +405,10 @@ class IOPlotWidget(QtWidgets.QWidget):
         self.series_g_unl = []
         self.update()
 
+    def setStale(self, text: str):
+        self.stale_text = text
+        self.update()
+
     def _plot_rect(self, full: QtCore.QRect) -> QtCore.QRectF:
         # 左侧/下侧留出刻度数值空间，保持 1:1，靠左对齐
         left, top, right, bottom = 60, 16, 16, 60
@@ -671,6 +426,7 @@ class IOPlotWidget(QtWidgets.QWidget):
         return QtCore.QPointF(x, y)
 
     def paintEvent(self, e: QtGui.QPaintEvent):
+        t_trace = TRACER.begin()
         p = QtGui.QPainter()
         if not p.begin(self):
             return
@@ -759,9 +515,12 @@ class IOPlotWidget(QtWidgets.QWidget):
             if self.freq_label:
                 p.setPen(QtGui.QPen(QtGui.QColor(50,50,50)))
                 p.drawText(lx, ly+10, self.freq_label)
+            if self.stale_text:
+                _draw_stale_badge(p, plot, self.stale_text)
 
         finally:
             p.end()
+            TRACER.complete("io plot paint", "ui", t_trace)
 
 
 class IO_tab(QtWidgets.QWidget):
@@ -771,15 +530,22 @@ class IO_tab(QtWidgets.QWidget):
     def __init__(self, mainwin: "MainWindow"):
         super().__init__()
         self.win = mainwin
+        self._last_mode: Optional[str] = None  # 图上曲线对应的模式（RE/TCC/ES），None 表示没有曲线
+        self._busy: Dict[str, int] = {}  # 任务名 -> 未结束的次数（含被 latest-wins 取消、尚未回调的旧任务）
         self._build_ui()
         self.reload_from_cfg()
+        snap = (self.win.snapshot or {}).get("io")
+        if snap:
+            self.apply_snapshot(snap)
         self.ui_call.connect(self._on_ui)
 
     def _post_ui(self, f): self.ui_call.emit(f)
     @QtCore.Slot(object)
     def _on_ui(self, f): 
+        t_trace = TRACER.begin()
         try: f()
         except Exception as e: print("IO_tab UI error:", e)
+        TRACER.complete(_ui_span_name(f), "ui", t_trace)
 
     # ---------- UI ----------
     def _build_ui(self):
@@ -939,9 +705,39 @@ class IO_tab(QtWidgets.QWidget):
 
     # ---------- 清除 ----------
     def _on_clear(self):
+        self._last_mode = None
+        self.chart.setStale("")
         self.chart.clearSeries()
         self.txt_data.clear()
 
+    # ---------- 冷启动快照 ----------
+    def snapshot(self) -> Optional[Dict[str, Any]]:
+        ch = self.chart
+        if self._last_mode is None or not ch.series_io:
+            return None
+        return {"mode": self._last_mode, "startLevel": ch.startLevel, "finishLevel": ch.finishLevel,
+                "graphFreq": int(self.win.cfg.graphFreq), "color": list(ch.base_color.getRgb()[:3]),
+                "io": ch.series_io, "io_unl": ch.series_io_unl, "g": ch.series_g, "g_unl": ch.series_g_unl,
+                "table": self.txt_data.toPlainText()}
+
+    def apply_snapshot(self, snap: Dict[str, Any]):
+        # 先画上次会话的曲线与表格，标记为待验证；连接后 validate_snapshot 重新拉取替换
+        try:
+            mode = str(snap["mode"])
+            self.chart.setMode(mode)
+            self.chart.setLevels(int(snap["startLevel"]), int(snap["finishLevel"]))
+            self.chart.setFrequencyLabelByIndex(int(snap["graphFreq"]))
+            self.chart.setSeries(snap["io"], snap["io_unl"], snap["g"], snap["g_unl"], QtGui.QColor(*snap["color"]))
+            self.txt_data.setPlainText(str(snap.get("table", "")))
+        except (KeyError, TypeError, ValueError):
+            return
+        self._last_mode = mode
+        self.chart.setStale(self.win.snapshot_label)
+
+    def validate_snapshot(self):
+        if self.chart.stale_text and self._last_mode:
+            self._on_fetch(self._last_mode)
+
     # ---------- 日志 ----------
     def _log(self, txt: str): self.log.appendPlainText(txt)
     def _sep(self): self._log("--------------------------------------------------------------------\n\n")
@@ -985,12 +781,8 @@ class IO_tab(QtWidgets.QWidget):
             keys = (["ESIO"], ["ESIOunl"])
             base_color = QtGui.QColor(100, 180, 100)  # 草绿
 
-        # 请求参数
-        params = {"AC": c.AC, "BC": c.BC, "graphFreq": int(c.graphFreq), "startLevel": sLv, "finishLevel": fLv,
-                  "limiting": c.limiting, "channels": c.channels, "direction": c.direction, "mic": c.mic,
-                  "target": c.target, "ACother": c.ACother, "noOfAids": c.noOfAids}
-        if mode != 'RE':
-            params.update({"aidType": c.aidType, "tubing": c.tubing, "vent": c.vent, "RECDmeasType": c.RECDmeasType})
+        # 请求参数（RE 模板不含 aidType/tubing/vent/RECDmeasType）
+        params = self.win.request_builder.params(fn, c, graphFreq=int(c.graphFreq), startLevel=sLv, finishLevel=fLv)
 
         def worker():
             req = {"function": fn, "input_parameters": params}
@@ -1052,6 +844,8 @@ class IO_tab(QtWidgets.QWidget):
 
             # 应用到 UI
             def apply_ui():
+                self._last_mode = mode
+                self.chart.setStale("")
                 self.chart.setMode(mode)
                 self.chart.setLevels(sLv, fLv)
                 self.chart.setFrequencyLabelByIndex(int(self.win.cfg.graphFreq))
@@ -1060,19 +854,43 @@ class IO_tab(QtWidgets.QWidget):
 
             self._post_ui(apply_ui)
 
-        threading.Thread(target=worker, daemon=True).start()
+        btn = {"RE": self.btn_reio, "TCC": self.btn_tccio}.get(mode, self.btn_esio)
+        name = f"fetch_{mode}"
+        self._busy[name] = self._busy.get(name, 0) + 1
+        CommonFunc.set_busy(btn, True)
+        self.win.jobs.submit("io", name, worker, latest_wins=True,
+                             on_done=lambda job: self._post_ui(lambda: self._end_fetch(name, btn)))
+
+    def _end_fetch(self, name: str, btn: QtWidgets.QPushButton):
+        # 同 GainRespTab._end_workflow：被取消的旧任务先回调时新任务仍在运行，计数归零才解除忙碌
+        self._busy[name] -= 1
+        if self._busy[name] <= 0:
+            del self._busy[name]
+            CommonFunc.set_busy(btn, False)
 
 class GainRespTab(QtWidgets.QWidget):
     # 新增：跨线程调度到主线程的信号（比 QTimer.singleShot 更稳妥）
     ui_call = QtCore.Signal(object)
 
+    # 按钮模式 -> (函数名, 响应中候选的增益数组键)
+    GAIN_FUNCS = {
+        "REIG":   ("RealEarInsertionGain_NL2", ["REIG", "gain", "REIG19"]),
+        "REAG":   ("RealEarAidedGain_NL2", ["REAG", "gain", "REAG19"]),
+        "2cc":    ("TccCouplerGain_NL2", ["TccCG", "TccCG19", "gain", "gain19"]),
+        "EarSim": ("EarSimulatorGain_NL2", ["ESG", "ESG19", "gain", "gain19"]),
+    }
+
     def __init__(self, mainwin: "MainWindow"):
         super().__init__()
         self.win = mainwin
+        self._last_std_mode: Optional[str] = None  # 最近一次标准曲线（50/65/80）的模式，供冷启动后复核
         self._build_ui()
         self._load_from_cfg()
-        if hasattr(self.win, "_apply_strict_focus_behavior"):
-            self.win._apply_strict_focus_behavior()
+        # 曲线本身随 config 恢复；有快照说明是上次会话的结果，标记为待验证
+        snap = (self.win.snapshot or {}).get("gain")
+        if snap:
+            self._last_std_mode = snap.get("std_mode")
+            self._set_stale(self.win.snapshot_label)
         # 连接信号 -> 槽，确保所有 UI 更新都在主线程执行
         self.ui_call.connect(self._run_on_ui)
 
@@ -1082,10 +900,12 @@ class GainRespTab(QtWidgets.QWidget):
 
     @QtCore.Slot(object)
     def _run_on_ui(self, func):
+        t_trace = TRACER.begin()
         try:
             func()
         except Exception as e:
             print("UI apply error:", e)
+        TRACER.complete(_ui_span_name(func), "ui", t_trace)
 
     def _build_ui(self):
         main = QtWidgets.QHBoxLayout(self)
@@ -1214,6 +1034,9 @@ class GainRespTab(QtWidgets.QWidget):
         self.btn_clear_curves = QtWidgets.QPushButton("清除全部曲线(Clear all curves)")
         row_ops.addWidget(self.btn_clear_curves)
         self.btn_clear_curves.setFixedWidth(300)
+        self.btn_cancel = QtWidgets.QPushButton("取消(Cancel)")
+        self.btn_cancel.setEnabled(False)
+        row_ops.addWidget(self.btn_cancel)
         row_ops.addStretch()#占位弹簧
         right.addLayout(row_ops)
 
@@ -1241,6 +1064,18 @@ class GainRespTab(QtWidgets.QWidget):
         self.btn_std_reag.clicked.connect(lambda: self._on_std_curves("REAG"))
         self.btn_std_2cc.clicked.connect(lambda: self._on_std_curves("2cc"))
         self.btn_std_ears.clicked.connect(lambda: self._on_std_curves("EarSim"))
+        self.btn_cancel.clicked.connect(lambda: self.win.jobs.cancel_lane("gain"))
+
+        # 流程名 -> 触发按钮（忙碌状态只标在这些按钮上）
+        self._busy: Dict[str, int] = {}
+        self._wf_buttons = {
+            "get_mpo": self.btn_get_mpo, "get_cr": self.btn_get_cr,
+            "get_gain_REIG": self.btn_get_reig, "get_gain_REAG": self.btn_get_reag,
+            "get_gain_2cc": self.btn_get_2cc, "get_gain_EarSim": self.btn_get_ears,
+            "gain_at": self.btn_gainat, "gain_at_single": self.btn_gainat_single,
+            "std_curves_REIG": self.btn_std_reig, "std_curves_REAG": self.btn_std_reag,
+            "std_curves_2cc": self.btn_std_2cc, "std_curves_EarSim": self.btn_std_ears,
+        }
     
     def _build_data_rows(self, parent_layout: QtWidgets.QVBoxLayout, titles: List[str]):
         rows = {}
@@ -1331,6 +1166,8 @@ class GainRespTab(QtWidgets.QWidget):
         for title in ["50dB Resp","65dB Resp","80dB Resp","LdB Resp","GainAt_NL2 Resp"]:
             self._fill_row(self.resp_rows[title], [None]*19)
         self.chart_gain.clearAll(); self.chart_resp.clearAll()
+        self._last_std_mode = None
+        self._set_stale("")
         z = [0.0]*19
         self.win.cfg.gain50_19 = z[:]; self.win.cfg.gain65_19 = z[:]; self.win.cfg.gain80_19 = z[:]; self.win.cfg.gainL_19 = z[:]; self.win.cfg.GainAt_NL2_gain = z[:]
         self.win.cfg.resp50_19 = z[:]; self.win.cfg.resp65_19 = z[:]; self.win.cfg.resp80_19 = z[:]; self.win.cfg.respL_19 = z[:]; self.win.cfg.GainAt_NL2_resp = z[:]
@@ -1367,6 +1204,10 @@ class GainRespTab(QtWidgets.QWidget):
             self._post_ui(lambda: self._log("响应(Response):\n" + json.dumps(resp, ensure_ascii=False, indent=2)))
             self._post_ui(self._sep)
             return resp
+        except Cancelled:
+            self._post_ui(lambda: self._log("已取消(Cancelled)"))
+            self._post_ui(self._sep)
+            return None
         except Exception as e:
             self._post_ui(lambda: self._log(f"错误: {e}"))
             self._post_ui(self._sep)
@@ -1389,12 +1230,54 @@ class GainRespTab(QtWidgets.QWidget):
             return self._parse_array(outp["output_parameters"], keys)
         return None
 
+    # ---------- 流程：latest-wins + 局部忙碌状态 ----------
+    def _run_workflow(self, name: str, worker):
+        # 同名流程再次点击：取消旧的，以当前参数重新开始。只标记触发按钮忙碌，其余操作不受影响；
+        # 流程中 selection/CT 先只改内存，所以期间暂停切页时的 config 重载（pin_cfg）
+        self._busy[name] = self._busy.get(name, 0) + 1
+        self.win.pin_cfg(True)
+        CommonFunc.set_busy(self._wf_buttons.get(name), True)
+        self.btn_cancel.setEnabled(True)
+        self.win.jobs.submit("gain", name, lambda: self._in_session(worker), latest_wins=True,
+                             on_done=lambda job: self._post_ui(lambda: self._end_workflow(name)))
+
+    def _in_session(self, worker):
+        # 整个流程是一次验配事务：中途不会插入别的页签（如 IO 曲线）的有状态调用
+        with self.win.client.session():
+            worker()
+
+    def _end_workflow(self, name: str):
+        self.win.pin_cfg(False)
+        self._busy[name] -= 1
+        if self._busy[name] <= 0:
+            del self._busy[name]
+            CommonFunc.set_busy(self._wf_buttons.get(name), False)
+        self.btn_cancel.setEnabled(bool(self._busy))
+
+    def _keep_selection_on_success(self, work):
+        # work(old_sel) 改 selection 后取 CT/增益；只有返回 True（结果已提交落盘）才保留新 selection，
+        # 中途失败、取消（包括 _send 内被取消）或抛异常都回滚
+        old_sel = int(self.win.cfg.selection)
+        done = False
+        try:
+            done = bool(work(old_sel))
+        finally:
+            if not done:
+                self.win.cfg.selection = old_sel
+
+    def _ct_failed(self, old_sel: Optional[int], token: CancelToken):
+        # 获取 CT 失败或流程已取消：回滚 selection（在工作线程里做，避免覆盖后续流程的设置），仅真实失败时提示
+        if old_sel is not None:
+            self.win.cfg.selection = old_sel
+        if not token.cancelled:
+            self._post_ui(lambda: QtWidgets.QMessageBox.warning(self, "提示", "获取CT失败，已取消后续操作"))
+
     def _on_get_mpo(self):
         if not self.win.client.connected:
             QtWidgets.QMessageBox.warning(self, "提示", "请先连接服务器")
             return
         c = self.win.cfg
-        params = {"type": c.type, "AC": c.AC, "BC": c.BC, "channels": c.channels, "limiting": c.limiting}
+        params = self.win.request_builder.params("getMPO_NL2", c)
         def worker():
             resp = self._send("getMPO_NL2", params)
             if not resp: return
@@ -1406,7 +1289,7 @@ class GainRespTab(QtWidgets.QWidget):
                     self._fill_row(self.show_rows["MPO"], self.win.cfg.MPO)
                     self.win.save_config(self.win.config_path)
                 self._post_ui(apply_ui)
-        threading.Thread(target=worker, daemon=True).start()
+        self._run_workflow("get_mpo", worker)
     
     def _set_selection_for_mode(self, mode: str) -> int:
         # 根据模式名设置 selection：REIG=0, REAG=1, 2cc=2, EarSim=3
@@ -1433,17 +1316,9 @@ class GainRespTab(QtWidgets.QWidget):
         # 以当前 config（含最新的 selection）调用 CompressionThreshold_NL2，
         # 把返回的 CT 仅更新到内存 self.win.cfg.CT，不立即写文件。
         # 成功返回 True；失败返回 False。
-        c = self.win.cfg
-        ct_params = {
-            "bandWidth": c.bandWidth,
-            "selection": c.selection,
-            "WBCT": c.WBCT,
-            "aidType": c.aidType,
-            "direction": c.direction,
-            "mic": c.mic,
-            "calcCh": c.calcCh
-        }
-        resp = self._send("CompressionThreshold_NL2", ct_params)
+        with TRACER.span("CT fetch", "step"):
+            ct_params = self.win.request_builder.params("CompressionThreshold_NL2", self.win.cfg)
+            resp = self._send("CompressionThreshold_NL2", ct_params)
         if not resp:
             return False
         try:
@@ -1463,25 +1338,18 @@ class GainRespTab(QtWidgets.QWidget):
             return
     
         def worker():
-            # 禁用所有页签，避免切换导致从磁盘重载覆盖内存修改
-            self._post_ui(lambda: self.win.tabs.setEnabled(False))
+            token = current_token()
     
             # 本按钮不改 selection；直接获取最新 CT
             if not self._fetch_ct_in_memory():
-                def ui_fail():
-                    QtWidgets.QMessageBox.warning(self, "提示", "获取CT失败，已取消后续操作")
-                    self.win.tabs.setEnabled(True)
-                self._post_ui(ui_fail)
+                self._ct_failed(None, token)
                 return
     
             c = self.win.cfg
             cf = c.centerF if any(x != 0 for x in c.centerF) else FREQS_19[:]
-            params = {"channels": c.channels, "centreFreq": cf, "AC": c.AC, "BC": c.BC,
-                      "direction": c.direction, "mic": c.mic, "limiting": c.limiting,
-                      "ACother": c.ACother, "noOfAids": c.noOfAids}
+            params = self.win.request_builder.params("CompressionRatio_NL2", c, centreFreq=cf)
             resp = self._send("CompressionRatio_NL2", params)
             if not resp:
-                self._post_ui(lambda: self.win.tabs.setEnabled(True))
                 return
             outp = resp.get("output_parameters", {})
             arr = self._parse_array(outp, ["CR"])
@@ -1493,12 +1361,9 @@ class GainRespTab(QtWidgets.QWidget):
                     self._fill_row(self.show_rows["CR"], self.win.cfg.CR)
                     # 一次性落盘
                     self.win.save_config(self.win.config_path)
-                    self.win.tabs.setEnabled(True)
                 self._post_ui(apply_ui)
-            else:
-                self._post_ui(lambda: self.win.tabs.setEnabled(True))
     
-        threading.Thread(target=worker, daemon=True).start()
+        self._run_workflow("get_cr", worker)
     
     
     def _on_get_gain(self, mode: str):
@@ -1510,54 +1375,25 @@ class GainRespTab(QtWidgets.QWidget):
         except Exception:
             L_cur = self.win.cfg.L
     
-        def worker():
-            self._post_ui(lambda: self.win.tabs.setEnabled(False))
+        def work(old_sel: int) -> bool:
+            token = current_token()
     
-            old_sel = int(self.win.cfg.selection)
             # 先把 selection 按按钮模式同步
             self._set_selection_for_mode(mode)
     
             # 先获取 CT；失败回滚 selection 并中止
             if not self._fetch_ct_in_memory():
-                def ui_fail():
-                    self.win.cfg.selection = old_sel
-                    QtWidgets.QMessageBox.warning(self, "提示", "获取CT失败，已取消后续操作")
-                    self.win.tabs.setEnabled(True)
-                self._post_ui(ui_fail)
+                self._ct_failed(old_sel, token)
                 return
     
-            c = self.win.cfg
-            if mode == "REIG":
-                fn = "RealEarInsertionGain_NL2"
-                params = {"AC": c.AC, "BC": c.BC, "L": L_cur, "limiting": c.limiting, "channels": c.channels,
-                          "direction": c.direction, "mic": c.mic, "ACother": c.ACother, "noOfAids": c.noOfAids}
-                keys = ["REIG","gain","REIG19"]
-            elif mode == "REAG":
-                fn = "RealEarAidedGain_NL2"
-                params = {"AC": c.AC, "BC": c.BC, "L": L_cur, "limiting": c.limiting, "channels": c.channels,
-                          "direction": c.direction, "mic": c.mic, "ACother": c.ACother, "noOfAids": c.noOfAids}
-                keys = ["REAG","gain","REAG19"]
-            elif mode == "2cc":
-                fn = "TccCouplerGain_NL2"
-                params = {"AC": c.AC, "BC": c.BC, "L": L_cur, "limiting": c.limiting, "channels": c.channels,
-                          "direction": c.direction, "mic": c.mic, "target": c.target, "aidType": c.aidType,
-                          "ACother": c.ACother, "noOfAids": c.noOfAids, "tubing": c.tubing, "vent": c.vent, "RECDmeasType": c.RECDmeasType}
-                keys = ["TccCG", "TccCG19", "gain", "gain19"]
-            else:  # EarSim
-                fn = "EarSimulatorGain_NL2"
-                params = {"AC": c.AC, "BC": c.BC, "L": L_cur, "direction": c.direction, "mic": c.mic,
-                          "limiting": c.limiting, "channels": c.channels, "target": c.target, "aidType": c.aidType,
-                          "ACother": c.ACother, "noOfAids": c.noOfAids, "tubing": c.tubing, "vent": c.vent, "RECDmeasType": c.RECDmeasType}
-                keys = ["ESG", "ESG19", "gain", "gain19"]
-    
+            fn, keys = self.GAIN_FUNCS[mode]
+            params = self.win.request_builder.params(fn, self.win.cfg, L=L_cur)
             resp = self._send(fn, params)
             if not resp:
-                self._post_ui(lambda: self.win.tabs.setEnabled(True))
                 return
             outp = resp.get("output_parameters", {})
             arr = self._parse_array(outp, keys)
             if not arr:
-                self._post_ui(lambda: self.win.tabs.setEnabled(True))
                 return
             arr = arr[:19]
     
@@ -1574,11 +1410,11 @@ class GainRespTab(QtWidgets.QWidget):
                 # 刷新 CT 行并一次性落盘（包含 selection/CT）
                 self._fill_row(self.show_rows["CT"], self.win.cfg.CT)
                 self.win.save_config(self.win.config_path)
-                self.win.tabs.setEnabled(True)
     
             self._post_ui(apply_ui)
+            return True
     
-        threading.Thread(target=worker, daemon=True).start()
+        self._run_workflow(f"get_gain_{mode}", lambda: self._keep_selection_on_success(work))
     
     
     def _on_gain_at(self):
@@ -1592,19 +1428,14 @@ class GainRespTab(QtWidgets.QWidget):
             L_now = float(c0.L)
         tgtType = int(self.targetType_combo.currentData()) if self.targetType_combo.currentData() is not None else int(c0.targetType)
     
-        def worker():
-            self._post_ui(lambda: self.win.tabs.setEnabled(False))
+        def work(old_sel: int) -> bool:
+            token = current_token()
     
-            old_sel = int(self.win.cfg.selection)
             # selection = targetType
             self._sync_selection_with_targetType()
     
             if not self._fetch_ct_in_memory():
-                def ui_fail():
-                    self.win.cfg.selection = old_sel
-                    QtWidgets.QMessageBox.warning(self, "提示", "获取CT失败，已取消后续操作")
-                    self.win.tabs.setEnabled(True)
-                self._post_ui(ui_fail)
+                self._ct_failed(old_sel, token)
                 return
     
             c = self.win.cfg
@@ -1614,14 +1445,9 @@ class GainRespTab(QtWidgets.QWidget):
             nmax = min(18, int(c.channels))  # 0..channels
     
             for i in range(nmax + 1):
-                params = {
-                    "freqRequired": i,
-                    "targetType": tgtType,
-                    "AC": c.AC, "BC": c.BC, "L": int(L_now), "limiting": c.limiting, "channels": c.channels,
-                    "direction": c.direction, "mic": c.mic, "ACother": c.ACother, "noOfAids": c.noOfAids,
-                    "bandWidth": c.bandWidth, "target": c.target, "aidType": c.aidType,
-                    "tubing": c.tubing, "vent": c.vent, "RECDmeasType": c.RECDmeasType
-                }
+                if token.cancelled:
+                    return False
+                params = self.win.request_builder.params("GainAt_NL2", c, freqRequired=i, targetType=tgtType, L=int(L_now))
                 resp = self._send("GainAt_NL2", params)
                 if not resp:
                     continue
@@ -1640,11 +1466,11 @@ class GainRespTab(QtWidgets.QWidget):
                 # 刷新 CT 行并一次性落盘
                 self._fill_row(self.show_rows["CT"], self.win.cfg.CT)
                 self.win.save_config(self.win.config_path)
-                self.win.tabs.setEnabled(True)
     
             self._post_ui(apply_ui)
+            return True
     
-        threading.Thread(target=worker, daemon=True).start()
+        self._run_workflow("gain_at", lambda: self._keep_selection_on_success(work))
     
     
     def _on_gain_at_single(self):
@@ -1661,37 +1487,23 @@ class GainRespTab(QtWidgets.QWidget):
             L_now = float(c0.L)
         tgtType = int(self.targetType_combo.currentData()) if self.targetType_combo.currentData() is not None else int(c0.targetType)
     
-        def worker():
-            self._post_ui(lambda: self.win.tabs.setEnabled(False))
+        def work(old_sel: int) -> bool:
+            token = current_token()
     
-            old_sel = int(self.win.cfg.selection)
             # selection = targetType
             self._sync_selection_with_targetType()
     
             if not self._fetch_ct_in_memory():
-                def ui_fail():
-                    self.win.cfg.selection = old_sel
-                    QtWidgets.QMessageBox.warning(self, "提示", "获取CT失败，已取消后续操作")
-                    self.win.tabs.setEnabled(True)
-                self._post_ui(ui_fail)
+                self._ct_failed(old_sel, token)
                 return
     
             c = self.win.cfg
-            params = {
-                "freqRequired": idx,
-                "targetType": tgtType,
-                "AC": c.AC, "BC": c.BC, "L": int(L_now), "limiting": c.limiting, "channels": c.channels,
-                "direction": c.direction, "mic": c.mic, "ACother": c.ACother, "noOfAids": c.noOfAids,
-                "bandWidth": c.bandWidth, "target": c.target, "aidType": c.aidType,
-                "tubing": c.tubing, "vent": c.vent, "RECDmeasType": c.RECDmeasType
-            }
+            params = self.win.request_builder.params("GainAt_NL2", c, freqRequired=idx, targetType=tgtType, L=int(L_now))
             resp = self._send("GainAt_NL2", params)
             if not resp:
-                self._post_ui(lambda: self.win.tabs.setEnabled(True))
                 return
             val = self._extract_gainat_return(resp)
             if not isinstance(val, (int, float)):
-                self._post_ui(lambda: self.win.tabs.setEnabled(True))
                 return
             val = float(val)
     
@@ -1712,11 +1524,11 @@ class GainRespTab(QtWidgets.QWidget):
                 # 刷新 CT 行并一次性落盘
                 self._fill_row(self.show_rows["CT"], self.win.cfg.CT)
                 self.win.save_config(self.win.config_path)
-                self.win.tabs.setEnabled(True)
     
             self._post_ui(apply_ui)
+            return True
     
-        threading.Thread(target=worker, daemon=True).start()
+        self._run_workflow("gain_at_single", lambda: self._keep_selection_on_success(work))
     
     
     def _on_std_curves(self, mode: str):
@@ -1724,56 +1536,34 @@ class GainRespTab(QtWidgets.QWidget):
             QtWidgets.QMessageBox.warning(self, "提示", "请先连接服务器")
             return
     
-        def worker():
-            self._post_ui(lambda: self.win.tabs.setEnabled(False))
+        def work(old_sel: int) -> bool:
+            token = current_token()
     
-            old_sel = int(self.win.cfg.selection)
             # 按模式名设置 selection
             self._set_selection_for_mode(mode)
     
             # 先拉 CT；失败回滚 selection 并中止
             if not self._fetch_ct_in_memory():
-                def ui_fail():
-                    self.win.cfg.selection = old_sel
-                    QtWidgets.QMessageBox.warning(self, "提示", "获取CT失败，已取消后续操作")
-                    self.win.tabs.setEnabled(True)
-                self._post_ui(ui_fail)
+                self._ct_failed(old_sel, token)
                 return
     
-            c = self.win.cfg
-            if mode == "REIG":
-                fn = "RealEarInsertionGain_NL2"; keys=["REIG","gain","REIG19"]
-                def params(Lv): return {"AC": c.AC, "BC": c.BC, "L": Lv, "limiting": c.limiting, "channels": c.channels,
-                                        "direction": c.direction, "mic": c.mic, "ACother": c.ACother, "noOfAids": c.noOfAids}
-            elif mode == "REAG":
-                fn = "RealEarAidedGain_NL2"; keys=["REAG","gain","REAG19"]
-                def params(Lv): return {"AC": c.AC, "BC": c.BC, "L": Lv, "limiting": c.limiting, "channels": c.channels,
-                                        "direction": c.direction, "mic": c.mic, "ACother": c.ACother, "noOfAids": c.noOfAids}
-            elif mode == "2cc":
-                fn = "TccCouplerGain_NL2"; keys=["TccCG", "TccCG19", "gain", "gain19"]
-                def params(Lv): return {"AC": c.AC, "BC": c.BC, "L": Lv, "limiting": c.limiting, "channels": c.channels,
-                                        "direction": c.direction, "mic": c.mic, "target": c.target, "aidType": c.aidType,
-                                        "ACother": c.ACother, "noOfAids": c.noOfAids, "tubing": c.tubing, "vent": c.vent, "RECDmeasType": c.RECDmeasType}
-            else:
-                fn = "EarSimulatorGain_NL2"; keys=["ESG", "ESG19", "gain", "gain19"]
-                def params(Lv): return {"AC": c.AC, "BC": c.BC, "L": Lv, "direction": c.direction, "mic": c.mic,
-                                        "limiting": c.limiting, "channels": c.channels, "target": c.target, "aidType": c.aidType,
-                                        "ACother": c.ACother, "noOfAids": c.noOfAids, "tubing": c.tubing, "vent": c.vent, "RECDmeasType": c.RECDmeasType}
-    
+            fn, keys = self.GAIN_FUNCS[mode]
             results = {}
             for Lv, tag in [(50,"50"),(65,"65"),(80,"80")]:
-                resp = self._send(fn, params(Lv))
+                if token.cancelled:
+                    return False
+                resp = self._send(fn, self.win.request_builder.params(fn, self.win.cfg, L=Lv))
                 if not resp:
-                    self._post_ui(lambda: self.win.tabs.setEnabled(True))
                     return
                 outp = resp.get("output_parameters", {})
                 arr = self._parse_array(outp, keys)
                 if not arr:
-                    self._post_ui(lambda: self.win.tabs.setEnabled(True))
                     return
                 results[tag] = arr[:19]
     
             def apply_ui():
+                self._last_std_mode = mode
+                self._set_stale("")
                 # 增益三条
                 self._fill_row(self.gain_rows["50dB Gain"], results["50"])
                 self._fill_row(self.gain_rows["65dB Gain"], results["65"])
@@ -1803,11 +1593,26 @@ class GainRespTab(QtWidgets.QWidget):
                 # 刷新 CT 行并一次性落盘（包含 selection/CT）
                 self._fill_row(self.show_rows["CT"], self.win.cfg.CT)
                 self.win.save_config(self.win.config_path)
-                self.win.tabs.setEnabled(True)
     
             self._post_ui(apply_ui)
+            return True
     
-        threading.Thread(target=worker, daemon=True).start()
+        self._run_workflow(f"std_curves_{mode}", lambda: self._keep_selection_on_success(work))
+
+    # ---------- 冷启动快照 ----------
+    def _set_stale(self, text: str):
+        self.chart_gain.setStale(text); self.chart_resp.setStale(text)
+
+    def snapshot(self) -> Optional[Dict[str, Any]]:
+        # 曲线数值已在 config 里，这里只记模式，供下次启动后台重新拉取
+        if all(v is None for vals in self.chart_gain.series.values() for v in vals):
+            return None
+        return {"std_mode": self._last_std_mode}
+
+    def validate_snapshot(self):
+        # 只知道标准曲线的模式时才能自动复核；LdB/GainAt 的结果保持待验证标记，直到用户重新获取
+        if self.chart_gain.stale_text and self._last_std_mode in self.GAIN_FUNCS:
+            self._on_std_curves(self._last_std_mode)
 
     def _apply_left_params_from_cfg(self):
         #将左侧所有参数控件与最新 config 同步（阻断信号，避免误触发保存）
@@ -1897,14 +1702,18 @@ class GainRespTab(QtWidgets.QWidget):
 
 class HomePageTab(QtWidgets.QWidget):
     """主页 Tab：原 MainWindow._build_main_tab 及其相关事件/方法迁移到此"""
+    connectDone = QtCore.Signal(bool, object)  # 手动连接的结果：(是否成功, (ip, port, path))
+
     def __init__(self, mainwin: "MainWindow"):
         super().__init__()
         self.win = mainwin
+        self._pending_server: Optional[tuple] = None  # 手动连接进行中：(ip, port, path)，成功后写回配置
         self._build_ui()
+        self.connectDone.connect(self._on_connect_done, QtCore.Qt.ConnectionType.QueuedConnection)
         # 连接 MainWindow 发出的通用信号到本页槽
         self.win.logReady.connect(self._on_log_ready)
         self.win.seqUpdated.connect(self._on_seq_updated)
-        self.win.rrrViewUpdate.connect(self.update_rrr_entries_from_cfg)
+        self.win.cfgFieldsChanged.connect(self._on_cfg_fields_changed)
         # 初次载入
         self.load_server_from_config()
         self.update_rrr_entries_from_cfg()
@@ -2383,18 +2192,54 @@ class HomePageTab(QtWidgets.QWidget):
         except ValueError:
             QtWidgets.QMessageBox.critical(self, "错误(Error)", "端口号不正确(Wrong port number)")
             return
-        self.win.client.set_server(ip, port, path)
-        ok = self.win.client.connect()
+        # connect() 含端口探测和握手请求，放到主页 lane 后台执行；结果经本页自己的 connectDone 回到主线程，
+        # 不与启动时的自动重连（reconnectDone）混用；还没跑完的自动重连作废，以手动连接为准
+        pending = self._pending_server = (ip, port, path)
+        self.btn_connect.setEnabled(False)
+        self.status_label.setText("连接中(Connecting)...")
+        self.win.cancel_reconnect()
+        client, done = self.win.client, self.connectDone
+        result = []
+
+        def work():
+            client.set_server(ip, port, path)
+            result.append(client.connect())
+
+        def finished(job: Job):
+            done.emit(bool(result and result[0]) and job.state == Job.DONE, pending)  # 出错或被取消按连接失败处理
+
+        self.win.jobs.submit("home", "connect", work, on_done=finished)
+
+    @property
+    def connecting(self) -> bool:
+        return self._pending_server is not None
+
+    @QtCore.Slot(bool, object)
+    def _on_connect_done(self, ok: bool, pending: tuple):
+        if pending is not self._pending_server:
+            return
+        self._pending_server = None
+        self.set_connected_ui(ok)
         if ok:
-            self.status_label.setText(f"已连接(Connected): {self.win.client.url()}")
-            self.btn_connect.setEnabled(False); self.btn_disconnect.setEnabled(True)
+            # 连接成功后才把地址写回配置
+            ip, port, path = pending
             self.win.cfg.server_ip = ip; self.win.cfg.server_port = port; self.win.cfg.server_path = path if path else "/"
             self.win.save_config(self.win.config_path)
+            self.win.on_connected()
+
+    def set_connected_ui(self, ok: bool):
+        if ok:
+            profile = self.win.client.profile
+            caps = f"  [{profile.describe()}]" if profile is not None else ""
+            self.status_label.setText(f"已连接(Connected): {self.win.client.url()}{caps}")
+            self.btn_connect.setEnabled(False); self.btn_disconnect.setEnabled(True)
         else:
             self.status_label.setText("无法连接（请检查 IP/端口/网络）")
+            self.btn_connect.setEnabled(True)
 
     def on_disconnect(self):
         self.win.client.disconnect()
+        self.win.refresh_health_status()
         self.status_label.setText("未连接(Disconnected)")
         self.btn_connect.setEnabled(True); self.btn_disconnect.setEnabled(False)
 
@@ -2513,7 +2358,10 @@ class HomePageTab(QtWidgets.QWidget):
         CommonFunc.set_combo_safely(self.REDD_defValues_combo, new_val)
         CommonFunc.set_combo_safely(self.REUR_defValues_combo, new_val)
 
-    def _send(self, function, params):
+    def _send(self, function, params=None, **overrides):
+        # params 省略时按模板从 config 取值
+        if params is None:
+            params = self.win.request_builder.params(function, self.win.cfg, **overrides)
         req = {"function": function, "input_parameters": params}
         resp = self.win.client.post_json(req)
         self.win.handle_response_update_config(resp)
@@ -2526,48 +2374,32 @@ class HomePageTab(QtWidgets.QWidget):
         if not self.win.client.connected:
             QtWidgets.QMessageBox.warning(self, "提示", "请先连接服务器")
             return
-        c = self.win.cfg
 
         def worker():
             try:
-                self._send("GetRECDh_indiv_NL2", {
-                    "RECDmeasType": c.RECDmeasType, "dateOfBirth": c.dateOfBirth, "aidType": c.aidType,
-                    "tubing": c.tubing, "vent": c.vent, "coupler": c.coupler, "fittingDepth": c.fittingDepth
-                })
-                self._send("GetRECDt_indiv_NL2", {
-                    "RECDmeasType": c.RECDmeasType, "dateOfBirth": c.dateOfBirth, "aidType": c.aidType,
-                    "tubing": c.tubing, "vent": c.vent, "earpiece": c.earpiece, "coupler": c.coupler, "fittingDepth": c.fittingDepth
-                })
-                self._send("GetREDDindiv", {"REDD_defValues": c.REDD_defValues})
-                self._send("GetREURindiv", {"REUR_defValues": c.REUR_defValues, "dateOfBirth": c.dateOfBirth,
-                                      "direction": c.direction, "mic": c.mic})
+                self._send("GetRECDh_indiv_NL2")
+                self._send("GetRECDt_indiv_NL2")
+                self._send("GetREDDindiv")
+                self._send("GetREURindiv")
             except Exception as e:
                 self.win.errorReady.emit(f"获取RECD/REDD/REUR失败: {e}")
-        threading.Thread(target=worker, daemon=True).start()
+        self.win.jobs.submit("home", "fetch_rrr_19", worker)
 
 
     def on_fetch_rrr_9(self):
         if not self.win.client.connected:
             QtWidgets.QMessageBox.warning(self, "提示", "请先连接服务器")
             return
-        c = self.win.cfg
 
         def worker():
             try:
-                self._send("GetRECDh_indiv9_NL2", {
-                    "RECDmeasType": c.RECDmeasType, "dateOfBirth": c.dateOfBirth, "aidType": c.aidType,
-                    "tubing": c.tubing, "vent": c.vent, "coupler": c.coupler, "fittingDepth": c.fittingDepth
-                })
-                self._send("GetRECDt_indiv9_NL2", {
-                    "RECDmeasType": c.RECDmeasType, "dateOfBirth": c.dateOfBirth, "aidType": c.aidType,
-                    "tubing": c.tubing, "vent": c.vent, "earpiece": c.earpiece, "coupler": c.coupler, "fittingDepth": c.fittingDepth
-                })
-                self._send("GetREDDindiv9", {"REDD_defValues": c.REDD_defValues})
-                self._send("GetREURindiv9", {"REUR_defValues": c.REUR_defValues, "dateOfBirth": c.dateOfBirth,
-                                       "direction": c.direction, "mic": c.mic})
+                self._send("GetRECDh_indiv9_NL2")
+                self._send("GetRECDt_indiv9_NL2")
+                self._send("GetREDDindiv9")
+                self._send("GetREURindiv9")
             except Exception as e:
                 self.win.errorReady.emit(f"获取RECD9/REDD9/REUR9失败: {e}")
-        threading.Thread(target=worker, daemon=True).start()
+        self.win.jobs.submit("home", "fetch_rrr_9", worker)
 
     # ---------- RRR/参考数据/Step1-8（原 MainWindow 上的方法迁移） ----------
     def _log_send_resp(self, req: Dict[str, Any], resp: Dict[str, Any]):
@@ -2585,11 +2417,11 @@ class HomePageTab(QtWidgets.QWidget):
 
         def worker():
             try:
-                self._send("SetRECDh_indiv_NL2", {"RECDh": c.RECDh})
-                self._send("SetRECDt_indiv_NL2", {"RECDt": c.RECDt})
+                self._send("SetRECDh_indiv_NL2")
+                self._send("SetRECDt_indiv_NL2")
             except Exception as e:
                 self.win.errorReady.emit(f"设置RECD失败: {e}")
-        threading.Thread(target=worker, daemon=True).start()
+        self.win.jobs.submit("home", "set_recd_19", worker)
 
     def on_set_redd_19(self):
         if not self.win.client.connected:
@@ -2600,10 +2432,10 @@ class HomePageTab(QtWidgets.QWidget):
 
         def worker():
             try:
-                self._send("SetREDDindiv", {"REDD": c.REDD, "REDD_defValues": c.REDD_defValues})
+                self._send("SetREDDindiv")
             except Exception as e:
                 self.win.errorReady.emit(f"设置REDD失败: {e}")
-        threading.Thread(target=worker, daemon=True).start()
+        self.win.jobs.submit("home", "set_redd_19", worker)
 
     def on_set_reur_19(self):
         if not self.win.client.connected:
@@ -2614,13 +2446,10 @@ class HomePageTab(QtWidgets.QWidget):
 
         def worker():
             try:
-                self._send("SetREURindiv", {
-                    "REUR": c.REUR, "REUR_defValues": c.REUR_defValues,
-                    "dateOfBirth": c.dateOfBirth, "direction": c.direction, "mic": c.mic
-                })
+                self._send("SetREURindiv")
             except Exception as e:
                 self.win.errorReady.emit(f"设置REUR失败: {e}")
-        threading.Thread(target=worker, daemon=True).start()
+        self.win.jobs.submit("home", "set_reur_19", worker)
 
     def on_set_recd_9(self):
         if not self.win.client.connected:
@@ -2630,11 +2459,11 @@ class HomePageTab(QtWidgets.QWidget):
             QtWidgets.QMessageBox.warning(self, "提示", "配置文件中 RECDh9/RECDt9(9点) 不完整，无法设置"); return
         def worker():
             try:
-                self._send("SetRECDh_indiv9_NL2", {"RECDh9": c.RECDh9})
-                self._send("SetRECDt_indiv9_NL2", {"RECDt9": c.RECDt9})
+                self._send("SetRECDh_indiv9_NL2")
+                self._send("SetRECDt_indiv9_NL2")
             except Exception as e:
                 self.win.errorReady.emit(f"设置RECD9失败: {e}")
-        threading.Thread(target=worker, daemon=True).start()
+        self.win.jobs.submit("home", "set_recd_9", worker)
 
     def on_set_redd_9(self):
         if not self.win.client.connected:
@@ -2644,10 +2473,10 @@ class HomePageTab(QtWidgets.QWidget):
             QtWidgets.QMessageBox.warning(self, "提示", "配置文件中 REDD9(9点) 不完整，无法设置"); return
         def worker():
             try:
-                self._send("SetREDDindiv9", {"REDD9": c.REDD9, "REDD_defValues": c.REDD_defValues})
+                self._send("SetREDDindiv9")
             except Exception as e:
                 self.win.errorReady.emit(f"设置REDD9失败: {e}")
-        threading.Thread(target=worker, daemon=True).start()
+        self.win.jobs.submit("home", "set_redd_9", worker)
 
     def on_set_reur_9(self):
         if not self.win.client.connected:
@@ -2657,13 +2486,10 @@ class HomePageTab(QtWidgets.QWidget):
             QtWidgets.QMessageBox.warning(self, "提示", "配置文件中 REUR9(9点) 不完整，无法设置"); return
         def worker():
             try:
-                self._send("SetREURindiv9", {
-                    "REUR9": c.REUR9, "REUR_defValues": c.REUR_defValues,
-                    "dateOfBirth": c.dateOfBirth, "direction": c.direction, "mic": c.mic
-                })
+                self._send("SetREURindiv9")
             except Exception as e:
                 self.win.errorReady.emit(f"设置REUR9失败: {e}")
-        threading.Thread(target=worker, daemon=True).start()
+        self.win.jobs.submit("home", "set_reur_9", worker)
 
     def on_clear_rrr_data(self):
         self.win.cfg.RECDh  = [0.0]*19
@@ -2727,9 +2553,8 @@ class HomePageTab(QtWidgets.QWidget):
         if not self.win.client.connected:
             QtWidgets.QMessageBox.warning(self, "提示", "请先连接服务器")
             return
-        c = self.win.cfg
-        def send(function, params):
-            req = {"function": function, "input_parameters": params}
+        def send(function):
+            req = self.win.request_builder.request(function, self.win.cfg)
             prev = dict(req); prev["sequence_num"] = self.win.client.sequence_num
             self.win.logReady.emit("发送(Send):\n" + json.dumps(prev, ensure_ascii=False, indent=2))
             resp = self.win.client.post_json(req)
@@ -2738,29 +2563,29 @@ class HomePageTab(QtWidgets.QWidget):
             return resp
         def worker():
             try:
-                resp = send("GetMLE", {"aidType": c.aidType, "direction": c.direction, "mic": c.mic})
+                resp = send("GetMLE")
                 outp = (resp or {}).get("output_parameters", {}) or {}
                 if "MLE" in outp and isinstance(outp["MLE"], list): self.win.cfg.MLE = outp["MLE"]
 
-                resp = send("ReturnValues_NL2", {})
+                resp = send("ReturnValues_NL2")
                 outp = (resp or {}).get("output_parameters", {}) or {}
                 if "MAF" in outp and isinstance(outp["MAF"], list): self.win.cfg.MAF = outp["MAF"]
                 if "BWC" in outp and isinstance(outp["BWC"], list): self.win.cfg.BWC = outp["BWC"]
                 if "ESCD" in outp and isinstance(outp["ESCD"], list): self.win.cfg.ESCD = outp["ESCD"]
 
-                resp = send("GetTubing_NL2", {"tubing": c.tubing})
+                resp = send("GetTubing_NL2")
                 outp = (resp or {}).get("output_parameters", {}) or {}
                 if "Tubing" in outp and isinstance(outp["Tubing"], list): self.win.cfg.Tubing = outp["Tubing"]
 
-                resp = send("GetVentOut_NL2", {"vent": c.vent})
+                resp = send("GetVentOut_NL2")
                 outp = (resp or {}).get("output_parameters", {}) or {}
                 if "Ventout" in outp and isinstance(outp["Ventout"], list): self.win.cfg.Ventout = outp["Ventout"]
 
-                resp = send("GetTubing9_NL2", {"tubing": c.tubing})
+                resp = send("GetTubing9_NL2")
                 outp = (resp or {}).get("output_parameters", {}) or {}
                 if "Tubing9" in outp and isinstance(outp["Tubing9"], list): self.win.cfg.Tubing9 = outp["Tubing9"]
 
-                resp = send("GetVentOut9_NL2", {"vent": c.vent})
+                resp = send("GetVentOut9_NL2")
                 outp = (resp or {}).get("output_parameters", {}) or {}
                 if "Ventout9" in outp and isinstance(outp["Ventout9"], list): self.win.cfg.Ventout9 = outp["Ventout9"]
 
@@ -2768,7 +2593,7 @@ class HomePageTab(QtWidgets.QWidget):
                 self.win.save_config(self.win.config_path)
             except Exception as e:
                 self.win.errorReady.emit(f"获取参考数据与修正失败: {e}")
-        threading.Thread(target=worker, daemon=True).start()
+        self.win.jobs.submit("home", "fetch_ref_data", worker)
 
     def on_apply_steps(self):
         if not self.win.client.connected:
@@ -2776,13 +2601,17 @@ class HomePageTab(QtWidgets.QWidget):
             return
         self.autosave_config()
         self.apply_log.clear()
-        threading.Thread(target=self._apply_steps_thread, daemon=True).start()
+        self.win.jobs.submit("home", "apply_steps", self._apply_steps_thread)
 
     def _apply_steps_thread(self):
+        with self.win.client.session():
+            self._apply_steps()
+
+    def _apply_steps(self):
         def log(msg: str):
             self.win.logReady.emit(msg)
-        def send(function: str, params: Dict[str, Any]):
-            req = {"function": function, "input_parameters": params}
+        def send(function: str, **overrides):
+            req = self.win.request_builder.request(function, self.win.cfg, **overrides)
             prev = dict(req); prev["sequence_num"] = self.win.client.sequence_num
             log("发送(Send):\n" + json.dumps(prev, ensure_ascii=False, indent=2))
             resp = self.win.client.post_json(req)
@@ -2793,22 +2622,20 @@ class HomePageTab(QtWidgets.QWidget):
         try:
             c = self.win.cfg
             # 1-5 基本设置
-            send("SetAdultChild", {"adultChild": c.adultChild, "dateOfBirth": c.dateOfBirth})
-            send("SetExperience", {"experience": c.experience})
-            send("SetCompSpeed", {"compSpeed": c.compSpeed})
-            send("SetTonalLanguage", {"tonal": c.tonal})
-            send("SetGender", {"gender": c.gender})
+            send("SetAdultChild")
+            send("SetExperience")
+            send("SetCompSpeed")
+            send("SetTonalLanguage")
+            send("SetGender")
             # 6 - 分频
-            send("CrossOverFrequencies_NL2", {"channels": c.channels, "AC": c.AC, "BC": c.AC})# Step1~9 文档里说明BC NOT USED，使用AC替代
+            send("CrossOverFrequencies_NL2", BC=c.AC)# Step1~9 文档里说明BC NOT USED，使用AC替代
             # 7 - setBWC
             crossOver = self.win.cfg.CFArray if self.win.cfg.CFArray else []
-            send("setBWC", {"channels": c.channels, "crossOver": crossOver})
+            send("setBWC", crossOver=crossOver)
             # 8 - CT
-            send("CompressionThreshold_NL2", {
-                "bandWidth": c.bandWidth, "selection": c.selection, "WBCT": c.WBCT,
-                "aidType": c.aidType, "direction": c.direction, "mic": c.mic, "calcCh": c.calcCh})
+            send("CompressionThreshold_NL2")
             # 20 - CenterFrequencies
-            send("CenterFrequencies", {"CFArray": crossOver, "channels": c.channels})
+            send("CenterFrequencies", CFArray=crossOver)
             log("步骤(1-8)完成")
         except Exception as e:
             log(f"执行异常: {e}")
@@ -2837,6 +2664,23 @@ class HomePageTab(QtWidgets.QWidget):
         fill(self.REUR_edits9, self.win.cfg.REUR9 or [], 9)
         self.win.save_config(self.win.config_path)
 
+    def _on_cfg_fields_changed(self, fields):
+        # 响应只更新了部分字段：仅刷新对应的行（config 已由 MainWindow 落盘，这里不再重复保存）
+        rows = {
+            "RECDh": (self.RECDh_edits19, 19), "RECDt": (self.RECDt_edits19, 19),
+            "REDD": (self.REDD_edits19, 19), "REUR": (self.REUR_edits19, 19),
+            "RECDh9": (self.RECDh_edits9, 9), "RECDt9": (self.RECDt_edits9, 9),
+            "REDD9": (self.REDD_edits9, 9), "REUR9": (self.REUR_edits9, 9),
+            "MLE": (self.MLE_edits19, 19), "MAF": (self.MAF_edits19, 19),
+            "BWC": (self.BWC_edits19, 19), "ESCD": (self.ESCD_edits19, 19),
+            "Tubing": (self.Tubing_edits19, 19), "Ventout": (self.Ventout_edits19, 19),
+            "Tubing9": (self.Tubing9_edits9, 9), "Ventout9": (self.Ventout9_edits9, 9),
+        }
+        for name in fields:
+            if name in rows:
+                edits, n = rows[name]
+                CommonFunc.fill_edits(edits, getattr(self.win.cfg, name) or [], n)
+
     # ---------- Config 文件 ----------
     def on_load_config(self):
         path, _ = QtWidgets.QFileDialog.getOpenFileName(self, "选择配置文件", "", "JSON (*.json);;All (*.*)")
@@ -2916,11 +2760,14 @@ class FunctionTestTab(QtWidgets.QWidget):
         self.win = mainwin
         self.templates: List[Dict[str, Any]] = []
         self._build_ui()
-        # 连接 MainWindow 的通用信号到本页槽
-        self.win.respReady.connect(self._on_resp_ready)
-        self.win.errorReady.connect(self._on_error_ready)
+        # 连接 MainWindow 的通用信号到本页槽（respReady / reqPreviewReady / errorReady 由主窗口接收后转给本页，见 MainWindow._on_resp_ready）
         self.win.seqUpdated.connect(self._on_seq_updated)
-        self.win.reqPreviewReady.connect(self._on_req_preview_ready)
+        self.win.cfgFieldsChanged.connect(self._on_cfg_fields_changed)
+        # 本页构建前收到的最近一次请求预览 / 响应
+        if self.win.last_req_preview:
+            self.req_text.setPlainText(self.win.last_req_preview)
+        if self.win.last_resp:
+            self.resp_text.setPlainText(self.win.last_resp)
         # 初次加载模板与只读输出
         self.load_templates()
         self.refresh_outputs_view()
@@ -3093,16 +2940,7 @@ class FunctionTestTab(QtWidgets.QWidget):
         self.req_text.setPlainText(json.dumps(req, ensure_ascii=False, indent=2))
 
     def build_input_from_config(self, params: List[str]) -> Dict[str, Any]:
-        cfgd = asdict(self.win.cfg)
-        out: Dict[str, Any] = {}
-        for p in params:
-            if p == "crossOver":
-                out[p] = cfgd.get("CFArray", [])
-            elif p == "centreFreq":
-                out[p] = cfgd.get("centerF", [])
-            else:
-                out[p] = cfgd.get(p)
-        return out
+        return self.win.request_builder.from_fields(params, self.win.cfg)
 
     # ---------- send ----------
     def on_send(self):
@@ -3118,13 +2956,19 @@ class FunctionTestTab(QtWidgets.QWidget):
         if "function" not in req or "input_parameters" not in req:
             QtWidgets.QMessageBox.critical(self, "错误", "JSON 必须包含 function 和 input_parameters 字段")
             return
-        threading.Thread(target=self._send_thread, args=(req,), daemon=True).start()
+        if self.win.client.validator is not None:
+            try:
+                self.win.client.validator.check(req)
+            except RequestValidationError as e:
+                QtWidgets.QMessageBox.warning(self, "参数错误", str(e))
+                return
+        self.win.jobs.submit("func", f"send {req['function']}", lambda: self._send_thread(req), dedupe=False)
 
     def _send_thread(self, req: Dict[str, Any]):
         try:
             preview = dict(req); preview["sequence_num"] = self.win.client.sequence_num
             self.win.reqPreviewReady.emit(json.dumps(preview, ensure_ascii=False, indent=2))
-            resp = self.win.client.post_json(req)
+            resp = self.win.client.post_json(req, skip_redundant=False)
             self.win.handle_response_update_config(resp)
             self.win.respReady.emit(json.dumps(resp, ensure_ascii=False, indent=2))
         except RequestException as e:
@@ -3134,23 +2978,11 @@ class FunctionTestTab(QtWidgets.QWidget):
         finally:
             self.win.seqUpdated.emit(self.win.client.sequence_num)
 
-    @QtCore.Slot(str)
-    def _on_resp_ready(self, payload: str):
-        self.resp_text.setPlainText(payload)
-
-    @QtCore.Slot(str)
-    def _on_error_ready(self, msg: str):
-        QtWidgets.QMessageBox.critical(self, "错误", msg)
-
     @QtCore.Slot(int)
     def _on_seq_updated(self, seq: int):
         # 函数测试页不显示 seq；若需要可加 UI
         pass
 
-    @QtCore.Slot(str)
-    def _on_req_preview_ready(self, s: str):
-        self.req_text.setPlainText(s)
-
     # ---------- outputs view ----------
     def refresh_outputs_view(self):
         def set_ro_text(widget: QtWidgets.QPlainTextEdit, data):
@@ -3160,6 +2992,10 @@ class FunctionTestTab(QtWidgets.QWidget):
         set_ro_text(self.txt_CT, self.win.cfg.CT)
         set_ro_text(self.txt_CR, self.win.cfg.CR)
 
+    def _on_cfg_fields_changed(self, fields):
+        if fields & {"CFArray", "FreqInCh", "CT", "CR"}:
+            self.refresh_outputs_view()
+
     # ---------- 保存与参数变更 ----------
     def save_home_params_to_cfg(self):
         try:
@@ -3208,6 +3044,92 @@ class FunctionTestTab(QtWidgets.QWidget):
         CommonFunc.set_combo_safely(self.s_combo, c.s)
         self.refresh_outputs_view()
 
+class DiagnosticsTab(QtWidgets.QWidget):
+    """诊断页：各 NAL 函数的调用耗时分位数/吞吐/错误率，以及请求参数缓存命中率（页面可见时每秒刷新）"""
+    COLS = ["函数(Function)", "调用(Calls)", "错误率(Err%)", "重试(Retries)", "跳过(Skipped)", "吞吐(/s)",
+            "p50 ms", "p95 ms", "p99 ms", "server p50", "net p50", "parse p50", "请求B(avg)", "响应B(avg)", "压缩节省(Saved%)"]
+
+    def __init__(self, mainwin):
+        super().__init__()
+        self.win = mainwin
+        self._prev_calls: Dict[str, int] = {}
+        self._prev_t = time.monotonic()
+
+        v = QtWidgets.QVBoxLayout(self)
+        self.summary = QtWidgets.QLabel("")
+        v.addWidget(self.summary)
+        self.table = QtWidgets.QTableWidget(0, len(self.COLS))
+        self.table.setHorizontalHeaderLabels(self.COLS)
+        self.table.verticalHeader().setVisible(False)
+        self.table.setEditTriggers(QtWidgets.QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.table.horizontalHeader().setSectionResizeMode(QtWidgets.QHeaderView.ResizeMode.ResizeToContents)
+        v.addWidget(self.table, 1)
+
+        self.timer = QtCore.QTimer(self)
+        self.timer.setInterval(1000)
+        self.timer.timeout.connect(self.refresh)
+
+    def showEvent(self, e):
+        self.refresh()
+        self.timer.start()
+        super().showEvent(e)
+
+    def hideEvent(self, e):
+        self.timer.stop()
+        super().hideEvent(e)
+
+    @staticmethod
+    def _ms(us: Optional[int]) -> str:
+        return "" if us is None else f"{us / 1000:.1f}"
+
+    def refresh(self):
+        metrics = self.win.client.metrics
+        now = time.monotonic()
+        dt = max(1e-3, now - self._prev_t)
+        self._prev_t = now
+
+        rows = sorted(metrics.functions.items())
+        self.table.setRowCount(len(rows))
+        sum_calls = sum_errs = sum_skipped = 0
+        sum_raw = sum_wire = 0
+        sum_rate = 0.0
+        for r, (name, fm) in enumerate(rows):
+            calls, errs = fm.calls, fm.errors
+            rate = (calls - self._prev_calls.get(name, calls)) / dt
+            self._prev_calls[name] = calls
+            sum_calls += calls; sum_errs += errs; sum_rate += rate; sum_skipped += fm.skipped
+            sum_raw += fm.req_bytes.total + fm.resp_bytes.total
+            sum_wire += fm.req_wire.total + fm.resp_wire.total
+            saving = fm.wire_saving()
+            n = calls + errs
+            vals = [
+                name, str(calls), f"{100.0 * errs / n:.1f}" if n else "", str(fm.retries), str(fm.skipped), f"{rate:.1f}",
+                self._ms(fm.total.quantile(0.50)), self._ms(fm.total.quantile(0.95)), self._ms(fm.total.quantile(0.99)),
+                self._ms(fm.server.quantile(0.50)), self._ms(fm.net.quantile(0.50)), self._ms(fm.parse.quantile(0.50)),
+                str(fm.req_bytes.total // fm.req_bytes.count) if fm.req_bytes.count else "",
+                str(fm.resp_bytes.total // fm.resp_bytes.count) if fm.resp_bytes.count else "",
+                "" if saving is None else f"{100.0 * saving:.0f}",
+            ]
+            for c, text in enumerate(vals):
+                item = self.table.item(r, c)
+                if item is None:
+                    item = QtWidgets.QTableWidgetItem()
+                    self.table.setItem(r, c, item)
+                item.setText(text)
+
+        rb = self.win.request_builder
+        lookups = rb.cache_hits + rb.cache_misses
+        hit = f"{100.0 * rb.cache_hits / lookups:.1f}%" if lookups else "-"
+        n = sum_calls + sum_errs
+        err = f"{100.0 * sum_errs / n:.1f}%" if n else "-"
+        wd = self.win.watchdog
+        saved = f"{(sum_raw - sum_wire) / 1024:.1f} KB" if sum_wire else "-"
+        self.summary.setText(
+            f"总调用(Calls): {sum_calls}    吞吐(Throughput): {sum_rate:.1f}/s    错误率(Errors): {err}    "
+            f"参数缓存命中率(Param cache hit): {hit}    跳过的 Set*(Skipped): {sum_skipped}    压缩节省(Saved): {saved}    "
+            f"熔断器(Breaker): {self.win.client.breaker.state}    "
+            f"UI 卡顿(Stalls): {wd.stalls}" + (f"（最长 {wd.max_stall * 1000:.0f} ms）" if wd.stalls else ""))
+
 class MainWindow(QtWidgets.QMainWindow):
     respReady = QtCore.Signal(str)
     errorReady = QtCore.Signal(str)
@@ -3215,7 +3137,20 @@ class MainWindow(QtWidgets.QMainWindow):
     seqUpdated = QtCore.Signal(int)
     reqPreviewReady = QtCore.Signal(str)
     outputsChanged = QtCore.Signal()
-    rrrViewUpdate = QtCore.Signal()
+    cfgFieldsChanged = QtCore.Signal(object)  # frozenset：本次响应更新的 AppConfig 字段名
+    jobsChanged = QtCore.Signal()
+    healthChanged = QtCore.Signal(bool, object)  # (探测是否成功, 耗时秒 或 None)
+    breakerChanged = QtCore.Signal(str)
+    reconnectDone = QtCore.Signal(bool)  # 按快照后台自动重连的结果
+
+    # 页签：(属性名, 类, 标题)；按需构建
+    TAB_SPECS = (
+        ("home_tab", HomePageTab, "  主页  "),
+        ("func_tab", FunctionTestTab, "  函数测试  "),
+        ("gr_tab", GainRespTab, "  增益/响应曲线  "),
+        ("io_tab", IO_tab, "  输入/输出曲线  "),
+        ("diag_tab", DiagnosticsTab, "  诊断  "),
+    )
 
     # 统一控件宽度（用于列对齐）（供 HomePageTab / FunctionTestTab 读取）
     LABEL_W = 130
@@ -3235,16 +3170,46 @@ class MainWindow(QtWidgets.QMainWindow):
             self.setWindowIcon(QtGui.QIcon(icon_path))
 
         ensure_templates_file(DEFAULT_TEMPLATES_FILE)
+        templates = load_templates_list(DEFAULT_TEMPLATES_FILE)
+        self.response_map = compile_response_map(templates)
+        self.request_builder = RequestBuilder(templates)
 
         self.client = NALClient()
+        self.client.validator = RequestValidator(templates, DEFAULT_API_DOC_FILE)
+        self.client.breaker.on_change = self.breakerChanged.emit
+        self.health = HealthMonitor(self.client, on_result=self.healthChanged.emit)
         self.config_path = DEFAULT_CONFIG_FILE
+        self.save_hist = Histogram()    # save_config 耗时（首次运行 load_config 就会写一次默认配置）
         self.cfg = self.load_config(DEFAULT_CONFIG_FILE)
 
+        # 所有页签的后台请求都经由这里排队执行；状态变化在主线程刷新到状态栏
+        self.jobs = JobExecutor(MAX_JOB_WORKERS, on_change=self.jobsChanged.emit)
+        self._cfg_pins = 0  # >0 时有流程持有未落盘的内存修改，切页不从磁盘重载 config
+        self.ui_lag_hist = Histogram()  # 事件循环延迟（心跳定时器实际间隔 - 期望间隔）
+
+        # 冷启动快照：页签构建时直接画上次会话的结果（标为待验证），连接恢复后后台复核
+        self.snapshot_path = SNAPSHOT_FILE
+        self.snapshot = load_snapshot(self.snapshot_path)
+        self.snapshot_label = self._snapshot_text("待验证(unverified)")
+        self._snapshot_key: Optional[str] = None  # 上次写盘内容，没变化就不写
+
         self._build_ui()
 
-        # 强制“点击后才聚焦 + 未聚焦时滚轮滚动父滚动区”（供 GainRespTab 调用）
+        # 强制“点击后才聚焦 + 未聚焦时滚轮滚动父滚动区”（页签懒构建时各自补设焦点策略）
         self._apply_strict_focus_behavior()
 
+        # 回到上次停留的页签（只构建这一页），上次是连接状态则后台重连
+        tab = (self.snapshot or {}).get("tab")
+        if isinstance(tab, int) and 0 < tab < self.tabs.count():
+            self.tabs.setCurrentIndex(tab)
+        self._reconnect_job: Optional[Job] = None
+        self.reconnectDone.connect(self._on_reconnect_done, QtCore.Qt.ConnectionType.QueuedConnection)
+        self._restore_connection()
+        self._snap_timer = QtCore.QTimer(self)
+        self._snap_timer.setInterval(int(SNAPSHOT_INTERVAL_S * 1000))
+        self._snap_timer.timeout.connect(self.save_snapshot_now)
+        self._snap_timer.start()
+
         # 当输出更新时，刷新“函数测试”页右侧只读显示
         self.outputsChanged.connect(lambda: getattr(self.func_tab, "refresh_outputs_view", lambda: None)())
 
@@ -3257,166 +3222,288 @@ class MainWindow(QtWidgets.QMainWindow):
         self.tabs = QtWidgets.QTabWidget()
         vmain.addWidget(self.tabs)
 
-        # 主页 -> 独立类
-        self.home_tab = HomePageTab(self)
-        self.tabs.addTab(self.home_tab, "  主页  ")
+        # 函数测试页懒构建，它显示的三个信号由主窗口接收：错误直接弹框（各页后台任务都会发），
+        # 请求预览/响应只保留最新一份，页签构建时补上
+        self.last_resp = ""
+        self.last_req_preview = ""
+        self.errorReady.connect(self._on_error_ready, QtCore.Qt.ConnectionType.QueuedConnection)
+        self.respReady.connect(self._on_resp_ready, QtCore.Qt.ConnectionType.QueuedConnection)
+        self.reqPreviewReady.connect(self._on_req_preview_ready, QtCore.Qt.ConnectionType.QueuedConnection)
+
+        # 页签懒构建：先放占位页，切换到该页时才创建；未创建前对应属性为 None
+        self.tab_build_ms: Dict[str, float] = {}
+        for attr, cls, title in self.TAB_SPECS:
+            setattr(self, attr, None)
+            self.tabs.addTab(_LazyPage(lambda attr=attr, cls=cls: self._create_tab(attr, cls)), title)
+        self._ensure_page(0)
+
+        # 切换页签时，如页面实现了 reload_from_cfg，就刷新一次 UI
+        self.tabs.currentChanged.connect(self._on_tab_changed)
+
+        # 状态栏：后台任务（运行中/排队中），悬停显示明细
+        self.job_label = QtWidgets.QLabel("后台任务(Jobs): 空闲")
+        self.statusBar().addPermanentWidget(self.job_label)
+        self.jobsChanged.connect(self._refresh_job_status, QtCore.Qt.ConnectionType.QueuedConnection)
+
+        # 状态栏：服务器健康（后台 dllVersion 探测 + 熔断状态）
+        self.health_label = QtWidgets.QLabel("服务器(Server): 未连接")
+        self.statusBar().addPermanentWidget(self.health_label)
+        self._last_probe: Optional[float] = None
+        self.healthChanged.connect(self._on_health_result, QtCore.Qt.ConnectionType.QueuedConnection)
+        self.breakerChanged.connect(lambda _s: self.refresh_health_status(), QtCore.Qt.ConnectionType.QueuedConnection)
+        self.health.start()
+
+        # 事件循环心跳：记录 UI 线程延迟
+        self._hb_interval = 0.25
+        self._hb_last = time.perf_counter()
+        self._hb_timer = QtCore.QTimer(self)
+        self._hb_timer.setInterval(int(self._hb_interval * 1000))
+        self._hb_timer.timeout.connect(self._on_heartbeat)
+        self._hb_timer.start()
+
+        # 卡顿看门狗：复用上面的心跳；阈值可用 NAL_STALL_MS 调整
+        try:
+            threshold = float(os.environ.get(STALL_THRESHOLD_ENV, "")) / 1000
+        except ValueError:
+            threshold = STALL_THRESHOLD_S
+        self.watchdog = StallWatchdog(self._hb_interval, threshold)
+        self.watchdog.start()
+
+        # 菜单：诊断 -> 性能追踪（Chrome trace）
+        menu = self.menuBar().addMenu("诊断(Diagnostics)")
+        self.act_trace = menu.addAction("性能追踪(Trace)")
+        self.act_trace.setCheckable(True)
+        self.act_trace.toggled.connect(self._on_trace_toggled)
+        if os.environ.get(TRACE_ENV, "").strip() not in ("", "0"):
+            self.act_trace.setChecked(True)
+        self.act_record = menu.addAction("录制会话(Record session)")
+        self.act_record.setCheckable(True)
+        self.act_record.toggled.connect(self._on_record_toggled)
+        if os.environ.get(RECORD_ENV, "").strip() not in ("", "0"):
+            self.act_record.setChecked(True)
+
+        # 可选：本机 Prometheus 指标端口
+        self.metrics_server: Optional[MetricsServer] = None
+        port = os.environ.get(METRICS_PORT_ENV, "").strip()
+        if port:
+            try:
+                self.metrics_server = MetricsServer(
+                    lambda: format_prometheus(self.client, self.jobs, self.save_hist, self.ui_lag_hist), int(port))
+                self.metrics_server.start()
+                print(f"metrics: http://127.0.0.1:{self.metrics_server.port}/metrics")
+            except (ValueError, OSError) as e:
+                print(f"metrics server not started ({METRICS_PORT_ENV}={port}):", e)
+                self.metrics_server = None
+
+    def _on_trace_toggled(self, on: bool):
+        if on:
+            TRACER.start()
+            self.statusBar().showMessage("性能追踪已开启(Tracing on)", 3000)
+            return
+        path = time.strftime("nal_trace_%Y%m%d_%H%M%S.json")
+        try:
+            n = TRACER.stop(path)
+            self.statusBar().showMessage(f"追踪已保存(Trace saved): {os.path.abspath(path)}  ({n} events)", 10000)
+        except OSError as e:
+            QtWidgets.QMessageBox.warning(self, "提示", f"追踪文件写入失败: {e}")
+
+    def _on_record_toggled(self, on: bool):
+        rec = self.client.recorder
+        if on:
+            path = time.strftime("nal_session_%Y%m%d_%H%M%S.jsonl")
+            try:
+                self.client.recorder = SessionRecorder(path, self.client.url() if self.client.connected else "")
+            except OSError as e:
+                QtWidgets.QMessageBox.warning(self, "提示", f"会话文件创建失败: {e}")
+                self.act_record.setChecked(False)
+                return
+            self.statusBar().showMessage(f"会话录制中(Recording): {os.path.abspath(path)}", 5000)
+            return
+        if rec is not None:
+            self.client.recorder = None
+            rec.close()
+            self.statusBar().showMessage(f"会话已保存(Session saved): {os.path.abspath(rec.path)}  ({rec.count} calls)", 10000)
 
-        # 函数测试 -> 独立类
-        self.func_tab = FunctionTestTab(self)
-        self.tabs.addTab(self.func_tab, "  函数测试  ")
+    def _on_heartbeat(self):
+        now = time.perf_counter()
+        self.ui_lag_hist.record_s(max(0.0, now - self._hb_last - self._hb_interval))
+        self._hb_last = now
+        self.watchdog.beat()
 
-        # 其余页保持原实现
-        self.gr_tab = GainRespTab(self)
-        self.tabs.addTab(self.gr_tab, "  增益/响应曲线  ")
+    @QtCore.Slot(str)
+    def _on_error_ready(self, msg: str):
+        QtWidgets.QMessageBox.critical(self, "错误", msg)
 
-        self.io_tab = IO_tab(self)
-        self.tabs.addTab(self.io_tab, "  输入/输出曲线  ")
+    @QtCore.Slot(str)
+    def _on_resp_ready(self, payload: str):
+        self.last_resp = payload
+        if self.func_tab is not None:
+            self.func_tab.resp_text.setPlainText(payload)
 
-        # 切换页签时，如页面实现了 reload_from_cfg，就刷新一次 UI
-        self.tabs.currentChanged.connect(self._on_tab_changed)
+    @QtCore.Slot(str)
+    def _on_req_preview_ready(self, s: str):
+        self.last_req_preview = s
+        if self.func_tab is not None:
+            self.func_tab.req_text.setPlainText(s)
+
+    @QtCore.Slot(bool, object)
+    def _on_health_result(self, ok: bool, latency):
+        self._last_probe = latency if ok else None
+        self.refresh_health_status()
+
+    def refresh_health_status(self):
+        if not self.client.connected:
+            self.health_label.setText("服务器(Server): 未连接")
+            self.health_label.setStyleSheet("")
+            return
+        state = self.client.breaker.state
+        if state == CircuitBreaker.OPEN:
+            self.health_label.setText(f"服务器(Server): 不可用，熔断中（{self.client.breaker.retry_after():.0f}s 后重试）")
+            self.health_label.setStyleSheet("color: #c00000;")
+        elif state == CircuitBreaker.HALF_OPEN:
+            self.health_label.setText("服务器(Server): 恢复检测中…")
+            self.health_label.setStyleSheet("color: #b35c00;")
+        elif self._last_probe is not None:
+            self.health_label.setText(f"服务器(Server): 正常 {self._last_probe * 1000:.0f} ms")
+            self.health_label.setStyleSheet("color: #007000;")
+        else:
+            self.health_label.setText("服务器(Server): 已连接")
+            self.health_label.setStyleSheet("")
+
+    @QtCore.Slot()
+    def _refresh_job_status(self):
+        snap = self.jobs.snapshot()
+        running, queued = snap[Job.RUNNING], snap[Job.QUEUED]
+        if not running and not queued:
+            self.job_label.setText("后台任务(Jobs): 空闲")
+            self.job_label.setToolTip("")
+            return
+        self.job_label.setText(f"后台任务(Jobs): 运行 {len(running)} · 排队 {len(queued)}")
+        now = time.monotonic()
+        tips = [f"▶ [{j.lane}] {j.name}  {now - j.t_start:.1f}s" for j in running]
+        tips += [f"… [{j.lane}] {j.name}" for j in queued]
+        self.job_label.setToolTip("\n".join(tips))
+
+    # ---------- cold-start snapshot ----------
+    def _snapshot_text(self, state: str) -> str:
+        if not self.snapshot:
+            return ""
+        t = time.localtime(float(self.snapshot.get("saved_at", 0)))
+        return f"上次会话(Last session) {time.strftime('%m-%d %H:%M', t)} · {state}"
+
+    def _collect_snapshot(self) -> Dict[str, Any]:
+        # 已构建的页签取当前画面；未构建的页签沿用上次快照里的那一份（仍待验证）
+        prev = self.snapshot or {}
+        c = self.client
+        snap: Dict[str, Any] = {"tab": self.tabs.currentIndex(),
+                                "connection": {"connected": c.connected, "ip": c.ip, "port": c.port, "path": c.path}}
+        for key, attr in (("io", "io_tab"), ("gain", "gr_tab")):
+            tab = getattr(self, attr)
+            part = tab.snapshot() if tab is not None else prev.get(key)
+            if part:
+                snap[key] = part
+        return snap
+
+    def save_snapshot_now(self):
+        snap = self._collect_snapshot()
+        key = json.dumps(snap, sort_keys=True)
+        if key == self._snapshot_key:
+            return
+        with TRACER.span("snapshot save", "io"):
+            try:
+                save_snapshot(self.snapshot_path, dict(snap, saved_at=time.time()))
+                self._snapshot_key = key
+            except OSError as e:
+                print("save snapshot failed:", e)
+
+    def _restore_connection(self):
+        # connect() 最长阻塞 3 s，放到后台；结果经 reconnectDone 回到主线程
+        conn = (self.snapshot or {}).get("connection") or {}
+        if not conn.get("connected"):
+            return
+        try:
+            self.client.set_server(str(conn["ip"]), int(conn["port"]), str(conn.get("path") or "/"))
+        except (KeyError, TypeError, ValueError):
+            return
+        self._reconnect_job = self.jobs.submit("home", "reconnect", lambda: self.reconnectDone.emit(self.client.connect()))
+
+    def cancel_reconnect(self):
+        # 用户手动连接时调用：排队中的自动重连不再执行，已在运行的结果被 _on_reconnect_done 忽略
+        job, self._reconnect_job = self._reconnect_job, None
+        if job is not None:
+            job.token.cancel()
+
+    @QtCore.Slot(bool)
+    def _on_reconnect_done(self, ok: bool):
+        if self.home_tab is not None and self.home_tab.connecting:
+            return  # 手动连接进行中：以它的结果为准
+        self._reconnect_job = None
+        if self.home_tab is not None:
+            self.home_tab.set_connected_ui(ok)
+        if ok:
+            self.on_connected()
+            return
+        # 连不上：保留快照画面，标记改为离线
+        self.snapshot_label = self._snapshot_text("离线(offline)")
+        for tab in (self.io_tab, self.gr_tab):
+            if tab is None:
+                continue
+            for chart in (getattr(tab, "chart", None), getattr(tab, "chart_gain", None), getattr(tab, "chart_resp", None)):
+                if chart is not None and chart.stale_text:
+                    chart.setStale(self.snapshot_label)
+
+    def on_connected(self):
+        # 手动或自动连接成功后：立即探测一次健康，并在后台重新拉取仍待验证的页签
+        self.health.probe_now()
+        for tab in (self.io_tab, self.gr_tab):
+            if tab is not None:
+                tab.validate_snapshot()
+
+    def closeEvent(self, e: QtGui.QCloseEvent):
+        # 丢弃排队中的任务；运行中的请求最多等到各自超时
+        self._snap_timer.stop()
+        self.save_snapshot_now()
+        self.health.stop()
+        self.watchdog.stop()
+        if TRACER.enabled:
+            self.act_trace.setChecked(False)
+        if self.client.recorder is not None:
+            self.act_record.setChecked(False)
+        if self.metrics_server is not None:
+            self.metrics_server.stop()
+        self.jobs.shutdown()
+        super().closeEvent(e)
 
     # ---------- response -> cfg ----------
     def handle_response_update_config(self, resp: Dict[str, Any]):
+        # 查表得到本次响应涉及的字段，一次写入、一次落盘、一次按字段通知
         try:
-            fn = resp.get("function","")
-            outp = resp.get("output_parameters", {}) or {}
-            changed = False
-
-            def upd(name, key):
-                nonlocal changed
-                if key in outp and outp[key] is not None:
-                    setattr(self.cfg, name, outp[key])
-                    changed = True
-
-            if fn == "CrossOverFrequencies_NL2":
-                upd("CFArray", "CFArray"); upd("FreqInCh", "FreqInCh")
-            elif fn == "CenterFrequencies":
-                upd("centerF", "centerF")
-                if "centreFreq" in outp:
-                    setattr(self.cfg, "centerF", outp["centreFreq"]); changed = True
-            elif fn == "CompressionThreshold_NL2":
-                upd("CT", "CT")
-            elif fn == "CompressionRatio_NL2":
-                upd("CR", "CR")
-            elif fn == "ReturnValues_NL2":
-                upd("MAF", "MAF"); upd("BWC", "BWC"); upd("ESCD", "ESCD")
-            elif fn == "RealEarAidedGain_NL2":
-                for k in ("REAG","gain","REAG19"):
-                    if k in outp:
-                        self.cfg.REAG = outp[k]; changed = True; break
-            elif fn == "RealEarInsertionGain_NL2":
-                for k in ("REIG","gain","REIG19"):
-                    if k in outp:
-                        self.cfg.REIG = outp[k]; changed = True; break
-            elif fn == "Speech_o_Gram_NL2":
-                upd("Speech_thresh", "Speech_thresh")
-
-            elif fn == "GetREURindiv":
-                upd("REUR", "REUR")
-            elif fn == "GetREURindiv9":
-                if "REUR9" in outp and outp["REUR9"] is not None:
-                    self.cfg.REUR9 = outp["REUR9"]; changed = True
-            elif fn == "GetREDDindiv":
-                upd("REDD", "REDD")
-            elif fn == "GetREDDindiv9":
-                if "REDD9" in outp and outp["REDD9"] is not None:
-                    self.cfg.REDD9 = outp["REDD9"]; changed = True
-            elif fn == "GetRECDh_indiv_NL2":
-                if "RECDh" in outp and outp["RECDh"] is not None:
-                    self.cfg.RECDh = outp["RECDh"]; changed = True
-            elif fn == "GetRECDh_indiv9_NL2":
-                if "RECDh9" in outp and outp["RECDh9"] is not None:
-                    self.cfg.RECDh9 = outp["RECDh9"]; changed = True
-            elif fn == "GetRECDt_indiv_NL2":
-                if "RECDt" in outp and outp["RECDt"] is not None:
-                    self.cfg.RECDt = outp["RECDt"]; changed = True
-            elif fn == "GetRECDt_indiv9_NL2":
-                if "RECDt9" in outp and outp["RECDt9"] is not None:
-                    self.cfg.RECDt9 = outp["RECDt9"]; changed = True
-
-            if changed:
-                self.save_config(self.config_path)
-                self.outputsChanged.emit()
-                self.rrrViewUpdate.emit()
+            updates = map_response_to_fields(self.response_map, resp)
+            if not updates:
+                return
+            for name, v in updates.items():
+                setattr(self.cfg, name, v)
+            self.save_config(self.config_path)
+            self.cfgFieldsChanged.emit(frozenset(updates))
         except Exception as e:
             print("handle_response_update_config error:", e)
 
     # ---------- config load/save ----------
-    def _compact_numeric_arrays(self, s: str) -> str:
-        out = []
-        i, n = 0, len(s)
-        def is_numeric_array_content(txt: str) -> bool:
-            for ch in txt:
-                if ch in '0123456789eE+-. ,\t\r\n':
-                    continue
-                return False
-            return True
-        while i < n:
-            ch = s[i]
-            if ch == '"':
-                out.append(ch); i += 1
-                while i < n:
-                    c = s[i]; out.append(c); i += 1
-                    if c == '\\':
-                        if i < n: out.append(s[i]); i += 1
-                        continue
-                    if c == '"': break
-            elif ch == '[':
-                depth = 1; j = i + 1; in_str = False; esc = False
-                while j < n and depth > 0:
-                    c = s[j]
-                    if in_str:
-                        if esc: esc = False
-                        elif c == '\\': esc = True
-                        elif c == '"': in_str = False
-                    else:
-                        if c == '"': in_str = True
-                        elif c == '[': depth += 1
-                        elif c == ']': depth -= 1
-                    j += 1
-                if depth != 0:
-                    out.append(ch); i += 1; continue
-                segment = s[i:j]; inner = segment[1:-1]
-                if ('[' in inner) or ('{' in inner) or ('}' in inner):
-                    out.append(segment)
-                else:
-                    if is_numeric_array_content(inner):
-                        items = [x.strip() for x in inner.strip().split(',')]
-                        items = [x for x in items if x != '']
-                        compact = '[' + ', '.join(items) + ']'
-                        out.append(compact)
-                    else:
-                        out.append(segment)
-                i = j
-            else:
-                out.append(ch); i += 1
-        return ''.join(out)
-
     def load_config(self, path: str) -> AppConfig:
         if not os.path.exists(path):
             cfg = AppConfig()
             self.save_config(path, cfg)
             return cfg
-        try:
-            with open(path, "r", encoding="utf-8") as f:
-                data = json.load(f)
-            base = AppConfig()
-            for k, v in data.items():
-                if hasattr(base, k):
-                    setattr(base, k, v)
-            if base.channels < 1: base.channels = 1
-            if base.channels > 18: base.channels = 18
-            return base
-        except Exception:
-            return AppConfig()
+        return load_app_config(path)
 
     def save_config(self, path: str, cfg: Optional[AppConfig] = None):
         if cfg is None:
             cfg = self.cfg
-        s = json.dumps(asdict(cfg), ensure_ascii=False, indent=2)
-        s = self._compact_numeric_arrays(s)
-        with open(path, "w", encoding="utf-8") as f:
-            f.write(s)
+        t0 = time.perf_counter()
+        t_trace = TRACER.begin()
+        save_app_config(path, cfg)
+        self.save_hist.record_s(time.perf_counter() - t0)
+        TRACER.complete("config save", "io", t_trace)
         # 更新“当前文件”标签（主页中的 lbl_cfg）
         try:
             if hasattr(self, "home_tab") and hasattr(self.home_tab, "lbl_cfg"):
@@ -3426,28 +3513,68 @@ class MainWindow(QtWidgets.QMainWindow):
 
     # ---------- focus behavior ----------
     def _apply_strict_focus_behavior(self):
-        # 设置：只有点击才获得焦点；未聚焦时把滚轮事件转发给最近的滚动区域
+        # 设置：只有点击才获得焦点；未聚焦时把滚轮事件转发给最近的滚动区域（整个应用只装一个过滤器）
         self._wheel_filter = _WheelFocusFilter(self)
-        kinds = (QtWidgets.QComboBox, QtWidgets.QLineEdit, QtWidgets.QPlainTextEdit, QtWidgets.QTextEdit)
-        for cls in kinds:
-            for w in self.findChildren(cls):
+        QtWidgets.QApplication.instance().installEventFilter(self._wheel_filter)
+
+    @staticmethod
+    def _set_click_focus(root: QtWidgets.QWidget):
+        for cls in _WheelFocusFilter.KINDS:
+            for w in root.findChildren(cls):
                 w.setFocusPolicy(QtCore.Qt.FocusPolicy.ClickFocus)
-                w.installEventFilter(self._wheel_filter)
+
+    # ---------- lazy tabs ----------
+    def _create_tab(self, attr: str, cls) -> QtWidgets.QWidget:
+        # 构建期间暂时摘掉应用级过滤器：建页会产生数千个 ChildAdded/LayoutRequest 事件，逐个进 Python 代价明显
+        app = QtWidgets.QApplication.instance()
+        wheel_filter = getattr(self, "_wheel_filter", None)
+        if wheel_filter is not None:
+            app.removeEventFilter(wheel_filter)
+        t0 = time.perf_counter()
+        try:
+            with TRACER.span("build " + attr, "startup"):
+                w = cls(self)
+                self._set_click_focus(w)
+        finally:
+            if wheel_filter is not None:
+                app.installEventFilter(wheel_filter)
+        setattr(self, attr, w)
+        self.tab_build_ms[attr] = (time.perf_counter() - t0) * 1000
+        # 连接后才打开的页签：构建时画的是快照，这里补一次后台复核
+        if self.client.connected:
+            getattr(w, "validate_snapshot", lambda: None)()
+        return w
+
+    def _ensure_page(self, idx: int) -> Optional[QtWidgets.QWidget]:
+        w = self.tabs.widget(idx)
+        return w.ensure() if isinstance(w, _LazyPage) else w
 
     # ---------- tab change ----------
+    def pin_cfg(self, on: bool):
+        # 主线程调用：流程开始 True、结束 False（成对）
+        self._cfg_pins += 1 if on else -1
+
     def _on_tab_changed(self, idx: int):
-        # 每次切换页签：先从磁盘重载 config，再刷新目标页 UI
-        try:
-            self.cfg = self.load_config(self.config_path)
-        except Exception as e:
-            print("Reload config on tab change failed:", e)
+        # 每次切换页签：先从磁盘重载 config，再刷新目标页 UI（有流程在改内存 config 时跳过重载）
+        if self._cfg_pins <= 0:
+            try:
+                self.cfg = self.load_config(self.config_path)
+            except Exception as e:
+                print("Reload config on tab change failed:", e)
 
-        w = self.tabs.widget(idx)
+        w = self._ensure_page(idx)
         getattr(w, "reload_from_cfg", lambda: None)()
 
 
 if __name__ == "__main__":
-    import sys
+    if "--replay" in sys.argv[1:]:
+        sys.exit(replay_main(sys.argv[1:]))
+    if "--load" in sys.argv[1:]:
+        sys.exit(load_main(sys.argv[1:]))
+    if "--batch" in sys.argv[1:]:
+        sys.exit(batch_main(sys.argv[1:]))
+    if "--proxy" in sys.argv[1:]:
+        sys.exit(proxy_main(sys.argv[1:]))
     app = QtWidgets.QApplication(sys.argv)
 
     # 1.选择主题
@@ -3473,6 +3600,21 @@ if __name__ == "__main__":
     # 3. 将自定义的浅色调色板应用到应用程序
     app.setPalette(light_palette)
 
+    t_app = time.perf_counter()
     win = MainWindow()
+    t_win = time.perf_counter()
     win.show()
+
+    def _first_frame():
+        # 启动基准：show() 之后事件循环第一次空闲即视为首帧已出（--startup-bench 时打印 JSON 并退出）
+        t = time.perf_counter()
+        ms = lambda a, b: round((b - a) * 1000, 1)
+        stats = {"imports_ms": ms(_T_PROCESS, _T_IMPORTED), "qapp_ms": ms(_T_IMPORTED, t_app),
+                 "mainwindow_ms": ms(t_app, t_win), "first_frame_ms": ms(t_win, t),
+                 "total_ms": ms(_T_PROCESS, t), "tabs_built_ms": {k: round(v, 1) for k, v in win.tab_build_ms.items()}}
+        win.statusBar().showMessage(f"启动耗时(Startup): {stats['total_ms']:.0f} ms", 5000)
+        if "--startup-bench" in sys.argv[1:]:
+            print(json.dumps(stats, ensure_ascii=False))
+            app.quit()
+    QtCore.QTimer.singleShot(0, _first_frame)
     sys.exit(app.exec())
@@ -0,0 +1,3128 @@
+"""
+NAL-NL2 客户端核心（不依赖 Qt）
+
+GUI（NAL-NL2 API Caller Client.py）之外的批处理、替身服务器、压测和测试脚本直接 import 本模块即可，
+无需显示器或 PySide6：
+- AppConfig / DEFAULT_TEMPLATES / FREQS_19 / FREQS_9、配置读写与数组压缩
+- 模板 -> 请求构建（RequestBuilder）、参数校验（RequestValidator）、响应 -> 配置字段映射
+- NALClient（连接时能力握手、自适应超时、重试、熔断、Set* 补发、MessagePack/压缩、指标）、多设备会话池 EndpointPool、后台任务执行器、Chrome trace、卡顿看门狗
+- 会话录制/回放、虚拟验配师压测、听力图批量验配、本机多客户端代理、Prometheus 指标
+命令行:
+    python nal_core.py --replay nal_session_xxx.jsonl [--speed 2] [--server host:port | --echo]
+    python nal_core.py --load --server host:port --clinicians 1,2,4 --duration 30 --out load.json
+    python nal_core.py --batch audiograms.csv --out results.jsonl [--server host:port] [--outputs reig,mpo,io]
+    python nal_core.py --proxy --server host:port [--listen 127.0.0.1:8090]
+"""
+import argparse
+import csv
+import gzip
+import itertools
+import json
+import os
+import random
+import re
+import socket
+import sys
+import threading
+import time
+import traceback
+import uuid
+import zlib
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from dataclasses import dataclass, asdict, field
+from typing import List, Dict, Any, Iterator, Optional, Tuple
+import requests
+from requests.exceptions import ConnectionError, HTTPError, RequestException, Timeout
+from nal_wire import JSON_TYPE, MSGPACK_TYPE, packb, unpackb
+
+DEFAULT_CONFIG_FILE = "nal_nl2_config.json"
+DEFAULT_TEMPLATES_FILE = "function_templates.json"
+DEFAULT_API_DOC_FILE = "NAL-NL2_API_Functions.md"
+
+FREQS_19 = [125,160,200,250,315,400,500,630,800,1000,1250,1600,2000,2500,3150,4000,5000,6300,8000]
+FREQS_9 = [250,500,1000,1500,2000,3000,4000,6000,8000]
+
+DEFAULT_TEMPLATES = {
+    "templates": [
+        {"label": "1 - dllVersion", "function": "dllVersion", "params": [], "outputs": {"major": "dll_major", "minor": "dll_minor"}},
+
+        {"label": "2 - RealEarInsertionGain_NL2", "function": "RealEarInsertionGain_NL2",
+         "params": ["AC", "BC", "L", "limiting", "channels", "direction", "mic", "ACother", "noOfAids"], "outputs": {"REIG": "REIG", "gain": "REIG", "REIG19": "REIG"}},
+
+        {"label": "3 - RealEarAidedGain_NL2", "function": "RealEarAidedGain_NL2",
+         "params": ["AC", "BC", "L", "limiting", "channels", "direction", "mic", "ACother", "noOfAids"], "outputs": {"REAG": "REAG", "gain": "REAG", "REAG19": "REAG"}},
+
+        {"label": "4 - TccCouplerGain_NL2", "function": "TccCouplerGain_NL2",
+         "params": ["AC", "BC", "L", "limiting", "channels", "direction", "mic", "target", "aidType", "ACother", "noOfAids", "tubing", "vent", "RECDmeasType"], "outputs": {"TccCG": "TccCG", "lineType": "lineType19"}},
+
+        {"label": "5 - EarSimulatorGain_NL2", "function": "EarSimulatorGain_NL2",
+         "params": ["AC", "BC", "L", "direction", "mic", "limiting", "channels", "target", "aidType", "ACother", "noOfAids", "tubing", "vent", "RECDmeasType"], "outputs": {"ESG": "ESG", "lineType": "lineType19"}}, #5 "tubing","RECDmeasType" NOT USED
+
+        {"label": "6 - RealEarInputOutputCurve_NL2", "function": "RealEarInputOutputCurve_NL2",
+         "params": ["AC", "BC", "graphFreq", "startLevel", "finishLevel", "limiting", "channels", "direction", "mic", "target", "ACother", "noOfAids"], "outputs": {"REIO": "REIO", "REIOunl": "REIOunl"}},
+
+        {"label": "7 - TccInputOutputCurve_NL2", "function": "TccInputOutputCurve_NL2",
+         "params": ["AC", "BC", "graphFreq", "startLevel", "finishLevel", "limiting", "channels", "direction", "mic", "target", "aidType", "ACother", "noOfAids", "tubing", "vent", "RECDmeasType"], "outputs": {"TccIO": "TccIO", "TccIOunl": "TccIOunl", "lineType": "lineType100"}}, #7 "tubing","RECDmeasType" NOT USED
+
+        {"label": "8 - EarSimulatorInputOutputCurve_NL2", "function": "EarSimulatorInputOutputCurve_NL2",
+         "params": ["AC", "BC", "graphFreq", "startLevel", "finishLevel", "limiting", "channels", "direction", "mic", "target", "aidType", "ACother", "noOfAids", "tubing", "vent", "RECDmeasType"], "outputs": {"ESIO": "ESIO", "ESIOunl": "ESIOunl", "lineType": "lineType100"}}, #8 "tubing","RECDmeasType" NOT USED
+
+        {"label": "9 - Speech_o_Gram_NL2", "function": "Speech_o_Gram_NL2",
+         "params": ["AC", "BC", "L", "limiting", "channels", "direction", "mic", "ACother", "noOfAids"], "outputs": {"Speech_rms": "Speech_rms", "Speech_max": "Speech_max", "Speech_min": "Speech_min", "Speech_thresh": "Speech_thresh"}},
+
+        {"label": "10 - AidedThreshold_NL2", "function": "AidedThreshold_NL2",
+         "params": ["AC", "BC", "CT", "dbOption", "ACother", "noOfAids", "limiting", "channels", "direction", "mic"], "outputs": {"AT": "AT"}},
+
+        {"label": "11 - GetREDDindiv", "function": "GetREDDindiv", "params": ["REDD_defValues"], "outputs": {"REDD": "REDD"}},
+        {"label": "12 - GetREDDindiv9", "function": "GetREDDindiv9", "params": ["REDD_defValues"], "outputs": {"REDD9": "REDD9"}},
+        {"label": "13 - GetREURindiv", "function": "GetREURindiv", "params": ["REUR_defValues", "dateOfBirth", "direction", "mic"], "outputs": {"REUR": "REUR"}},
+        {"label": "14 - GetREURindiv9", "function": "GetREURindiv9", "params": ["REUR_defValues", "dateOfBirth", "direction", "mic"], "outputs": {"REUR9": "REUR9"}},
+        {"label": "15 - SetREDDindiv", "function": "SetREDDindiv", "params": ["REDD", "REDD_defValues"], "outputs": {}},
+        {"label": "16 - SetREDDindiv9", "function": "SetREDDindiv9", "params": ["REDD9", "REDD_defValues"], "outputs": {}},
+        {"label": "17 - SetREURindiv", "function": "SetREURindiv", "params": ["REUR", "REUR_defValues", "dateOfBirth", "direction", "mic"], "outputs": {}},
+        {"label": "18 - SetREURindiv9", "function": "SetREURindiv9", "params": ["REUR9", "REUR_defValues", "dateOfBirth", "direction", "mic"], "outputs": {}},
+        {"label": "19 - CrossOverFrequencies_NL2", "function": "CrossOverFrequencies_NL2", "params": ["channels", "AC", "BC"], "outputs": {"CFArray": "CFArray", "FreqInCh": "FreqInCh"}}, #19 "BC" NOT USED, 需要把BC填充为AC的值，以符合Step1-9文档的要求
+        {"label": "20 - CenterFrequencies", "function": "CenterFrequencies", "params": ["CFArray", "channels"], "outputs": {"centerF": "centerF", "centreFreq": "centerF"}},
+
+        {"label": "21 - CompressionThreshold_NL2", "function": "CompressionThreshold_NL2",
+         "params": ["bandWidth", "selection", "WBCT", "aidType", "direction", "mic", "calcCh"], "outputs": {"CT": "CT"}},
+
+        {"label": "22 - CompressionRatio_NL2", "function": "CompressionRatio_NL2",
+         "params": ["channels", "centreFreq", "AC", "BC", "direction", "mic", "limiting", "ACother", "noOfAids"], "outputs": {"CR": "CR"}},
+
+        {"label": "23 - setBWC", "function": "setBWC", "params": ["channels", "crossOver"], "outputs": {}},
+        {"label": "24 - getMPO_NL2 (RESR/SSPL)", "function": "getMPO_NL2", "params": ["type", "AC", "BC", "channels", "limiting"], "outputs": {"MPO": "MPO"}},
+
+        {"label": "25 - GainAt_NL2", "function": "GainAt_NL2",
+         "params": ["freqRequired", "targetType", "AC", "BC", "L", "limiting", "channels", "direction", "mic",
+                    "ACother", "noOfAids", "bandWidth", "target", "aidType", "tubing", "vent", "RECDmeasType"], "outputs": {"return": "gainAt_value"}},
+
+        {"label": "26 - GetMLE", "function": "GetMLE",  "params": ["aidType", "direction", "mic"], "outputs": {"MLE": "MLE"}},
+        {"label": "27 - ReturnValues_NL2", "function": "ReturnValues_NL2", "params": [], "outputs": {"MAF": "MAF", "BWC": "BWC", "ESCD": "ESCD"}},
+        {"label": "28 - GetTubing_NL2", "function": "GetTubing_NL2", "params": ["tubing"], "outputs": {"Tubing": "Tubing"}},
+        {"label": "29 - GetTubing9_NL2", "function": "GetTubing9_NL2", "params": ["tubing"], "outputs": {"Tubing9": "Tubing9"}},
+        {"label": "30 - GetVentOut_NL2", "function": "GetVentOut_NL2", "params": ["vent"], "outputs": {"Ventout": "Ventout"}},
+        {"label": "31 - GetVentOut9_NL2", "function": "GetVentOut9_NL2", "params": ["vent"], "outputs": {"Ventout9": "Ventout9"}},
+        {"label": "32 - Get_SI_NL2", "function": "Get_SI_NL2", "params": ["s", "REAG", "MPO"], "outputs": {"return": "SI_value"}}, # MPO的位置在原文档里是 Limit,猜测就是MPO
+
+        {"label": "33 - Get_SII", "function": "Get_SII",
+         "params": ["compSpeed", "Speech_thresh", "s", "REAG", "REAGp", "REAGm", "REUR"], "outputs": {"return": "SII_value"}}, # compSpeed 的位置在文档里是 nCompSpeed ,猜测是同一个数据
+
+        {"label": "34 - SetAdultChild", "function": "SetAdultChild", "params": ["adultChild", "dateOfBirth"], "outputs": {}},
+        {"label": "35 - SetExperience", "function": "SetExperience", "params": ["experience"], "outputs": {}},
+        {"label": "36 - SetCompSpeed", "function": "SetCompSpeed", "params": ["compSpeed"], "outputs": {}},
+        {"label": "37 - SetTonalLanguage", "function": "SetTonalLanguage", "params": ["tonal"], "outputs": {}},
+        {"label": "38 - SetGender", "function": "SetGender", "params": ["gender"], "outputs": {}},
+
+        {"label": "39 - GetRECDh_indiv_NL2", "function": "GetRECDh_indiv_NL2",
+         "params": ["RECDmeasType", "dateOfBirth", "aidType", "tubing", "vent", "coupler", "fittingDepth"], "outputs": {"RECDh": "RECDh"}}, #39 "aidType" NOT USED
+
+        {"label": "40 - GetRECDh_indiv9_NL2", "function": "GetRECDh_indiv9_NL2",
+         "params": ["RECDmeasType", "dateOfBirth", "aidType", "tubing", "vent", "coupler", "fittingDepth"], "outputs": {"RECDh9": "RECDh9"}},
+
+        {"label": "41 - GetRECDt_indiv_NL2", "function": "GetRECDt_indiv_NL2",
+         "params": ["RECDmeasType", "dateOfBirth", "aidType", "tubing", "vent", "earpiece", "coupler", "fittingDepth"], "outputs": {"RECDt": "RECDt"}}, #41 "aidType" NOT USED
+
+        {"label": "42 - GetRECDt_indiv9_NL2", "function": "GetRECDt_indiv9_NL2",
+         "params": ["RECDmeasType", "dateOfBirth", "aidType", "tubing", "vent", "earpiece", "coupler", "fittingDepth"], "outputs": {"RECDt9": "RECDt9"}},
+
+        {"label": "43 - SetRECDh_indiv_NL2", "function": "SetRECDh_indiv_NL2", "params": ["RECDh"], "outputs": {}},
+        {"label": "44 - SetRECDh_indiv9_NL2", "function": "SetRECDh_indiv9_NL2", "params": ["RECDh9"], "outputs": {}},
+        {"label": "45 - SetRECDt_indiv_NL2", "function": "SetRECDt_indiv_NL2", "params": ["RECDt"], "outputs": {}},
+        {"label": "46 - SetRECDt_indiv9_NL2", "function": "SetRECDt_indiv9_NL2", "params": ["RECDt9"], "outputs": {}}
+    ]
+}
+
+def ensure_templates_file(path: str):
+    if not os.path.exists(path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(DEFAULT_TEMPLATES, f, ensure_ascii=False, indent=2)
+
+@dataclass
+class AppConfig:
+# Server
+    server_ip: str = "192.168.0.100"
+    server_port: int = 8080
+    server_path: str = "/api/nal2/process"
+
+# ======================================================================================================================
+# 在配置页面出现的参数
+# ======================================================================================================================
+# 用户数据
+    adultChild: int = 0          # 0=成人;1=儿童;2=按dateOfBirth计算 (34i)
+    dateOfBirth: int = 19810101  # yyyymmdd (34i 13i 14i 17i 18i 39i 40i 41i 42i)
+    experience: int = 0          # 0=有经验;1=新用户 (35i)
+    compSpeed: int = 1           # 0=慢;1=快;2=双速 (36i 33i)
+    tonal: int = 0               # 0=非声调;1=声调 (37i)
+    gender: int = 1              # 0=未知;1=男;2=女 (38i)
+    
+# 用户听阈（9 点：250,500,1k,1.5k,2k,3k,4k,6k,8k Hz）
+    AC:      List[float] = field(default_factory=lambda: [45, 40, 40, 999, 65, 999, 70, 70, 55])   # (2i 3i 4i 5i 6i 7i 8i 9i 10i 19i 22i 24i 25i)
+    BC:      List[float] = field(default_factory=lambda: [45, 40, 40, 999, 65, 999, 70, 999, 999]) # (2i 3i 4i 5i 6i 7i 8i 9i 10i 19i 22i 24i 25i) 实际上19号函数文档里标注NOT USED，用AC值代替
+    ACother: List[float] = field(default_factory=lambda: [45, 45, 45, 999, 65, 999, 70, 65, 55])   # (2i 3i 4i 5i 6i 7i 8i 9i 10i 22i 25i)
+
+
+# ==============================
+# 常用参数（多数 API 共享）
+# ==============================
+    channels: int = 18           # 1..18 (2i 3i 4i 5i 6i 7i 8i 10i 19i 20i 22i 23i 24i 25i)
+    bandWidth: int = 0           # 0=宽带;1=窄带 (21i 25i)
+    selection: int = 1           # 计算CT时使用的增益目标。0=REIG;1=REAG;2=2cc;3=EarSimulator (21i)
+    WBCT: int = 52               # 宽带压缩阈         (21i)
+    aidType: int = 3             # 0=CIC;1=ITC;2=ITE;3=BTE (4i 5i 7i 8i 21i 25i 26i 39i 40i 41i 42i) 实际上39、41号函数文档里标注NOT USED
+    direction: int = 0           # 0=0°;1=45°            (2i 3i 4i 5i 6i 7i 8i 9i 10i 13i 14i 17i 18i 21i 22i 25i 26i)
+    mic: int = 1                 # 0=自由场;1=头表面(MRP) (2i 3i 4i 5i 6i 7i 8i 9i 10i 13i 14i 17i 18i 21i 22i 25i 26i)
+    limiting: int = 0            # 0=关;1=宽带;2=多通道 (2i 3i 4i 5i 6i 7i 8i 9i 10i 22i 24i 25i)
+    noOfAids: int = 1            # 0=单耳;1=双耳           (2i 3i 4i 5i 6i 7i 8i 9i 10i 22i 25i)
+    calcCh: List[int] = field(default_factory=lambda: [1] * 19)  # CompressionThreshold 重算标志 (21i)
+
+
+# ==============================
+# 装配/耦合相关（RECD/管路/通气孔等）
+# ==============================
+    tubing: int = 3              # 0=Libby4;1=Libby3;2=#13;3=细管;4=RITC;5=None (4i 5i 7i 8i 25i 28i 29i 39i 40i 41i 42i)  实际上5、7、8号函数文档里标注NOT USED
+    vent: int = 0                # 0=紧;1=封闭;2=封闭穹顶;3=1mm;4=2mm;5=3mm;6=开放穹顶 (4i 5i 7i 8i 25i 30i 31i 39i 40i 41i 42i)
+    coupler: int = 0             # 0=HA1;1=HA2 (39i 40i 41i 42i)
+    fittingDepth: int = 0        # 0=标准;1=深;2=浅 (39i 40i 41i 42i)
+    earpiece: int = 0            # 0=泡棉;1=自制耳模 (41i 42i)
+    RECDmeasType: int = 0        # 0=预测;1=实测 (4i 5i 7i 8i 25i 39i 40i 41i 42i) 实际上4、5、7、8号函数文档里标注NOT USED
+    REDD_defValues: int = 0      # Get/Set REDD: 0=预测;1=客户数据 (11i 12i 15i 16i)
+    REUR_defValues: int = 0      # Get/Set REUR: 0=预测;1=客户数据 (13i 14i 17i 18i)
+
+# ==============================
+# 获取增益或曲线用
+# ==============================
+    L: int = 65                  # 宽带输入电平(dB)          (2i 3i 4i 5i 6i 7i 8i 9i 25i)
+    target: int = 1              # 目标：0=REIG;1=REAG (4i 5i 6i 7i 8i 25i)
+    targetType: int = 1          # GainAt_NL2使用的增益目标: 0=REIG;1=REAG;2=2cc;3=EarSim (25i)
+    freqRequired: int = 9        # 单频点计算索引 0..18 (25i)
+    type: int = 1                # getMPO_NL2 用：0=RESR;1=SSPL (24i)
+    
+    graphFreq: int = 9           # IO 曲线用：0..18 (6i 7i 8i)
+    startLevel: int = 40         # IO 曲线起始 dB (6i 7i 8i)
+    finishLevel: int = 90        # IO 曲线结束 dB (6i 7i 8i)
+    s: int = 2                   # SI/SII 语音级别索引 (32i 33i)
+    dbOption: int = 0            # AidedThreshold: 0=dB HL;1=dB SPL (10i)
+
+# ==============================
+# 频带/分频计算（19 或可变）
+# ==============================
+    CFArray: List[float] = field(default_factory=lambda: [0.0] * 19)   # CrossOverFrequencies 输出；实际用长=channels-1 (19o 20i)
+    crossOver: List[float] = field(default_factory=lambda: [0.0] * 19) # setBWC 输入 (23i)
+    FreqInCh: List[int] = field(default_factory=lambda: [0] * 19)      # 频点所属通道 (19o)
+    centerF: List[int] = field(default_factory=lambda: [0] * 19)       # CenterFrequencies 输出 (20o)
+    centreFreq: List[int] = field(default_factory=lambda: [0] * 19)    # CompressionRatio 输入名 (22i)
+
+# ==============================
+# 阈值/压缩（21,22）
+# ==============================
+    CT: List[float] = field(default_factory=lambda: [0.0] * 19)        # CompressionThreshold_NL2 输出 / AidedThreshold 输入 (21o 10i)
+    CR: List[float] = field(default_factory=lambda: [0.0] * 19)        # CompressionRatio_NL2 输出 (22o)
+
+# ==============================
+# RECD 系列（39-46）
+# ==============================
+    RECDh:  List[float] = field(default_factory=lambda: [0.0] * 19)   # GetRECDh_indiv_NL2 / SetRECDh_indiv_NL2 (39o 43i)
+    RECDh9: List[float] = field(default_factory=lambda: [0.0] * 9)    # GetRECDh_indiv9_NL2 / SetRECDh_indiv9_NL2 (40o 44i)
+    RECDt:  List[float] = field(default_factory=lambda: [0.0] * 19)   # GetRECDt_indiv_NL2 / SetRECDt_indiv_NL2 (41o 45i)
+    RECDt9: List[float] = field(default_factory=lambda: [0.0] * 9)    # GetRECDt_indiv9_NL2 / SetRECDt_indiv9_NL2 (42o 46i)
+
+# ==============================
+# REUR / REDD（11-18）
+# ==============================
+    REDD: List[float] = field(default_factory=lambda: [0.0] * 19)      # GetREDDindiv / SetREDDindiv (11o 15i)
+    REDD9: List[float] = field(default_factory=lambda: [0.0] * 9)      # GetREDDindiv9 / SetREDDindiv9 (12o 16i)
+    REUR: List[float] = field(default_factory=lambda: [0.0] * 19)      # GetREURindiv / SetREURindiv / Get_SII (13o 17i 33i)
+    REUR9: List[float] = field(default_factory=lambda: [0.0] * 9)      # GetREURindiv9 / SetREURindiv9 (14o 18i)
+
+# ==============================
+# 实耳/耦合/耳模拟 增益与曲线（2-8,24-25）
+# ==============================
+    REIG: List[float] = field(default_factory=lambda: [0.0] * 19)      # RealEarInsertionGain_NL2 (2o)
+    REAG: List[float] = field(default_factory=lambda: [0.0] * 19)      # RealEarAidedGain_NL2 / Get_SI_NL2 / Get_SII (3o 32i 33i)
+    TccCG: List[float] = field(default_factory=lambda: [0.0] * 19)     # TccCouplerGain_NL2 (4o)
+    ESG: List[float] = field(default_factory=lambda: [0.0] * 19)       # EarSimulatorGain_NL2 (5o)
+    lineType19: List[int] = field(default_factory=lambda: [0] * 19)    # 画线类型输出 (4o 5o)
+
+    MPO: List[float] = field(default_factory=lambda: [0.0] * 19)       # getMPO_NL2 (24o)
+    gainAt_value: float = 0.0                                         # GainAt_NL2 返回值 (25o)
+
+    REIO: List[float] = field(default_factory=lambda: [0.0] * 100)     # RealEarInputOutputCurve_NL2（限幅）(6o)
+    REIOunl: List[float] = field(default_factory=lambda: [0.0] * 100)  # RealEarInputOutputCurve_NL2（无限幅）(6o)
+    TccIO: List[float] = field(default_factory=lambda: [0.0] * 100)    # TccInputOutputCurve_NL2（限幅）(7o)
+    TccIOunl: List[float] = field(default_factory=lambda: [0.0] * 100) # TccInputOutputCurve_NL2（无限幅）(7o)
+    ESIO: List[float] = field(default_factory=lambda: [0.0] * 100)     # EarSimulatorInputOutputCurve_NL2（限幅）(8o)
+    ESIOunl: List[float] = field(default_factory=lambda: [0.0] * 100)  # EarSimulatorInputOutputCurve_NL2（无限幅）(8o)
+    lineType100: List[int] = field(default_factory=lambda: [0] * 100)  # 画线类型输出 (7o 8o)
+
+
+# ==============================
+# 语音图/指标（9,32,33）
+# ==============================
+    Speech_rms: List[float] = field(default_factory=lambda: [0.0] * 19)    # Speech_o_Gram_NL2 (9o)
+    Speech_max: List[float] = field(default_factory=lambda: [0.0] * 19)    # Speech_o_Gram_NL2 (9o)
+    Speech_min: List[float] = field(default_factory=lambda: [0.0] * 19)    # Speech_o_Gram_NL2 (9o)
+    Speech_thresh: List[float] = field(default_factory=lambda: [0.0] * 19) # Speech_o_Gram_NL2 / Get_SII (9o 33i)
+    Limit: List[float] = field(default_factory=lambda: [0.0] * 19)         # Get_SI_NL2 (32i)
+
+    REAGp: List[float] = field(default_factory=lambda: [0.0] * 19)         # Get_SII (33i)
+    REAGm: List[float] = field(default_factory=lambda: [0.0] * 19)         # Get_SII (33i)
+    SI_value: float = 0.0                                                  # Get_SI_NL2 返回值 (32o)
+    SII_value: float = 0.0                                                 # Get_SII 返回值 (33o)
+
+# ==============================
+# Aided Threshold（10）
+# ==============================
+    AT: List[float] = field(default_factory=lambda: [0.0] * 19)        # AidedThreshold_NL2 (10o)
+
+
+# ==============================
+# 参考数据与修正（26,27,28-31）
+# ==============================
+    MLE: List[float] = field(default_factory=lambda: [0.0] * 19)       # GetMLE (26o)
+    MAF: List[float] = field(default_factory=lambda: [0.0] * 19)       # ReturnValues_NL2 (27o)
+    BWC: List[float] = field(default_factory=lambda: [0.0] * 19)       # ReturnValues_NL2 (27o)
+    ESCD: List[float] = field(default_factory=lambda: [0.0] * 19)      # ReturnValues_NL2 (27o)
+
+    Tubing: List[float] = field(default_factory=lambda: [0.0] * 19)    # GetTubing_NL2 (28o)
+    Tubing9: List[float] = field(default_factory=lambda: [0.0] * 9)    # GetTubing9_NL2 (29o)
+    Ventout: List[float] = field(default_factory=lambda: [0.0] * 19)   # GetVentOut_NL2 (30o)
+    Ventout9: List[float] = field(default_factory=lambda: [0.0] * 9)   # GetVentOut9_NL2 (31o)
+
+# ==============================
+# 版本信息（1）
+# ==============================
+    dll_major: int = 0                                               # dllVersion (1o)
+    dll_minor: int = 0                                               # dllVersion (1o)
+
+
+# —— 新增：增益/响应曲线页缓存（19点） ——
+    gain50_19: List[float] = field(default_factory=lambda: [0.0] * 19)
+    gain65_19: List[float] = field(default_factory=lambda: [0.0] * 19)
+    gain80_19: List[float] = field(default_factory=lambda: [0.0] * 19)
+    gainL_19:  List[float] = field(default_factory=lambda: [0.0] * 19)
+
+    resp50_19: List[float] = field(default_factory=lambda: [0.0] * 19)
+    resp65_19: List[float] = field(default_factory=lambda: [0.0] * 19)
+    resp80_19: List[float] = field(default_factory=lambda: [0.0] * 19)
+    respL_19:  List[float] = field(default_factory=lambda: [0.0] * 19)
+ 
+# —— 新增：GainAt_NL2 的增益与响应（19点） ——
+    GainAt_NL2_gain: List[float] = field(default_factory=lambda: [0.0] * 19)
+    GainAt_NL2_resp: List[float] = field(default_factory=lambda: [0.0] * 19)
+
+# ==============================
+# 频点说明（注释）
+# - 9点数组顺序：250, 500, 1000, 1500, 2000, 3000, 4000, 6000, 8000 Hz
+# - 19点数组顺序：125, 160, 200, 250, 315, 400, 500, 630, 800, 1000,
+#                 1250,1600,2000,2500,3150,4000,5000,6300,8000
+# ==============================
+
+# ==============================
+# 响应 -> config 映射表（由模板的 "outputs" 编译，一次编译，按函数名 dict 分发）
+# - outputs: {响应键: AppConfig 字段}；同一字段有多个候选键时取第一个命中的
+# - 键 "return" 表示响应顶层的 return 值（25/32/33 号函数）
+# - 数组长度按 AppConfig 默认值校验；CFArray/centerF 长度随 channels 变化，只校验上限
+# ==============================
+VARIABLE_LEN_OUTPUTS = {"CFArray", "centerF"}
+
+def load_app_config(path: str) -> AppConfig:
+    # 只读加载：文件不存在或损坏时返回默认配置；未知字段忽略
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        base = AppConfig()
+        for k, v in data.items():
+            if hasattr(base, k):
+                setattr(base, k, v)
+        if base.channels < 1: base.channels = 1
+        if base.channels > 18: base.channels = 18
+        return base
+    except Exception:
+        return AppConfig()
+
+def compact_numeric_arrays(s: str) -> str:
+    """把 json.dumps(indent=2) 里纯数字数组压成一行，字符串与嵌套结构保持原样"""
+    out = []
+    i, n = 0, len(s)
+    def is_numeric_array_content(txt: str) -> bool:
+        for ch in txt:
+            if ch in '0123456789eE+-. ,\t\r\n':
+                continue
+            return False
+        return True
+    while i < n:
+        ch = s[i]
+        if ch == '"':
+            out.append(ch); i += 1
+            while i < n:
+                c = s[i]; out.append(c); i += 1
+                if c == '\\':
+                    if i < n: out.append(s[i]); i += 1
+                    continue
+                if c == '"': break
+        elif ch == '[':
+            depth = 1; j = i + 1; in_str = False; esc = False
+            while j < n and depth > 0:
+                c = s[j]
+                if in_str:
+                    if esc: esc = False
+                    elif c == '\\': esc = True
+                    elif c == '"': in_str = False
+                else:
+                    if c == '"': in_str = True
+                    elif c == '[': depth += 1
+                    elif c == ']': depth -= 1
+                j += 1
+            if depth != 0:
+                out.append(ch); i += 1; continue
+            segment = s[i:j]; inner = segment[1:-1]
+            if ('[' in inner) or ('{' in inner) or ('}' in inner):
+                out.append(segment)
+            else:
+                if is_numeric_array_content(inner):
+                    items = [x.strip() for x in inner.strip().split(',')]
+                    items = [x for x in items if x != '']
+                    compact = '[' + ', '.join(items) + ']'
+                    out.append(compact)
+                else:
+                    out.append(segment)
+            i = j
+        else:
+            out.append(ch); i += 1
+    return ''.join(out)
+
+def save_app_config(path: str, cfg: AppConfig):
+    s = compact_numeric_arrays(json.dumps(asdict(cfg), ensure_ascii=False, indent=2))
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(s)
+
+# ==============================
+# 冷启动快照（上次会话最后画出的内容）
+# - 关闭时与每 SNAPSHOT_INTERVAL_S 秒写一次：连接目标、各页曲线序列、IO 表格文本
+# - 启动时先画快照（标为“上次会话·待验证”），连接恢复后后台重新拉取再替换
+# - 写入先落临时文件再 os.replace，避免中途退出留下半个文件
+# ==============================
+SNAPSHOT_FILE = "nal_session_snapshot.json"
+SNAPSHOT_INTERVAL_S = 30.0
+SNAPSHOT_VERSION = 1
+
+def load_snapshot(path: str) -> Optional[Dict[str, Any]]:
+    # 文件不存在、损坏或版本不符都当作没有快照
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(data, dict) or data.get("version") != SNAPSHOT_VERSION:
+        return None
+    return data
+
+def save_snapshot(path: str, snap: Dict[str, Any]):
+    data = dict(snap, version=SNAPSHOT_VERSION)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp, path)
+
+def load_templates_list(path: str) -> List[Dict[str, Any]]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f).get("templates", [])
+    except Exception:
+        return DEFAULT_TEMPLATES["templates"]
+
+def compile_response_map(templates: List[Dict[str, Any]]) -> Dict[str, List[tuple]]:
+    # 旧版模板文件没有 "outputs" 时，回退到内置模板的映射
+    builtin = {t["function"]: t.get("outputs", {}) for t in DEFAULT_TEMPLATES["templates"]}
+    base = AppConfig()
+    table: Dict[str, List[tuple]] = {}
+    for t in templates:
+        fn = t.get("function")
+        if not fn:
+            continue
+        rules = []
+        for key, name in (t.get("outputs") or builtin.get(fn, {})).items():
+            if not hasattr(base, name):
+                print(f"compile_response_map: {fn}.{key} -> 未知字段 {name}，已忽略")
+                continue
+            dv = getattr(base, name)
+            n = len(dv) if isinstance(dv, list) else None
+            rules.append((key, name, n, name in VARIABLE_LEN_OUTPUTS))
+        table[fn] = rules
+    return table
+
+def map_response_to_fields(table: Dict[str, List[tuple]], resp: Dict[str, Any]) -> Dict[str, Any]:
+    # 返回 {字段: 新值}；错误响应、类型不符或长度不符的输出不会写入
+    if not isinstance(resp, dict):
+        return {}
+    fn = resp.get("function", "")
+    rules = table.get(fn)
+    if not rules:
+        return {}
+    outp = resp.get("output_parameters", {}) or {}
+    if "error" in outp:
+        return {}
+    updates: Dict[str, Any] = {}
+    for key, name, n, variable in rules:
+        if name in updates:
+            continue
+        v = resp.get("return") if key == "return" else outp.get(key)
+        if v is None:
+            continue
+        if n is None:
+            if isinstance(v, bool) or not isinstance(v, (int, float)):
+                continue
+        else:
+            if not isinstance(v, list):
+                continue
+            if (len(v) > n) if variable else (len(v) != n):
+                print(f"map_response_to_fields: {fn}.{key} 长度 {len(v)} 与 {name}[{n}] 不符，已忽略")
+                continue
+        updates[name] = v
+    return updates
+
+# ==============================
+# 请求构建（由模板的 "params" 编译；只读取需要的字段，不做整份 asdict 深拷贝）
+# - 参数名与 AppConfig 字段名不同的，按 PARAM_ALIASES 取值
+# - 每个参数序列化后的 JSON 片段会缓存，值未变化时直接复用
+# ==============================
+PARAM_ALIASES = {"crossOver": "CFArray", "centreFreq": "centerF", "nCompSpeed": "compSpeed"}
+
+class BuiltParams(dict):
+    """RequestBuilder 生成的 input_parameters：附带预序列化的 JSON 文本，被修改后自动失效"""
+    __slots__ = ("json",)
+
+    def __setitem__(self, k, v):
+        self.json = None
+        super().__setitem__(k, v)
+
+    def __delitem__(self, k):
+        self.json = None
+        super().__delitem__(k)
+
+    def update(self, *args, **kwargs):
+        self.json = None
+        super().update(*args, **kwargs)
+
+    def pop(self, *args):
+        self.json = None
+        return super().pop(*args)
+
+    def popitem(self):
+        self.json = None
+        return super().popitem()
+
+    def setdefault(self, k, default=None):
+        if k not in self:
+            self.json = None
+        return super().setdefault(k, default)
+
+    def clear(self):
+        self.json = None
+        super().clear()
+
+    def __ior__(self, other):
+        self.json = None
+        return super().__ior__(other)
+
+class RequestBuilder:
+    def __init__(self, templates: List[Dict[str, Any]]):
+        self.params_of: Dict[str, tuple] = {t["function"]: tuple(t.get("params", [])) for t in DEFAULT_TEMPLATES["templates"]}
+        for t in templates:
+            if t.get("function"):
+                self.params_of[t["function"]] = tuple(t.get("params", []))
+        self._frags: Dict[str, tuple] = {}  # 参数名 -> (值快照, JSON 片段)
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def _fragment(self, name: str, v: Any) -> str:
+        snap = tuple(v) if isinstance(v, list) else v
+        hit = self._frags.get(name)
+        if hit is not None and type(hit[0]) is type(snap) and hit[0] == snap:
+            self.cache_hits += 1
+            return hit[1]
+        self.cache_misses += 1
+        frag = json.dumps(name) + ": " + json.dumps(v)
+        self._frags[name] = (snap, frag)
+        return frag
+
+    def from_fields(self, params, cfg: AppConfig, **overrides) -> BuiltParams:
+        out = BuiltParams()
+        frags = []
+        for p in params:
+            v = overrides[p] if p in overrides else getattr(cfg, PARAM_ALIASES.get(p, p), None)
+            dict.__setitem__(out, p, v)
+            frags.append(self._fragment(p, v))
+        out.json = "{" + ", ".join(frags) + "}"
+        return out
+
+    def params(self, function: str, cfg: AppConfig, **overrides) -> BuiltParams:
+        return self.from_fields(self.params_of[function], cfg, **overrides)
+
+    def request(self, function: str, cfg: AppConfig, **overrides) -> Dict[str, Any]:
+        return {"function": function, "input_parameters": self.params(function, cfg, **overrides)}
+
+# ==============================
+# 发送前参数校验（按函数预编译；规则来自 NAL-NL2_API_Functions.md，文档缺失时用内置表）
+# - 类型/数组长度/枚举范围按参数名检查；长度依赖 channels 的数组单独处理
+# - 校验失败直接在本地报错，不占用设备往返
+# ==============================
+class RequestValidationError(ValueError):
+    pass
+
+# 参数名 -> (类型, 数组长度 或 None, 最小值, 最大值)；类型 "int"/"num"，数组长度非 None 表示数组
+PARAM_RULES: Dict[str, tuple] = {
+    "AC": ("num", 9, None, None), "BC": ("num", 9, None, None), "ACother": ("num", 9, None, None),
+    "CT": ("num", 19, None, None), "calcCh": ("int", 19, 0, 1),
+    "REDD": ("num", 19, None, None), "REUR": ("num", 19, None, None),
+    "RECDh": ("num", 19, None, None), "RECDt": ("num", 19, None, None),
+    "REDD9": ("num", 9, None, None), "REUR9": ("num", 9, None, None),
+    "RECDh9": ("num", 9, None, None), "RECDt9": ("num", 9, None, None),
+    "REAG": ("num", 19, None, None), "Limit": ("num", 19, None, None), "Speech_thresh": ("num", 19, None, None),
+    "REAGp": ("num", 19, None, None), "REAGm": ("num", 19, None, None),
+    "L": ("num", None, None, None), "WBCT": ("int", None, None, None), "dateOfBirth": ("int", None, 10000101, 99991231),
+    "startLevel": ("int", None, None, None), "finishLevel": ("int", None, None, None),
+    "channels": ("int", None, 1, 18), "graphFreq": ("int", None, 0, 18), "freqRequired": ("int", None, 0, 18),
+    "limiting": ("int", None, 0, 2), "direction": ("int", None, 0, 1), "mic": ("int", None, 0, 1),
+    "noOfAids": ("int", None, 0, 1), "target": ("int", None, 0, 1), "targetType": ("int", None, 0, 3),
+    "selection": ("int", None, 0, 3), "aidType": ("int", None, 0, 3), "bandWidth": ("int", None, 0, 1),
+    "type": ("int", None, 0, 1), "dbOption": ("int", None, 0, 1), "s": ("int", None, 0, 6),
+    "adultChild": ("int", None, 0, 2), "experience": ("int", None, 0, 1), "compSpeed": ("int", None, 0, 2),
+    "nCompSpeed": ("int", None, 0, 2), "tonal": ("int", None, 0, 1), "gender": ("int", None, 0, 2),
+    "tubing": ("int", None, 0, 5), "vent": ("int", None, 0, 6), "coupler": ("int", None, 0, 1),
+    "fittingDepth": ("int", None, 0, 2), "earpiece": ("int", None, 0, 1), "RECDmeasType": ("int", None, 0, 1),
+    "REDD_defValues": ("int", None, 0, 1), "REUR_defValues": ("int", None, 0, 1),
+}
+
+# 长度随 channels 变化的数组：参数名 -> (比较方式, 由 channels 计算的长度, 文字说明)
+CHANNEL_LEN_PARAMS = {
+    "CFArray": (">=", lambda ch: ch - 1, "channels-1"),
+    "crossOver": (">=", lambda ch: max(1, ch - 1), "max(1, channels-1)"),
+    "centreFreq": ("==", lambda ch: ch + 1, "channels+1"),
+}
+
+IO_LEVEL_SPAN = 100  # IO 曲线 lineType[100]：finishLevel-startLevel 必须 < 100
+
+def load_param_rules_from_doc(path: str) -> Dict[str, Dict[str, tuple]]:
+    """解析 API 文档中的 `input int/double name[N], // 说明` 行，得到 函数 -> {参数: 规则}"""
+    out: Dict[str, Dict[str, tuple]] = {}
+    if not os.path.exists(path):
+        return out
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            text = f.read()
+    except Exception:
+        return out
+    fn = None
+    for line in text.splitlines():
+        m = re.match(r"###\s+\d+\.\s+(\w+)", line)
+        if m:
+            fn = m.group(1); out.setdefault(fn, {})
+            continue
+        if line.startswith("## "):
+            fn = None
+            continue
+        m = re.match(r"\s*input\s+(int|double)\s+(\w+)\s*(?:\[(\d*)\])?\s*,?\s*(?://\s*(.*))?$", line)
+        if not fn or not m:
+            continue
+        kind, name, n, note = m.group(1), m.group(2), m.group(3), m.group(4) or ""
+        if n is not None and not n:
+            continue  # 可变长数组（依赖 channels），见 CHANNEL_LEN_PARAMS
+        rng = re.search(r"\((\d+)-(\d+)\)", note)
+        enums = [int(x) for x in re.findall(r"(\d+)=", note)]
+        lo, hi = (int(rng.group(1)), int(rng.group(2))) if rng else ((min(enums), max(enums)) if enums else (None, None))
+        out[fn][name] = ("int" if kind == "int" else "num", int(n) if n else None, lo, hi)
+    return out
+
+def _is_int(v) -> bool:
+    return isinstance(v, int) and not isinstance(v, bool)
+
+def _is_num(v) -> bool:
+    return isinstance(v, (int, float)) and not isinstance(v, bool)
+
+def _compile_param_check(name: str, rule: tuple):
+    kind, n, lo, hi = rule
+    ok = _is_int if kind == "int" else _is_num
+    tname = "整数" if kind == "int" else "数值"
+
+    def in_range(v) -> bool:
+        return (lo is None or v >= lo) and (hi is None or v <= hi)
+
+    if n is None:
+        def check(v):
+            if not ok(v):
+                return f"{name} 应为{tname}，实际为 {v!r}"
+            if not in_range(v):
+                return f"{name}={v} 超出范围 {lo}..{hi}"
+            return None
+    else:
+        def check(v):
+            if not isinstance(v, list):
+                return f"{name} 应为长度 {n} 的数组，实际为 {type(v).__name__}"
+            if len(v) != n:
+                return f"{name} 长度应为 {n}，实际为 {len(v)}（注意 9 点/19 点数据不要混用）"
+            for i, x in enumerate(v):
+                if not ok(x):
+                    return f"{name}[{i}] 应为{tname}，实际为 {x!r}"
+                if not in_range(x):
+                    return f"{name}[{i}]={x} 超出范围 {lo}..{hi}"
+            return None
+    return check
+
+class RequestValidator:
+    def __init__(self, templates: List[Dict[str, Any]], doc_path: str = ""):
+        doc = load_param_rules_from_doc(doc_path) if doc_path else {}
+        params_of = {t["function"]: t.get("params", []) for t in DEFAULT_TEMPLATES["templates"]}
+        for t in templates:
+            if t.get("function"):
+                params_of[t["function"]] = t.get("params", [])
+        self._checks: Dict[str, tuple] = {}
+        for fn, params in params_of.items():
+            rules = doc.get(fn, {})
+            checks = []
+            for p in params:
+                rule, base = rules.get(p), PARAM_RULES.get(p)
+                if rule and base and rule[2] is None and rule[3] is None:
+                    rule = rule[:2] + base[2:]  # 文档没写范围的，沿用内置表
+                rule = rule or base
+                checks.append((p, _compile_param_check(p, rule) if rule else None))
+            levels = "startLevel" in params and "finishLevel" in params
+            by_ch = tuple(p for p in params if p in CHANNEL_LEN_PARAMS) if "channels" in params else ()
+            self._checks[fn] = (tuple(checks), levels, by_ch)
+
+    def validate(self, function: str, params: Dict[str, Any]) -> List[str]:
+        """返回错误列表（空列表表示通过）；不认识的函数不校验"""
+        compiled = self._checks.get(function)
+        if compiled is None:
+            return []
+        checks, levels, by_ch = compiled
+        errors = []
+        for p, check in checks:
+            if p not in params:
+                errors.append(f"缺少参数 {p}")
+                continue
+            if check is not None:
+                e = check(params[p])
+                if e:
+                    errors.append(e)
+        if errors:
+            return errors
+        if levels:
+            s, f = params["startLevel"], params["finishLevel"]
+            if f <= s:
+                errors.append(f"finishLevel({f}) 必须大于 startLevel({s})")
+            elif f - s >= IO_LEVEL_SPAN:
+                errors.append(f"finishLevel-startLevel={f - s}，必须小于 {IO_LEVEL_SPAN}（可将 finishLevel 调到 {s + IO_LEVEL_SPAN - 1} 以下）")
+        for p in by_ch:
+            op, need, text = CHANNEL_LEN_PARAMS[p]
+            v, n = params[p], need(params["channels"])
+            if not isinstance(v, list):
+                errors.append(f"{p} 应为数组"); continue
+            if (op == "==" and len(v) != n) or (op == ">=" and len(v) < n):
+                rel = "应为" if op == "==" else "至少为"
+                errors.append(f"{p} 长度{rel} {text}={n}，实际为 {len(v)}（channels={params['channels']}）")
+        return errors
+
+    def check(self, body: Dict[str, Any]):
+        function = body.get("function")
+        params = body.get("input_parameters")
+        if not isinstance(params, dict):
+            raise RequestValidationError(f"{function}: input_parameters 必须是 JSON 对象")
+        errors = self.validate(function, params)
+        if errors:
+            raise RequestValidationError(f"{function} 参数校验失败（未发送）:\n- " + "\n- ".join(errors))
+
+# ==============================
+# Chrome trace_event 追踪（默认关闭；开启后每个 span 记一条 "X" 事件，可用 Perfetto / chrome://tracing 打开）
+# - 环境变量 NAL_TRACE=1 启动即开启，退出时写文件；也可在菜单“诊断”里开关
+# - 关闭时 begin() 返回 None，调用点只多一次属性判断
+# ==============================
+TRACE_ENV = "NAL_TRACE"
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL_SPAN = _NullSpan()
+
+class _Span:
+    __slots__ = ("tracer", "name", "cat", "args", "t0")
+
+    def __init__(self, tracer, name, cat, args):
+        self.tracer, self.name, self.cat, self.args = tracer, name, cat, args
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.tracer.complete(self.name, self.cat, self.t0, **self.args)
+        return False
+
+class Tracer:
+    def __init__(self):
+        self.enabled = False
+        self._events: List[Dict[str, Any]] = []
+        self._threads: Dict[int, str] = {}
+        self._origin = time.perf_counter()
+
+    def start(self):
+        self._events = []
+        self._threads = {}
+        self._origin = time.perf_counter()
+        self.enabled = True
+
+    def begin(self) -> Optional[float]:
+        return time.perf_counter() if self.enabled else None
+
+    def span(self, name: str, cat: str = "app", **args):
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, cat, args)
+
+    def complete(self, name: str, cat: str, t0: Optional[float], **args):
+        if t0 is None or not self.enabled:
+            return
+        t1 = time.perf_counter()
+        th = threading.current_thread()
+        self._threads.setdefault(th.ident, th.name)
+        ev = {"name": name, "cat": cat, "ph": "X", "pid": os.getpid(), "tid": th.ident,
+              "ts": (t0 - self._origin) * 1e6, "dur": (t1 - t0) * 1e6}
+        if args:
+            ev["args"] = args
+        self._events.append(ev)  # list.append 在 GIL 下是原子的
+
+    def stop(self, path: str) -> int:
+        # 停止并写出 JSON；返回事件数
+        self.enabled = False
+        events = list(self._events)
+        meta = [{"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": tid, "args": {"name": name}}
+                for tid, name in self._threads.items()]
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": meta + events, "displayTimeUnit": "ms"}, f)
+        return len(events)
+
+TRACER = Tracer()
+
+
+# ==============================
+# UI 事件循环卡顿检测（看门狗线程）
+# - 主线程心跳定时器每次触发调用 beat()；看门狗线程轮询心跳间隔
+# - 超过阈值即视为卡顿，期间反复采样主线程调用栈（sys._current_frames）
+# - 心跳恢复后把卡顿时长 + 出现最多的调用栈写入日志文件
+# ==============================
+STALL_THRESHOLD_S = 0.5
+STALL_THRESHOLD_ENV = "NAL_STALL_MS"
+STALL_LOG_FILE = "ui_stalls.log"
+STALL_MAX_STACKS = 5
+
+class StallWatchdog:
+    def __init__(self, interval: float, threshold: float = STALL_THRESHOLD_S,
+                 log_path: Optional[str] = STALL_LOG_FILE, on_stall=None):
+        self.interval = interval              # 心跳定时器周期，延迟从中扣除
+        self.threshold = threshold
+        self.log_path = log_path
+        self.on_stall = on_stall              # on_stall(duration_s, stack_text)，在看门狗线程回调
+        self.main_ident = threading.main_thread().ident
+        self.stalls = 0
+        self.max_stall = 0.0
+        self._last = time.perf_counter()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def beat(self):
+        self._last = time.perf_counter()
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._last = time.perf_counter()
+        self._thread = threading.Thread(target=self._loop, name="ui-watchdog", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread = None
+
+    def _sample(self) -> Optional[str]:
+        frame = sys._current_frames().get(self.main_ident)
+        if frame is None:
+            return None
+        return "".join(traceback.format_stack(frame))
+
+    def _loop(self):
+        poll = max(0.02, self.threshold / 4)
+        stall_beat = None                     # 当前卡顿对应的最后一次心跳时间
+        stacks: Dict[str, int] = {}
+        while not self._stop.wait(poll):
+            last = self._last
+            lag = time.perf_counter() - last - self.interval
+            if stall_beat is not None and last != stall_beat:
+                # 心跳已恢复：卡顿时长 = 两次心跳间隔 - 定时器周期
+                self._report(last - stall_beat - self.interval, stacks)
+                stall_beat, stacks = None, {}
+                continue
+            if lag < self.threshold:
+                continue
+            stall_beat = last
+            st = self._sample()
+            if st is not None and (st in stacks or len(stacks) < STALL_MAX_STACKS):
+                stacks[st] = stacks.get(st, 0) + 1
+
+    def _report(self, duration: float, stacks: Dict[str, int]):
+        self.stalls += 1
+        self.max_stall = max(self.max_stall, duration)
+        samples = sum(stacks.values())
+        if stacks:
+            stack, hits = max(stacks.items(), key=lambda kv: kv[1])
+            text = f"{stack}(命中 {hits}/{samples} 次采样，共 {len(stacks)} 种调用栈)\n"
+        else:
+            text = "(未采样到主线程调用栈)\n"
+        head = f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] UI 卡顿(stall) {duration * 1000:.0f} ms"
+        print(head)
+        if self.log_path:
+            try:
+                with open(self.log_path, "a", encoding="utf-8") as f:
+                    f.write(head + "\n" + text + "\n")
+            except OSError as e:
+                print("stall log write failed:", e)
+        if TRACER.enabled:
+            TRACER.complete("ui stall", "stall", time.perf_counter() - duration, ms=round(duration * 1000))
+        if self.on_stall is not None:
+            try:
+                self.on_stall(duration, text)
+            except Exception as e:
+                print("on_stall error:", e)
+
+# ==============================
+# 后台任务执行器（MainWindow 持有一份，替代各按钮里临时起的 threading.Thread）
+# - 全局最多 max_workers 个任务同时运行
+# - 同一 lane（一般是一个页签）内的任务严格串行，保证 DLL 有状态调用序列的先后顺序
+# - 同一 lane 中同名且还在排队的任务不重复入队（连点按钮不会堆积）
+# - latest_wins=True 时，同名的旧任务被取消（排队的直接丢弃，运行中的在下一次请求前停下）
+# - 任务函数在工作线程里用 current_token() 取得自己的取消令牌；NALClient 发送前也会检查
+# ==============================
+MAX_JOB_WORKERS = 2
+
+class Cancelled(Exception):
+    pass
+
+class CancelToken:
+    __slots__ = ("_ev",)
+
+    def __init__(self):
+        self._ev = threading.Event()
+
+    def cancel(self):
+        self._ev.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._ev.is_set()
+
+    def raise_if_cancelled(self):
+        if self._ev.is_set():
+            raise Cancelled("已取消(Cancelled)")
+
+_job_local = threading.local()
+
+def current_token() -> Optional[CancelToken]:
+    # 当前工作线程正在执行的任务的取消令牌；不在任务中时为 None
+    return getattr(_job_local, "token", None)
+
+class Job:
+    QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+    __slots__ = ("id", "lane", "name", "key", "fn", "on_done", "token", "state", "error", "t_submit", "t_start", "t_end")
+
+    def __init__(self, job_id: int, lane: str, name: str, key: Optional[str], fn, on_done=None):
+        self.id = job_id
+        self.lane = lane
+        self.name = name
+        self.key = key
+        self.fn = fn
+        self.on_done = on_done  # 任务结束（含被丢弃）时在工作线程/提交线程回调 on_done(job)
+        self.token = CancelToken()
+        self.state = Job.QUEUED
+        self.error = ""
+        self.t_submit = time.monotonic()
+        self.t_start = 0.0
+        self.t_end = 0.0
+
+def _chain_on_done(first, second):
+    def both(job: Job):
+        try:
+            first(job)
+        finally:
+            second(job)
+    return both
+
+class JobExecutor:
+    def __init__(self, max_workers: int = MAX_JOB_WORKERS, on_change=None):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="nal-job")
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._lanes: Dict[str, deque] = {}     # lane -> 排队中的 Job
+        self._active: Dict[str, Job] = {}      # lane -> 已交给线程池的 Job（等待线程或运行中）
+        self.history: deque = deque(maxlen=50)
+        self.on_change = on_change             # 任意线程回调，无参数
+
+    def submit(self, lane: str, name: str, fn, dedupe: bool = True, latest_wins: bool = False, on_done=None) -> Job:
+        key = name if (dedupe or latest_wins) else None
+        dropped = []
+        with self._lock:
+            q = self._lanes.setdefault(lane, deque())
+            if latest_wins:
+                dropped = [j for j in q if j.key == key]
+                for j in dropped:
+                    q.remove(j)
+                    j.token.cancel()
+                    j.state = Job.CANCELLED
+                act = self._active.get(lane)
+                if act is not None and act.key == key:
+                    act.token.cancel()
+            elif key is not None:
+                for j in q:
+                    if j.key == key:
+                        # 合并到排队中的同名任务：调用方的 on_done 也要在它结束时回调（忙碌标记等靠它收尾）
+                        if on_done is not None:
+                            j.on_done = on_done if j.on_done is None else _chain_on_done(j.on_done, on_done)
+                        return j
+            job = Job(next(self._ids), lane, name, key, fn, on_done)
+            q.append(job)
+            self._pump_locked(lane)
+        for j in dropped:
+            self._done(j)
+        self._notify()
+        return job
+
+    def cancel_lane(self, lane: str):
+        # 取消该 lane 的全部任务（排队的丢弃，运行中的置取消标志）
+        with self._lock:
+            q = self._lanes.get(lane) or deque()
+            dropped = list(q)
+            q.clear()
+            act = self._active.get(lane)
+            if act is not None:
+                act.token.cancel()
+        for j in dropped:
+            j.token.cancel()
+            j.state = Job.CANCELLED
+            self._done(j)
+        self._notify()
+
+    def snapshot(self) -> Dict[str, List[Job]]:
+        with self._lock:
+            active = list(self._active.values())
+            return {
+                Job.RUNNING: [j for j in active if j.state == Job.RUNNING],
+                Job.QUEUED: [j for j in active if j.state == Job.QUEUED] + [j for q in self._lanes.values() for j in q],
+            }
+
+    def shutdown(self):
+        # 排队中的任务丢弃（照常回调 on_done），运行中的置取消标志；不等待它们结束
+        with self._lock:
+            dropped = [j for q in self._lanes.values() for j in q]
+            self._lanes.clear()
+            active = list(self._active.values())
+        for j in active:
+            j.token.cancel()  # 已交给线程池但还没开始的，_run 看到取消标志直接结束并回调
+        for j in dropped:
+            j.token.cancel()
+            j.state = Job.CANCELLED
+            self._done(j)
+        self._pool.shutdown(wait=False)
+
+    def _pump_locked(self, lane: str):
+        if lane in self._active:
+            return
+        q = self._lanes.get(lane)
+        if not q:
+            return
+        job = q.popleft()
+        self._active[lane] = job
+        self._pool.submit(self._run, job)
+
+    def _run(self, job: Job):
+        job.state = Job.RUNNING
+        job.t_start = time.monotonic()
+        _job_local.token = job.token
+        self._notify()
+        try:
+            if not job.token.cancelled:
+                with TRACER.span(job.name, "workflow", lane=job.lane):
+                    job.fn()
+            job.state = Job.CANCELLED if job.token.cancelled else Job.DONE
+        except Cancelled:
+            job.state = Job.CANCELLED
+        except Exception as e:
+            job.state = Job.FAILED
+            job.error = str(e)
+            print(f"job {job.lane}/{job.name} failed:", e)
+        finally:
+            _job_local.token = None
+            job.t_end = time.monotonic()
+            with self._lock:
+                self._active.pop(job.lane, None)
+                self.history.append(job)
+                self._pump_locked(job.lane)
+            self._done(job)
+            self._notify()
+
+    def _done(self, job: Job):
+        if job.on_done is not None:
+            try:
+                job.on_done(job)
+            except Exception as e:
+                print(f"job {job.lane}/{job.name} on_done error:", e)
+
+    def _notify(self):
+        if self.on_change is not None:
+            try:
+                self.on_change()
+            except Exception:
+                pass
+
+# ==============================
+# 调用指标（常开，开销很小）
+# - Histogram：HDR 风格的对数-线性分桶（每 2 倍区间 8 个子桶，相对误差 < 12.5%），桶数组预分配，记录时只做整数加一
+# - 计数器是普通 int，依赖 GIL，不加锁；多线程下极少量丢计数可以接受
+# - 阶段：encode=请求序列化，server=发出请求到收到响应头（含网络往返，即 TTFB），
+#   net=其余传输耗时（建连/发送/读响应体），parse=响应 JSON 解析；IP 直连，没有 DNS 阶段
+# ==============================
+HIST_SUB_BITS = 3
+HIST_BUCKETS = 208  # 覆盖 0 .. 2^27（微秒约 134 s；字节约 128 MB）
+
+class Histogram:
+    __slots__ = ("counts", "count", "total")
+
+    def __init__(self):
+        self.counts = [0] * HIST_BUCKETS
+        self.count = 0
+        self.total = 0
+
+    @staticmethod
+    def bucket_of(v: int) -> int:
+        if v < (2 << HIST_SUB_BITS):
+            return max(0, v)
+        e = v.bit_length() - HIST_SUB_BITS - 1
+        return min(HIST_BUCKETS - 1, (e << HIST_SUB_BITS) + (v >> e))
+
+    @staticmethod
+    def bucket_upper(i: int) -> int:
+        # 桶 i 的上界（不含）
+        if i < (2 << HIST_SUB_BITS):
+            return i + 1
+        e = (i >> HIST_SUB_BITS) - 1
+        m = (i & ((1 << HIST_SUB_BITS) - 1)) + (1 << HIST_SUB_BITS)
+        return (m + 1) << e
+
+    def record(self, v: int):
+        self.counts[Histogram.bucket_of(v)] += 1
+        self.count += 1
+        self.total += v
+
+    def record_s(self, seconds: float):
+        self.record(int(seconds * 1e6))
+
+    def quantile(self, q: float) -> Optional[int]:
+        n = self.count
+        if n <= 0:
+            return None
+        rank = max(1, int(q * n + 0.5))
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= rank:
+                return Histogram.bucket_upper(i)
+        return Histogram.bucket_upper(HIST_BUCKETS - 1)
+
+class FunctionMetrics:
+    PHASES = ("total", "encode", "server", "net", "parse")
+    SIZES = ("req_bytes", "resp_bytes", "req_wire", "resp_wire")  # *_bytes 为编码后正文，*_wire 为压缩后实际传输
+    __slots__ = PHASES + SIZES + ("calls", "errors", "retries", "skipped")
+
+    def __init__(self):
+        for name in FunctionMetrics.PHASES + FunctionMetrics.SIZES:
+            setattr(self, name, Histogram())
+        self.calls = 0    # 成功完成的逻辑调用
+        self.errors = 0   # 最终失败的逻辑调用（含熔断拒绝）
+        self.retries = 0
+        self.skipped = 0  # 服务器已是相同值、未发送的 Set*
+
+    def wire_saving(self) -> Optional[float]:
+        # 压缩节省的传输字节比例（请求+响应）；还没有样本时为 None
+        raw = self.req_bytes.total + self.resp_bytes.total
+        if not self.req_wire.count or not raw:
+            return None
+        return 1.0 - (self.req_wire.total + self.resp_wire.total) / raw
+
+class ClientMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()  # 只在第一次见到某函数时使用
+        self.functions: Dict[str, FunctionMetrics] = {}
+        self.started = time.monotonic()
+
+    def function(self, name: str) -> FunctionMetrics:
+        fm = self.functions.get(name)
+        if fm is None:
+            with self._lock:
+                fm = self.functions.setdefault(name, FunctionMetrics())
+        return fm
+
+# ==============================
+# 超时/重试
+# - 每个函数的超时 = 近期延迟 p99 × 系数（样本不足时用 NALClient.timeout），限制在 [MIN, MAX]
+# - 网络错误/超时/5xx 按指数退避 + 全抖动重试；Set* 写入的是绝对值，重发同一请求是安全的
+# - Set* 重试仍失败时记为“状态未知”，下一次请求前先补发，保证 DLL 状态与客户端一致
+# - DLL 状态镜像：记下每个 Set* 最近一次成功写入的参数；参数相同的 Set* 不再发送，直接返回上次的响应。
+#   重新连接/切换服务器/断开、网络级失败（服务器可能已重启）、健康探测失败、dllVersion 变化时整体作废
+# - 验配事务：DLL 是全局状态，多步流程（设 selection -> 算 CT -> 取增益）中间不能插入别的有状态调用。
+#   with client.session(cfg) as s: 持有本服务器的事务锁，先补齐 cfg 与镜像不同的 Set*，再执行 s.call(...)；
+#   事务外的单个有状态调用也要拿同一把锁（等事务结束），只读查询（READ_ONLY_FUNCTIONS）不拿锁、可并行
+# ==============================
+TIMEOUT_P99_FACTOR = 3.0
+TIMEOUT_MIN = 1.0
+TIMEOUT_MAX = 15.0
+TIMEOUT_MIN_SAMPLES = 20
+RETRY_MAX_ATTEMPTS = 3
+RETRY_BASE_DELAY = 0.2
+RETRY_MAX_DELAY = 2.0
+RETRY_STATUS = {502, 503, 504}
+WIRE_FALLBACK_STATUS = {400, 415}  # 二进制/压缩的请求被拒：退回未压缩 JSON 重发一次
+COMPRESS_MIN_BYTES = 512  # 小于该大小的请求体不压缩（Set* 等小请求压缩后反而更大）
+COMPRESS_LEVEL = 5
+
+def is_set_function(function: str) -> bool:
+    return function[:3].lower() == "set"
+
+# 结果只取决于参数、不读也不改 DLL 状态的查询
+READ_ONLY_FUNCTIONS = frozenset({"dllVersion", "GetTubing_NL2", "GetTubing9_NL2", "GetVentOut_NL2",
+                                 "GetVentOut9_NL2", "GetMLE"})
+# 事务开始时按 cfg 补齐的 DLL 状态（与主页 Step 1-5 相同）
+SESSION_STATE_SETS = ("SetAdultChild", "SetExperience", "SetCompSpeed", "SetTonalLanguage", "SetGender")
+# 写同一个 DLL 槽位的 Set*（19 点 / 9 点两种写法）：镜像和结果未知表按槽位记，后写的覆盖先写的
+DLL_STATE_SLOTS = {"SetREDDindiv9": "SetREDDindiv", "SetREURindiv9": "SetREURindiv",
+                   "SetRECDh_indiv9_NL2": "SetRECDh_indiv_NL2", "SetRECDt_indiv9_NL2": "SetRECDt_indiv_NL2"}
+
+def dll_slot(function: str) -> str:
+    return DLL_STATE_SLOTS.get(function, function)
+
+class LatencyStats:
+    # 每个函数保留最近 maxlen 次耗时（秒）
+    def __init__(self, maxlen: int = 200):
+        self._lock = threading.Lock()
+        self._maxlen = maxlen
+        self._samples: Dict[str, deque] = {}
+
+    def add(self, function: str, seconds: float):
+        with self._lock:
+            d = self._samples.get(function)
+            if d is None:
+                d = self._samples[function] = deque(maxlen=self._maxlen)
+            d.append(seconds)
+
+    def quantile(self, function: str, q: float, min_samples: int = 1) -> Optional[float]:
+        with self._lock:
+            d = self._samples.get(function)
+            if not d or len(d) < min_samples:
+                return None
+            xs = sorted(d)
+        return xs[min(len(xs) - 1, int(q * len(xs)))]
+
+# ==============================
+# 熔断器 + 健康检查
+# - 连续 BREAKER_THRESHOLD 次网络级失败后熔断：BREAKER_COOLDOWN 秒内请求直接失败（毫秒级），不再逐个等超时
+# - 冷却结束后半开：只放行一个试探请求，成功即恢复，失败重新熔断
+# - HealthMonitor 在后台周期性发 dllVersion 探测；熔断期间也会探测，服务器恢复后自动闭合
+# ==============================
+BREAKER_THRESHOLD = 3
+BREAKER_COOLDOWN = 5.0
+HEALTH_INTERVAL = 5.0
+HEALTH_PROBE_TIMEOUT = 1.5
+
+class CircuitOpenError(RequestException):
+    pass
+
+class CircuitBreaker:
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, threshold: int = BREAKER_THRESHOLD, cooldown: float = BREAKER_COOLDOWN, on_change=None):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.on_change = on_change  # 状态变化时在任意线程回调 on_change(state)
+        self._lock = threading.Lock()
+        self.state = CircuitBreaker.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial = False
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == CircuitBreaker.CLOSED:
+                return True
+            if self.state == CircuitBreaker.OPEN:
+                if time.monotonic() - self._opened_at < self.cooldown:
+                    return False
+                self._set_locked(CircuitBreaker.HALF_OPEN)
+            if self._trial:
+                return False
+            self._trial = True
+            return True
+
+    def retry_after(self) -> float:
+        with self._lock:
+            if self.state != CircuitBreaker.OPEN:
+                return 0.0
+            return max(0.0, self.cooldown - (time.monotonic() - self._opened_at))
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._trial = False
+            self._set_locked(CircuitBreaker.CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial = False
+            if self.state == CircuitBreaker.HALF_OPEN or self._failures >= self.threshold:
+                self._opened_at = time.monotonic()
+                self._set_locked(CircuitBreaker.OPEN)
+
+    def reset(self):
+        self.record_success()
+
+    def _set_locked(self, state: str):
+        if state == self.state:
+            return
+        self.state = state
+        if self.on_change is not None:
+            try:
+                self.on_change(state)
+            except Exception:
+                pass
+
+class HealthMonitor:
+    # 后台线程：client.connected 为 True 时每 interval 秒探测一次，结果回调 on_result(ok, latency_s)
+    def __init__(self, client: "NALClient", interval: float = HEALTH_INTERVAL, on_result=None):
+        self.client = client
+        self.interval = interval
+        self.on_result = on_result
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="nal-health", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def probe_now(self):
+        self._wake.set()
+
+    def _loop(self):
+        while not self._stop.is_set():
+            if self.client.connected:
+                latency = self.client.probe()
+                if self.on_result is not None:
+                    try:
+                        self.on_result(latency is not None, latency)
+                    except Exception:
+                        pass
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+# ==============================
+# 服务器能力（connect() 时握手一次并缓存）
+# - dllVersion：所有服务器都支持；请求带 Accept: application/x-msgpack，按响应的 Content-Type 判断能否用二进制
+# - capabilities：可选；替身服务器 / 本机代理会回答编码、压缩、批量、并发数，手机端 App 回"未知函数"时按保守值处理
+# - 传输特性据此自动选择：编码、请求体压缩、Set* 批量发送、代理的并行转发数；namespace 用来隔离不同服务器/DLL 版本的缓存
+# ==============================
+CAPABILITIES_FUNCTION = "capabilities"
+BATCH_METRIC_NAME = "(batch)"
+
+@dataclass
+class ServerProfile:
+    server: str = ""                 # capabilities 给出的服务器名；未知时为 host:port
+    dll_version: Optional[tuple] = None
+    encodings: List[str] = field(default_factory=lambda: [JSON_TYPE])
+    compression: List[str] = field(default_factory=list)  # 接受的请求体 Content-Encoding
+    batch: bool = False              # 接受 JSON 数组批量请求（按顺序执行）
+    max_concurrency: int = 1         # 同时计算的请求数；0 = 不限
+    advertised: bool = False         # False：服务器不认识 capabilities，以上为推断/保守值
+
+    @property
+    def namespace(self) -> str:
+        version = ".".join(str(x) for x in self.dll_version) if self.dll_version else "?"
+        return f"{self.server}@{version}"
+
+    def describe(self) -> str:
+        parts = [f"DLL {'.'.join(str(x) for x in self.dll_version)}" if self.dll_version else "DLL ?"]
+        if MSGPACK_TYPE in self.encodings:
+            parts.append("msgpack")
+        parts += self.compression
+        if self.batch:
+            parts.append("batch")
+        if self.advertised:
+            parts.append(f"并发(concurrency) {self.max_concurrency or '∞'}")
+        return " · ".join(parts)
+
+class NALClient:
+    def __init__(self):
+        self.ip = ""
+        self.port = 8080
+        self.path = "/api/nal2/process"
+        self.sequence_num = 0
+        self.timeout = 3.0  # 默认超时：某函数样本不足 TIMEOUT_MIN_SAMPLES 时使用
+        self.connected = False
+        self._seq_lock = threading.Lock()
+        self._local = threading.local()  # requests.Session 不保证线程安全：每个工作线程一个
+        self.validator: Optional[RequestValidator] = None  # 设置后每次发送前校验参数
+        self.latency = LatencyStats()
+        self._set_lock = threading.RLock()
+        self.unknown_sets: Dict[str, Dict[str, Any]] = {}  # DLL 槽位 -> 结果未知的 Set* 请求体（按发生顺序补发）
+        self.mirror_sets = True  # False 时每个 Set* 都照常发送
+        self.dll_state: Dict[str, tuple] = {}  # DLL 槽位 -> (Set* 函数名, 参数 JSON, 上次响应)，与服务器当前 DLL 状态一致
+        self.dll_version: Optional[tuple] = None
+        self._state_gen = 0  # 每次作废镜像 +1；请求发出后镜像被作废过，响应就不再记入
+        self._txn_lock = threading.RLock()  # 有状态调用与验配事务共用；同一线程可重入
+        self._builder: Optional[RequestBuilder] = None
+        self.breaker = CircuitBreaker()
+        self.metrics = ClientMetrics()
+        self.recorder: Optional["SessionRecorder"] = None  # 设置后每次请求/响应追加到 JSONL 会话文件
+        self.client_id = uuid.uuid4().hex  # 经本机代理（--proxy）访问时用来区分会话
+        self.offer_binary = True  # connect() 时提议 MessagePack；服务器不支持则保持 JSON
+        self.wire = JSON_TYPE
+        self.compress_requests = True  # 服务器回过压缩响应后，>= compress_min 的请求体也压缩
+        self.compress_min = COMPRESS_MIN_BYTES
+        self.request_encoding: Optional[str] = ""  # 请求体的 Content-Encoding；"" = 暂不压缩，None = 本次连接服务器拒收过压缩请求
+        self.profile: Optional[ServerProfile] = None  # connect() 握手得到的服务器能力
+
+    def set_server(self, ip: str, port: int, path: str):
+        self.ip = ip.strip()
+        self.port = int(port)
+        self.path = path.strip() if path.strip() else "/"
+        self.invalidate_dll_state()
+
+    def url(self) -> str:
+        path = self.path
+        if not path.startswith("/"):
+            path = "/" + path
+        return f"http://{self.ip}:{self.port}{path}"
+
+    def connect(self) -> bool:
+        self.invalidate_dll_state()
+        self.wire = JSON_TYPE
+        self.request_encoding = ""
+        self.profile = None
+        try:
+            with socket.create_connection((self.ip, self.port), timeout=3.0):
+                self.connected = True
+                self.breaker.reset()
+        except OSError:
+            self.connected = False
+            return False
+        self.profile = self._handshake()
+        if self.offer_binary and MSGPACK_TYPE in self.profile.encodings:
+            self.wire = MSGPACK_TYPE
+        if self.compress_requests:
+            self.request_encoding = next((e for e in ("gzip", "deflate") if e in self.profile.compression), "")
+        return True
+
+    def _handshake_call(self, function: str, accept: str) -> Tuple[Optional[Dict[str, Any]], str]:
+        # 绕过熔断/重试：握手失败不影响连接本身，只是按保守能力工作
+        body = {"function": function, "input_parameters": {}, "sequence_num": self.next_sequence()}
+        try:
+            resp = self.http.post(self.url(), headers={"Content-Type": JSON_TYPE, "Accept": accept},
+                                  data=json.dumps(body), timeout=HEALTH_PROBE_TIMEOUT)
+            resp.raise_for_status()
+            out = self._decode(resp)
+        except (RequestException, ValueError):
+            return None, ""
+        return (out if isinstance(out, dict) else None), resp.headers.get("Content-Type", "")
+
+    def _handshake(self) -> ServerProfile:
+        profile = ServerProfile(server=f"{self.ip}:{self.port}")
+        accept = f"{MSGPACK_TYPE}, {JSON_TYPE};q=0.5" if self.offer_binary else JSON_TYPE
+        out, ctype = self._handshake_call("dllVersion", accept)
+        if out is None:
+            return profile
+        self._note_dll_version(out)
+        profile.dll_version = self.dll_version
+        if ctype.startswith(MSGPACK_TYPE):
+            profile.encodings.append(MSGPACK_TYPE)  # 不认识 capabilities 的服务器也可能按 Accept 协商
+        out, _ = self._handshake_call(CAPABILITIES_FUNCTION, JSON_TYPE)
+        caps = out.get("output_parameters") if out is not None else None
+        if not isinstance(caps, dict) or "error" in caps:
+            return profile
+        profile.advertised = True
+        profile.server = str(caps.get("server") or profile.server)
+        profile.encodings = [JSON_TYPE] + [MSGPACK_TYPE for e in caps.get("encodings") or () if e == MSGPACK_TYPE]
+        profile.compression = [e for e in caps.get("compression") or () if e in ("gzip", "deflate")]
+        profile.batch = bool(caps.get("batch"))
+        profile.max_concurrency = int(caps.get("max_concurrency") or 0)
+        return profile
+
+    def disconnect(self):
+        self.connected = False
+        self.invalidate_dll_state()
+
+    # ---- DLL 状态镜像 ----
+    def invalidate_dll_state(self):
+        self._state_gen += 1
+        self.dll_state = {}
+
+    @staticmethod
+    def _state_key(body: Dict[str, Any]) -> str:
+        params = body.get("input_parameters")
+        if isinstance(params, BuiltParams) and params.json is not None:
+            return params.json
+        return json.dumps(params, sort_keys=True)
+
+    def _mirror_hit(self, function: str, body: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        # 服务器上这个槽位最后一次就是用同一函数、同一参数写的：返回当时的响应
+        hit = self.dll_state.get(dll_slot(function))
+        if hit is None or hit[0] != function or hit[1] != self._state_key(body):
+            return None
+        return hit[2]
+
+    def _forget_set(self, function: str, body: Optional[Dict[str, Any]] = None):
+        # 槽位状态不再可知；给出 body 时记为结果未知，下次有状态调用前补发
+        slot = dll_slot(function)
+        self.dll_state.pop(slot, None)
+        self.unknown_sets.pop(slot, None)
+        if body is not None:
+            self.unknown_sets[slot] = dict(body)
+
+    def _remember_set(self, function: str, body: Dict[str, Any], out: Any, gen: int):
+        outp = out.get("output_parameters") if isinstance(out, dict) else None
+        if gen != self._state_gen or (isinstance(outp, dict) and "error" in outp):
+            self.dll_state.pop(dll_slot(function), None)
+            return
+        self.dll_state[dll_slot(function)] = (function, self._state_key(body), out)
+
+    def _note_dll_version(self, out: Any):
+        # DLL 升级或换了一台服务器：此前记下的状态全部作废
+        outp = out.get("output_parameters") if isinstance(out, dict) else None
+        if not isinstance(outp, dict) or "major" not in outp:
+            return
+        version = (outp.get("major"), outp.get("minor"))
+        if self.dll_version is not None and version != self.dll_version:
+            self.invalidate_dll_state()
+        self.dll_version = version
+
+    @property
+    def http(self) -> requests.Session:
+        s = getattr(self._local, "session", None)
+        if s is None:
+            s = self._local.session = requests.Session()
+        return s
+
+    def session(self, state: Optional[AppConfig] = None, builder: Optional[RequestBuilder] = None,
+                sets: tuple = SESSION_STATE_SETS) -> "FittingSession":
+        # state 为 None 时只加锁、不补 Set*（界面流程：DLL 状态由用户在主页设置）
+        if builder is None:
+            if self._builder is None:
+                self._builder = RequestBuilder([])
+            builder = self._builder
+        return FittingSession(self, state, builder, sets)
+
+    def next_sequence(self) -> int:
+        with self._seq_lock:
+            n = self.sequence_num
+            self.sequence_num += 1
+            return n
+
+    def timeout_for(self, function: str) -> float:
+        p99 = self.latency.quantile(function, 0.99, TIMEOUT_MIN_SAMPLES)
+        if p99 is None:
+            return self.timeout
+        return min(TIMEOUT_MAX, max(TIMEOUT_MIN, p99 * TIMEOUT_P99_FACTOR))
+
+    def post_json(self, body: Dict[str, Any], skip_redundant: bool = True) -> Dict[str, Any]:
+        # skip_redundant=False：即使服务器已是相同值也照发（函数测试页手动发送时用）
+        token = current_token()
+        if token is not None:
+            token.raise_if_cancelled()
+        if self.validator is not None:
+            self.validator.check(body)
+        function = body.get("function", "")
+        if function in READ_ONLY_FUNCTIONS:
+            out = self._post(body)
+            if function == "dllVersion":
+                self._note_dll_version(out)
+            return out
+        with self._txn_lock:
+            self._reapply_unknown_sets(skip=function)
+            if not is_set_function(function):
+                return self._post(body)
+            return self._post_set(function, body, skip_redundant)
+
+    def _post_set(self, function: str, body: Dict[str, Any], skip_redundant: bool) -> Dict[str, Any]:
+        with self._set_lock:
+            if skip_redundant and self.mirror_sets:
+                hit = self._mirror_hit(function, body)
+                if hit is not None:
+                    self.metrics.function(function).skipped += 1
+                    return dict(hit)
+            gen = self._state_gen
+            try:
+                out = self._post(body)
+            except RequestException:
+                self._forget_set(function, body)
+                raise
+            self.unknown_sets.pop(dll_slot(function), None)
+            self._remember_set(function, body, out, gen)
+            return out
+
+    def apply_sets(self, bodies: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        # 一组 Set*：先按镜像去掉服务器已有的，剩下的在服务器支持批量（profile.batch）时一次往返发出；按顺序返回各自的响应
+        token = current_token()
+        if token is not None:
+            token.raise_if_cancelled()
+        with self._txn_lock:
+            self._reapply_unknown_sets()
+            results: List[Optional[Dict[str, Any]]] = []
+            pending = []
+            written = set()  # 本组里前面已要发出的槽位：镜像对它们已不再准确
+            for body in bodies:
+                if self.validator is not None:
+                    self.validator.check(body)
+                function = body.get("function", "")
+                hit = self._mirror_hit(function, body) if self.mirror_sets and dll_slot(function) not in written else None
+                if hit is not None:
+                    self.metrics.function(function).skipped += 1
+                    results.append(dict(hit))
+                else:
+                    results.append(None)
+                    pending.append(body)
+                    written.add(dll_slot(function))
+            if len(pending) < 2 or self.profile is None or not self.profile.batch:
+                outs = iter([self.post_json(body, skip_redundant=False) for body in pending])
+                return [r if r is not None else next(outs) for r in results]
+            with self._set_lock:
+                gen = self._state_gen
+                try:
+                    outs = self._post_batch(pending)
+                except RequestException:
+                    for body in pending:
+                        self._forget_set(body.get("function", ""), body)
+                    raise
+                for body, out in zip(pending, outs):
+                    self._remember_set(body.get("function", ""), body, out, gen)
+            outs = iter(outs)
+            return [r if r is not None else next(outs) for r in results]
+
+    def _post_batch(self, bodies: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        batch = []
+        for body in bodies:
+            body = dict(body)
+            body["sequence_num"] = self.next_sequence()
+            batch.append(body)
+        fm = self.metrics.function(BATCH_METRIC_NAME)
+        t_start = time.perf_counter()
+        wire = self.wire
+        data = packb(batch) if wire == MSGPACK_TYPE else json.dumps(batch)
+        fm.req_bytes.record(len(data))
+        data, encoding = self._compress(data)
+        fm.encode.record_s(time.perf_counter() - t_start)
+        try:
+            outs = self._post_attempts(BATCH_METRIC_NAME, data, wire, encoding, fm, t_start)
+        except HTTPError as e:
+            if e.response is None or e.response.status_code not in WIRE_FALLBACK_STATUS:
+                fm.errors += 1
+                raise
+            self.profile.batch = False  # 服务器不再接受批量：本次连接改为逐个发送
+            return [self._post(body) for body in bodies]
+        except Exception:
+            fm.errors += 1
+            raise
+        if not isinstance(outs, list) or len(outs) != len(batch):
+            fm.errors += 1
+            raise RequestException(f"批量响应条数不符: 发出 {len(batch)} 条")
+        rec = self.recorder
+        if rec is not None:
+            for body, out in zip(batch, outs):
+                rec.record(body, out, None, t_start, getattr(self._local, "server_s", None))
+        return outs
+
+    def _reapply_unknown_sets(self, skip: str = ""):
+        # 补发结果未知的 Set*；本次请求写的是同一个槽位时由它覆盖，不再补发
+        if not self.unknown_sets:
+            return
+        with self._set_lock:
+            for slot, body in list(self.unknown_sets.items()):
+                if slot == dll_slot(skip):
+                    continue
+                function = body.get("function", "")
+                gen = self._state_gen
+                try:
+                    out = self._post(body)
+                except RequestException as e:
+                    raise RequestException(f"{function} 上次结果未知，补发失败: {e}") from e
+                self.unknown_sets.pop(slot, None)
+                self._remember_set(function, body, out, gen)
+
+    def _post(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        # 同一逻辑请求的重试沿用同一个 sequence_num
+        body = dict(body)
+        body["sequence_num"] = self.next_sequence()
+        function = body.get("function", "")
+        fm = self.metrics.function(function)
+        t_start = time.perf_counter()
+        wire = self.wire
+        data = self._encode(body, wire)
+        fm.req_bytes.record(len(data))
+        data, encoding = self._compress(data)
+        fm.encode.record_s(time.perf_counter() - t_start)
+        rec = self.recorder
+        try:
+            try:
+                out = self._post_attempts(function, data, wire, encoding, fm, t_start)
+            except HTTPError as e:
+                if (wire == JSON_TYPE and not encoding) or e.response is None or e.response.status_code not in WIRE_FALLBACK_STATUS:
+                    raise
+                # 服务器不接受二进制或压缩的请求体（例如换了 App 版本）：本次及以后都发未压缩的 JSON
+                self.wire = JSON_TYPE
+                if encoding:
+                    self.request_encoding = None
+                out = self._post_attempts(function, self._encode(body, JSON_TYPE), JSON_TYPE, "", fm, t_start)
+        except Exception as e:
+            fm.errors += 1
+            if rec is not None:
+                rec.record(body, None, e, t_start, None)
+            raise
+        if rec is not None:
+            rec.record(body, out, None, t_start, getattr(self._local, "server_s", None))
+        return out
+
+    def _post_attempts(self, function: str, data, wire: str, encoding: str, fm: FunctionMetrics,
+                       t_start: float) -> Dict[str, Any]:
+        headers = {"Content-Type": wire, "Accept": wire, "Accept-Encoding": "gzip, deflate",
+                   PROXY_SESSION_HEADER: self.client_id}
+        if encoding:
+            headers["Content-Encoding"] = encoding
+        for attempt in range(1, RETRY_MAX_ATTEMPTS + 1):
+            if not self.breaker.allow():
+                raise CircuitOpenError(f"{function}: 服务器不可用（已熔断，{self.breaker.retry_after():.1f}s 后自动重试连接）")
+            timeout = self.timeout_for(function)
+            t0 = time.perf_counter()
+            # 本次尝试计入熔断器的结果：True = 服务器有应答；None/False = 失败。allow() 之后的每个出口都在 finally 里记一次，
+            # 否则半开状态的试探请求（_trial）不会被释放
+            answered: Optional[bool] = None
+            try:
+                with TRACER.span(function, "request", attempt=attempt, bytes=len(data)):
+                    resp = self.http.post(self.url(), headers=headers, data=data, timeout=timeout)
+                t1 = time.perf_counter()
+                answered = resp.status_code not in RETRY_STATUS
+                if not answered:
+                    resp.raise_for_status()
+                self.latency.add(function, t1 - t0)
+                resp.raise_for_status()  # 其它 4xx/5xx：服务器有应答，熔断按成功计，不重试
+                out = self._decode(resp)
+                t2 = time.perf_counter()
+                TRACER.complete("parse " + function, "parse", t1)
+                server = self._local.server_s = resp.elapsed.total_seconds()
+                fm.server.record_s(server)
+                fm.net.record_s(max(0.0, t1 - t0 - server))
+                fm.parse.record_s(t2 - t1)
+                fm.total.record_s(t2 - t_start)
+                fm.resp_bytes.record(len(resp.content))
+                fm.req_wire.record(len(data))
+                fm.resp_wire.record(int(resp.headers.get("Content-Length") or len(resp.content)))
+                self._note_encoding(resp)
+                fm.calls += 1
+                return out
+            except (ConnectionError, Timeout, HTTPError) as e:
+                if isinstance(e, Timeout):
+                    self.latency.add(function, timeout)  # 超时也计入样本，让超时自适应放宽
+                elif isinstance(e, HTTPError) and answered:
+                    raise
+                self.invalidate_dll_state()
+                if attempt >= RETRY_MAX_ATTEMPTS:
+                    raise
+            finally:
+                if answered:
+                    self.breaker.record_success()
+                else:
+                    self.breaker.record_failure()
+            fm.retries += 1
+            delay = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * (2 ** (attempt - 1)))
+            time.sleep(random.uniform(0, delay))
+            token = current_token()
+            if token is not None:
+                token.raise_if_cancelled()
+        raise RequestException(f"{function}: 重试次数用尽")
+
+    def probe(self, timeout: float = HEALTH_PROBE_TIMEOUT) -> Optional[float]:
+        # 健康检查：绕过熔断/重试直接发一次 dllVersion，结果计入熔断器；成功返回耗时（秒）
+        body = {"function": "dllVersion", "input_parameters": {}, "sequence_num": self.next_sequence()}
+        t0 = time.perf_counter()
+        try:
+            resp = self.http.post(self.url(), headers={"Content-Type": "application/json"},
+                                     data=json.dumps(body), timeout=timeout)
+            resp.raise_for_status()
+            out = self._decode(resp)
+        except (RequestException, ValueError):
+            self.breaker.record_failure()
+            self.invalidate_dll_state()
+            return None
+        self.breaker.record_success()
+        self._note_dll_version(out)
+        return time.perf_counter() - t0
+
+    def _note_encoding(self, resp: requests.Response):
+        # 服务器回过 gzip/deflate 响应，说明它认识 Content-Encoding：之后较大的请求体也用同一种压缩
+        if self.request_encoding != "" or not self.compress_requests:
+            return
+        enc = resp.headers.get("Content-Encoding", "").lower()
+        if enc in ("gzip", "deflate"):
+            self.request_encoding = enc
+
+    def _compress(self, data) -> Tuple[Any, str]:
+        encoding = self.request_encoding
+        if not encoding or len(data) < self.compress_min:
+            return data, ""
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        if encoding == "gzip":
+            return gzip.compress(data, COMPRESS_LEVEL), encoding
+        return zlib.compress(data, COMPRESS_LEVEL), encoding
+
+    @staticmethod
+    def _encode(body: Dict[str, Any], wire: str = JSON_TYPE):
+        # MessagePack 返回 bytes；JSON 时 RequestBuilder 的参数已预序列化：直接拼接，输出与 json.dumps(body) 相同
+        if wire == MSGPACK_TYPE:
+            return packb(body)
+        params = body.get("input_parameters")
+        if isinstance(params, BuiltParams) and params.json is not None and list(body) == ["function", "input_parameters", "sequence_num"]:
+            return '{"function": %s, "input_parameters": %s, "sequence_num": %d}' % (
+                json.dumps(body["function"]), params.json, body["sequence_num"])
+        return json.dumps(body)
+
+    @staticmethod
+    def _decode(resp: requests.Response) -> Any:
+        if resp.headers.get("Content-Type", "").startswith(MSGPACK_TYPE):
+            return unpackb(resp.content)  # WireError 是 ValueError，与 JSON 解析失败同样处理
+        return resp.json()
+
+class FittingSession:
+    # 由 NALClient.session() 创建；with 期间本线程独占服务器的有状态调用
+    def __init__(self, client: NALClient, state: Optional[AppConfig], builder: RequestBuilder, sets: tuple):
+        self.client = client
+        self.state = state
+        self.builder = builder
+        self.sets = sets
+
+    def __enter__(self) -> "FittingSession":
+        self.client._txn_lock.acquire()
+        try:
+            if self.state is not None:
+                # 与镜像相同的 Set* 不会发出，实际只发差异部分（服务器支持时合并为一次批量请求）
+                self.client.apply_sets([self.builder.request(function, self.state) for function in self.sets])
+        except BaseException:
+            self.client._txn_lock.release()
+            raise
+        return self
+
+    def __exit__(self, *exc):
+        self.client._txn_lock.release()
+        return False
+
+    def call(self, function: str, **overrides) -> Dict[str, Any]:
+        if self.state is None:
+            raise ValueError("session() 未传入 state，请用 post_json 发送完整请求")
+        return self.client.post_json(self.builder.request(function, self.state, **overrides))
+
+    def post_json(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        return self.client.post_json(body)
+
+# ==============================
+# 多设备池（会话亲和）
+# - 每台设备（手机上的 NAL 服务）一个 NALClient，超时/重试/熔断/指标各自独立
+# - DLL 持有全局状态：pool.session(key) 把一位患者的整段有状态请求钉在一台设备上，
+#   期间这台设备不接别的会话；同一线程以同一 key 嵌套进入仍用同一台，别的线程即使 key 相同也要排队
+# - 新会话选“预计等待”最短的设备：(钉在该设备上的会话数 + 1) × 近期单次调用耗时（EWMA）；熔断中的设备跳过
+# ==============================
+POOL_CALL_EWMA_ALPHA = 0.2
+POOL_DEFAULT_CALL_S = 0.05  # 设备还没有样本时的单次调用耗时估计
+
+class PoolEndpoint:
+    def __init__(self, client: NALClient):
+        self.client = client
+        self.depth = 0                   # 钉在本设备上的会话数（进行中 + 排队）
+        self.owner: Optional[tuple] = None  # 当前占用设备的会话：(key, 线程 id)
+        self.holds = 0                   # owner 的嵌套层数
+        self.call_s: Optional[float] = None
+        self.sessions = 0                # 已完成的会话数
+
+    @property
+    def name(self) -> str:
+        return f"{self.client.ip}:{self.client.port}"
+
+    def expected_wait(self) -> float:
+        return (self.depth + 1) * (self.call_s or POOL_DEFAULT_CALL_S)
+
+    def _call_count(self) -> int:
+        return sum(fm.calls + fm.errors for fm in list(self.client.metrics.functions.values()))
+
+class PoolSession:
+    __slots__ = ("pool", "key", "ep", "t0", "n0")
+
+    def __init__(self, pool: "EndpointPool", key: str):
+        self.pool, self.key = pool, key
+
+    def __enter__(self) -> NALClient:
+        self.ep = self.pool._acquire(self.key)
+        self.t0 = time.perf_counter()
+        self.n0 = self.ep._call_count()
+        return self.ep.client
+
+    def __exit__(self, *exc):
+        self.pool._release(self.key, self.ep, time.perf_counter() - self.t0, self.ep._call_count() - self.n0)
+        return False
+
+class EndpointPool:
+    def __init__(self, clients: List[NALClient]):
+        if not clients:
+            raise ValueError("设备池为空")
+        self.endpoints = [PoolEndpoint(c) for c in clients]
+        self._cond = threading.Condition()
+        self._pinned: Dict[tuple, PoolEndpoint] = {}
+
+    @classmethod
+    def from_servers(cls, servers: List[str], path: str) -> "EndpointPool":
+        clients = []
+        for item in servers:
+            host, _, port = item.strip().rpartition(":")
+            c = NALClient()
+            c.set_server(host, int(port), path)
+            clients.append(c)
+        return cls(clients)
+
+    def __len__(self) -> int:
+        return len(self.endpoints)
+
+    def connect(self) -> List[str]:
+        # 逐台探测端口；连不上的设备移出池，返回它们的地址
+        down = [ep for ep in self.endpoints if not ep.client.connect()]
+        self.endpoints = [ep for ep in self.endpoints if ep not in down]
+        return [ep.name for ep in down]
+
+    def session(self, key: str) -> PoolSession:
+        return PoolSession(self, key)
+
+    def _pick(self) -> PoolEndpoint:
+        live = [ep for ep in self.endpoints if ep.client.breaker.state != CircuitBreaker.OPEN] or self.endpoints
+        return min(live, key=lambda ep: (ep.expected_wait(), ep.depth))
+
+    def _acquire(self, key: str) -> PoolEndpoint:
+        # 可重入的单位是 (key, 线程)：两个线程用同一 key 不会同时占用一台设备
+        owner = (key, threading.get_ident())
+        with self._cond:
+            ep = self._pinned.get(owner)
+            if ep is None:
+                ep = self._pinned[owner] = self._pick()
+                ep.depth += 1
+            while ep.owner is not None and ep.owner != owner:
+                self._cond.wait()
+            ep.owner = owner
+            ep.holds += 1
+            return ep
+
+    def _release(self, key: str, ep: PoolEndpoint, elapsed: float, calls: int):
+        with self._cond:
+            ep.holds -= 1
+            if ep.holds > 0:
+                return
+            ep.owner = None
+            ep.depth -= 1
+            ep.sessions += 1
+            del self._pinned[(key, threading.get_ident())]
+            if calls > 0:
+                per_call = elapsed / calls
+                a = POOL_CALL_EWMA_ALPHA
+                ep.call_s = per_call if ep.call_s is None else a * per_call + (1 - a) * ep.call_s
+            self._cond.notify_all()
+
+    def stats(self) -> List[Dict[str, Any]]:
+        with self._cond:
+            return [{"server": ep.name, "sessions": ep.sessions, "depth": ep.depth,
+                     "call_ms": None if ep.call_s is None else round(ep.call_s * 1000, 2),
+                     "breaker": ep.client.breaker.state} for ep in self.endpoints]
+
+# ==============================
+# 会话录制与回放
+# - SessionRecorder：NALClient.recorder 设置后，每个逻辑请求（含重试后的最终结果）写一行 JSONL
+#   {"type": "call", "t": 墙钟时间, "rel": 相对录制开始的秒数, "seq", "function", "request", "response", "error", "latency", "server"}
+# - ReplayServer：用录制到的响应在本机扮演服务器（按 function + 参数匹配，同参数多次调用按录制顺序依次返回）
+# - replay_session：按原始节奏（可缩放）或尽快把请求重新发一遍，报告逐条延迟差与输出不一致
+#   python nal_core.py --replay nal_session_xxx.jsonl [--speed 2] [--server 192.168.1.10:8080]
+# ==============================
+RECORD_ENV = "NAL_RECORD"
+REPLAY_FLOAT_TOL = 1e-6
+
+class SessionRecorder:
+    def __init__(self, path: str, server: str = ""):
+        self.path = path
+        self.count = 0
+        self._lock = threading.Lock()
+        self._t0 = time.perf_counter()
+        self._f = open(path, "a", encoding="utf-8")
+        self._write({"type": "header", "version": 1, "started": time.time(), "server": server})
+
+    def _write(self, obj: Dict[str, Any]):
+        line = json.dumps(obj, ensure_ascii=False)
+        with self._lock:
+            if self._f is None:
+                return
+            self._f.write(line + "\n")
+            self._f.flush()  # 逐行落盘：程序崩溃时已录内容不丢
+
+    def record(self, body: Dict[str, Any], response: Optional[Dict[str, Any]], error: Optional[BaseException],
+               t_start: float, server_s: Optional[float]):
+        now = time.perf_counter()
+        params = body.get("input_parameters")
+        self._write({
+            "type": "call",
+            "t": time.time(),
+            "rel": round(t_start - self._t0, 6),
+            "seq": body.get("sequence_num"),
+            "function": body.get("function", ""),
+            "request": {"function": body.get("function", ""), "input_parameters": dict(params) if isinstance(params, dict) else params},
+            "response": response,
+            "error": None if error is None else f"{type(error).__name__}: {error}",
+            "latency": round(now - t_start, 6),
+            "server": None if server_s is None else round(server_s, 6),
+        })
+        self.count += 1
+
+    def close(self):
+        with self._lock:
+            if self._f is not None:
+                self._f.close()
+                self._f = None
+
+def load_session(path: str) -> List[Dict[str, Any]]:
+    # 只取 call 记录，按发起时间排序；损坏的行（例如录制中途退出写了半行）跳过
+    calls = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                obj = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(obj, dict) and obj.get("type") == "call":
+                calls.append(obj)
+    calls.sort(key=lambda c: c.get("rel", 0.0))
+    return calls
+
+def _replay_key(function: str, params: Any) -> str:
+    return function + "\0" + json.dumps(params, sort_keys=True)
+
+def diff_outputs(expected: Any, actual: Any, path: str = "", tol: float = REPLAY_FLOAT_TOL) -> List[str]:
+    """逐字段比较两个响应，返回不一致的路径；sequence_num 不参与比较"""
+    if isinstance(expected, bool) or isinstance(actual, bool):
+        return [] if expected == actual else [path or "/"]
+    if isinstance(expected, (int, float)) and isinstance(actual, (int, float)):
+        return [] if abs(expected - actual) <= tol * max(1.0, abs(expected)) else [path or "/"]
+    if isinstance(expected, dict) and isinstance(actual, dict):
+        out = []
+        for k in sorted(set(expected) | set(actual)):
+            if k == "sequence_num":
+                continue
+            if k not in expected or k not in actual:
+                out.append(f"{path}/{k}")
+            else:
+                out.extend(diff_outputs(expected[k], actual[k], f"{path}/{k}", tol))
+        return out
+    if isinstance(expected, list) and isinstance(actual, list):
+        if len(expected) != len(actual):
+            return [f"{path}[len {len(expected)}!={len(actual)}]"]
+        out = []
+        for i, (a, b) in enumerate(zip(expected, actual)):
+            out.extend(diff_outputs(a, b, f"{path}[{i}]", tol))
+        return out
+    return [] if expected == actual else [path or "/"]
+
+class ReplayServer:
+    """用录制的响应扮演 NAL 服务器；use_latency=True 时按录制的服务端耗时 sleep 后再返回"""
+
+    def __init__(self, calls: List[Dict[str, Any]], host: str = "127.0.0.1", port: int = 0, use_latency: bool = True):
+        self._lock = threading.Lock()
+        self._by_key: Dict[str, deque] = {}
+        self._by_fn: Dict[str, Dict[str, Any]] = {}
+        for c in calls:
+            if c.get("response") is None:
+                continue
+            req = c.get("request") or {}
+            entry = (c["response"], c.get("server") or 0.0)
+            self._by_key.setdefault(_replay_key(c["function"], req.get("input_parameters")), deque()).append(entry)
+            self._by_fn[c["function"]] = entry
+        self.misses = 0
+        srv = self
+
+        class Handler(BaseHTTPRequestHandler):
+            disable_nagle_algorithm = True
+
+            def do_POST(self):
+                try:
+                    body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)))
+                except ValueError:
+                    self.send_error(400)
+                    return
+                entry = srv.lookup(body.get("function", ""), body.get("input_parameters"))
+                if entry is None:
+                    self.send_error(404, "no recorded response")
+                    return
+                response, server_s = entry
+                if use_latency and server_s:
+                    time.sleep(server_s)
+                out = dict(response)
+                out["sequence_num"] = body.get("sequence_num")
+                data = json.dumps(out).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer((host, port), Handler)
+        self._httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def port(self) -> int:
+        return self._httpd.server_address[1]
+
+    def lookup(self, function: str, params: Any):
+        # 同参数按录制顺序依次返回，用完后停在最后一条；参数没录到时退回该函数最近一次的响应
+        with self._lock:
+            q = self._by_key.get(_replay_key(function, params))
+            if q:
+                return q.popleft() if len(q) > 1 else q[0]
+            self.misses += 1
+            return self._by_fn.get(function)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="replay-server", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+def replay_session(client: "NALClient", calls: List[Dict[str, Any]], speed: Optional[float] = 1.0) -> Dict[str, Any]:
+    """按录制顺序串行重放（保证 Set*/Get* 的先后关系）；speed=None 表示不等待尽快发送，
+    speed=2 表示以两倍速按原始间隔发起。返回 {"calls": [...], "functions": {...}, "mismatches": n, "errors": n}"""
+    results = []
+    if not calls:
+        return {"calls": results, "functions": {}, "mismatches": 0, "errors": 0}
+    rel0 = calls[0].get("rel", 0.0)
+    t_begin = time.perf_counter()
+    for c in calls:
+        if speed:
+            wait = (c.get("rel", 0.0) - rel0) / speed - (time.perf_counter() - t_begin)
+            if wait > 0:
+                time.sleep(wait)
+        req = c.get("request") or {}
+        body = {"function": c["function"], "input_parameters": req.get("input_parameters") or {}}
+        t0 = time.perf_counter()
+        out, err = None, None
+        try:
+            out = client.post_json(body)
+        except (RequestException, ValueError) as e:
+            err = f"{type(e).__name__}: {e}"
+        latency = time.perf_counter() - t0
+        if c.get("response") is None:
+            mismatch = [] if err is not None else ["/(录制时失败，重放成功)"]
+        elif err is not None:
+            mismatch = ["/(重放失败)"]
+        else:
+            mismatch = diff_outputs(c["response"], out)
+        results.append({
+            "seq": c.get("seq"), "function": c["function"],
+            "recorded": c.get("latency"), "replayed": round(latency, 6),
+            "diff": None if c.get("latency") is None else round(latency - c["latency"], 6),
+            "mismatch": mismatch, "error": err,
+        })
+    functions: Dict[str, Dict[str, Any]] = {}
+    for r in results:
+        f = functions.setdefault(r["function"], {"calls": 0, "recorded": [], "replayed": [], "mismatches": 0, "errors": 0})
+        f["calls"] += 1
+        if r["recorded"] is not None:
+            f["recorded"].append(r["recorded"])
+        f["replayed"].append(r["replayed"])
+        f["mismatches"] += bool(r["mismatch"])
+        f["errors"] += r["error"] is not None
+    for f in functions.values():
+        for k in ("recorded", "replayed"):
+            xs = sorted(f.pop(k))
+            f[k + "_p50"] = xs[len(xs) // 2] if xs else None
+            f[k + "_mean"] = sum(xs) / len(xs) if xs else None
+    return {"calls": results, "functions": functions,
+            "mismatches": sum(bool(r["mismatch"]) for r in results),
+            "errors": sum(r["error"] is not None for r in results)}
+
+def format_replay_report(report: Dict[str, Any]) -> str:
+    ms = lambda v: "-" if v is None else f"{v * 1000:.1f}"
+    lines = [f"{'function':<36}{'calls':>6}{'rec p50':>10}{'new p50':>10}{'diff':>10}{'mismatch':>10}{'errors':>8}"]
+    for fn, f in sorted(report["functions"].items()):
+        d = None if f["recorded_p50"] is None else f["replayed_p50"] - f["recorded_p50"]
+        lines.append(f"{fn:<36}{f['calls']:>6}{ms(f['recorded_p50']):>10}{ms(f['replayed_p50']):>10}"
+                     f"{('+' if d and d > 0 else '') + ms(d):>10}{f['mismatches']:>10}{f['errors']:>8}")
+    for r in report["calls"]:
+        if r["mismatch"]:
+            lines.append(f"  seq {r['seq']} {r['function']}: " + ", ".join(r["mismatch"][:5])
+                         + (" ..." if len(r["mismatch"]) > 5 else ""))
+    lines.append(f"合计(Total): {len(report['calls'])} 次调用, {report['mismatches']} 次输出不一致, {report['errors']} 次失败（延迟单位 ms）")
+    return "\n".join(lines)
+
+def _start_standin():
+    # server/nal_standin.py 只依赖标准库；按需导入，避免 GUI/批处理启动时加载
+    server_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "server")
+    if server_dir not in sys.path:
+        sys.path.insert(0, server_dir)
+    import nal_standin
+    return nal_standin.StandInServer("127.0.0.1", 0).start()
+
+def replay_main(argv: List[str]) -> int:
+    ap = argparse.ArgumentParser(description="重放录制的 NAL 会话并比较延迟/输出")
+    ap.add_argument("--replay", required=True, metavar="SESSION.jsonl")
+    ap.add_argument("--speed", type=float, default=1.0, help="节奏倍率；0 表示不等待尽快发送")
+    ap.add_argument("--server", default="", help="host:port；缺省时在本机启动 server/nal_standin.py 替身服务器")
+    ap.add_argument("--echo", action="store_true",
+                    help="不连服务器，用录制的响应自问自答（只检验节奏/客户端开销，输出比较恒为一致）")
+    ap.add_argument("--no-server-latency", action="store_true", help="--echo 时不模拟录制的服务端耗时")
+    ap.add_argument("--out", default="", help="把完整报告写成 JSON")
+    args = ap.parse_args(argv)
+
+    calls = load_session(args.replay)
+    stand_in = None
+    client = NALClient()
+    if args.server and args.echo:
+        ap.error("--server 与 --echo 不能同时使用")
+    if args.server:
+        host, _, port = args.server.rpartition(":")
+        client.set_server(host, int(port), client.path)
+    else:
+        if args.echo:
+            stand_in = ReplayServer(calls, use_latency=not args.no_server_latency)
+            stand_in.start()
+        else:
+            stand_in = _start_standin()
+        client.set_server("127.0.0.1", stand_in.port, client.path)
+        print(f"重放目标: {'录制响应(--echo)' if args.echo else '本机替身服务器'} 127.0.0.1:{stand_in.port}", file=sys.stderr)
+    client.connected = True
+    try:
+        report = replay_session(client, calls, args.speed or None)
+    finally:
+        if stand_in is not None:
+            stand_in.stop()
+    print(format_replay_report(report))
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return 1 if report["mismatches"] else 0
+
+# ==============================
+# 虚拟验配师压测（命令行）
+# - 每个虚拟验配师 = 一个独立 NALClient + 一份 AppConfig 副本，相当于一台工作站
+# - 按权重随机执行常见工作流（Step 1-8 / 标准增益曲线 / GainAt 19 频点 / IO 曲线），工作流之间有思考时间
+# - --clinicians 1,2,4,8 逐级加压，每级运行 --duration 秒；报告吞吐、延迟分位数、错误率，可写 JSON 便于跟踪趋势
+#   python nal_core.py --load --server 192.168.1.10:8080 --clinicians 1,2,4 --duration 30 --out load.json
+# ==============================
+LOAD_DEFAULT_MIX = {"step1-8": 1, "std_curves": 3, "gainat_sweep": 1, "io_fetch": 2}
+LOAD_GAIN_MODES = {"REIG": ("RealEarInsertionGain_NL2", 0), "REAG": ("RealEarAidedGain_NL2", 1),
+                   "2cc": ("TccCouplerGain_NL2", 2), "EarSim": ("EarSimulatorGain_NL2", 3)}
+LOAD_IO_FUNCS = ("RealEarInputOutputCurve_NL2", "TccInputOutputCurve_NL2", "EarSimulatorInputOutputCurve_NL2")
+
+class LoadError(Exception):
+    pass
+
+class VirtualClinician:
+    def __init__(self, index: int, client: NALClient, builder: RequestBuilder,
+                 response_map: Dict[str, List[tuple]], cfg: AppConfig, rng: random.Random):
+        self.index = index
+        self.client = client
+        self.builder = builder
+        self.response_map = response_map
+        self.cfg = cfg
+        self.rng = rng
+        self.calls: List[tuple] = []       # (function, 耗时秒, ok)
+
+    def call(self, function: str, **overrides) -> Dict[str, Any]:
+        t0 = time.perf_counter()
+        ok = False
+        try:
+            resp = self.client.post_json(self.builder.request(function, self.cfg, **overrides))
+            outp = resp.get("output_parameters") if isinstance(resp, dict) else None
+            if isinstance(outp, dict) and "error" in outp:
+                raise LoadError(f"{function}: {outp['error']}")
+            for name, v in map_response_to_fields(self.response_map, resp).items():
+                setattr(self.cfg, name, v)
+            ok = True
+            return resp
+        finally:
+            self.calls.append((function, time.perf_counter() - t0, ok))
+
+    # ---- 工作流：请求序列与界面上对应按钮一致 ----
+    def wf_step1_8(self):
+        # 五个 Set* 一起交给 apply_sets：服务器支持批量时一次往返
+        t0 = time.perf_counter()
+        ok = False
+        try:
+            for resp in self.client.apply_sets([self.builder.request(fn, self.cfg) for fn in SESSION_STATE_SETS]):
+                outp = resp.get("output_parameters") if isinstance(resp, dict) else None
+                if isinstance(outp, dict) and "error" in outp:
+                    raise LoadError(f"{resp.get('function')}: {outp['error']}")
+            ok = True
+        finally:
+            self.calls.append(("Set*", time.perf_counter() - t0, ok))
+        self.call("CrossOverFrequencies_NL2", BC=self.cfg.AC)
+        crossOver = self.cfg.CFArray or []
+        self.call("setBWC", crossOver=crossOver)
+        self.call("CompressionThreshold_NL2")
+        self.call("CenterFrequencies", CFArray=crossOver)
+
+    def wf_std_curves(self):
+        fn, sel = LOAD_GAIN_MODES[self.rng.choice(sorted(LOAD_GAIN_MODES))]
+        self.cfg.selection = sel
+        self.call("CompressionThreshold_NL2")
+        for L in (50, 65, 80):
+            self.call(fn, L=L)
+
+    def wf_gainat_sweep(self):
+        self.cfg.selection = int(self.cfg.targetType)
+        self.call("CompressionThreshold_NL2")
+        for i in range(19):
+            self.call("GainAt_NL2", freqRequired=i, targetType=int(self.cfg.targetType), L=int(self.cfg.L))
+
+    def wf_io_fetch(self):
+        fn = self.rng.choice(LOAD_IO_FUNCS)
+        self.call(fn, graphFreq=int(self.cfg.graphFreq), startLevel=int(self.cfg.startLevel),
+                  finishLevel=int(self.cfg.finishLevel))
+
+    WORKFLOWS = {"step1-8": wf_step1_8, "std_curves": wf_std_curves,
+                 "gainat_sweep": wf_gainat_sweep, "io_fetch": wf_io_fetch}
+
+def _percentiles(xs: List[float]) -> Dict[str, Optional[float]]:
+    xs = sorted(xs)
+    pick = lambda q: round(xs[min(len(xs) - 1, int(q * len(xs)))] * 1000, 2) if xs else None
+    return {"p50_ms": pick(0.50), "p90_ms": pick(0.90), "p99_ms": pick(0.99),
+            "max_ms": round(xs[-1] * 1000, 2) if xs else None}
+
+def run_load_level(n: int, duration: float, host: str, port: int, path: str, base_cfg: AppConfig,
+                   templates: List[Dict[str, Any]], mix: Dict[str, float], think: float, seed: int) -> Dict[str, Any]:
+    builder = RequestBuilder(templates)
+    response_map = compile_response_map(templates)
+    names = [k for k in mix if mix[k] > 0]
+    weights = [mix[k] for k in names]
+    stop = threading.Event()
+    lock = threading.Lock()
+    workflows: List[tuple] = []                 # (name, 耗时秒, ok, error)
+    clinicians = []
+
+    def worker(vc: VirtualClinician):
+        while not stop.is_set():
+            name = vc.rng.choices(names, weights)[0]
+            t0 = time.perf_counter()
+            err = None
+            try:
+                VirtualClinician.WORKFLOWS[name](vc)
+            except (RequestException, ValueError, LoadError) as e:
+                err = f"{type(e).__name__}: {e}"
+            with lock:
+                workflows.append((name, time.perf_counter() - t0, err is None, err))
+            if think > 0:
+                stop.wait(vc.rng.expovariate(1.0 / think))
+
+    for i in range(n):
+        client = NALClient()
+        client.set_server(host, port, path)
+        client.connected = True
+        vc = VirtualClinician(i, client, builder, response_map, AppConfig(**asdict(base_cfg)), random.Random(seed + i))
+        clinicians.append(vc)
+    threads = [threading.Thread(target=worker, args=(vc,), name=f"clinician-{vc.index}", daemon=True) for vc in clinicians]
+    t_begin = time.perf_counter()
+    for t in threads:
+        t.start()
+    stop.wait(duration)
+    stop.set()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t_begin
+
+    calls = [c for vc in clinicians for c in vc.calls]
+    by_wf: Dict[str, Dict[str, Any]] = {}
+    for name in names:
+        rows = [w for w in workflows if w[0] == name]
+        errs = [w[3] for w in rows if not w[2]]
+        by_wf[name] = {"count": len(rows), "errors": len(errs), **_percentiles([w[1] for w in rows if w[2]]),
+                       "sample_error": errs[0] if errs else None}
+    by_fn: Dict[str, Dict[str, Any]] = {}
+    for fn in sorted({c[0] for c in calls}):
+        rows = [c for c in calls if c[0] == fn]
+        by_fn[fn] = {"count": len(rows), "errors": sum(not c[2] for c in rows), **_percentiles([c[1] for c in rows if c[2]])}
+    n_err = sum(not c[2] for c in calls)
+    return {
+        "clinicians": n, "elapsed_s": round(elapsed, 3),
+        "workflows_per_s": round(len(workflows) / elapsed, 3) if elapsed else 0.0,
+        "calls_per_s": round(len(calls) / elapsed, 3) if elapsed else 0.0,
+        "calls": len(calls), "call_errors": n_err,
+        "error_rate": round(n_err / len(calls), 4) if calls else 0.0,
+        "call_latency": _percentiles([c[1] for c in calls if c[2]]),
+        "workflows": by_wf, "functions": by_fn,
+    }
+
+def format_load_report(levels: List[Dict[str, Any]]) -> str:
+    ms = lambda v: "-" if v is None else f"{v:.1f}"
+    lines = [f"{'clinicians':>10}{'wf/s':>9}{'calls/s':>9}{'p50':>9}{'p90':>9}{'p99':>9}{'errors':>9}"]
+    for lv in levels:
+        lat = lv["call_latency"]
+        lines.append(f"{lv['clinicians']:>10}{lv['workflows_per_s']:>9.2f}{lv['calls_per_s']:>9.1f}"
+                     f"{ms(lat['p50_ms']):>9}{ms(lat['p90_ms']):>9}{ms(lat['p99_ms']):>9}{lv['error_rate'] * 100:>8.1f}%")
+    for lv in levels:
+        lines.append(f"-- {lv['clinicians']} 位验配师(clinicians): 工作流耗时 p50/p99 (ms)")
+        for name, w in lv["workflows"].items():
+            lines.append(f"   {name:<14}{w['count']:>6} 次  {ms(w['p50_ms']):>8} / {ms(w['p99_ms']):<8} 失败 {w['errors']}"
+                         + (f"  ({w['sample_error']})" if w["sample_error"] else ""))
+    lines.append("调用延迟单位 ms（仅统计成功的调用）")
+    return "\n".join(lines)
+
+def load_main(argv: List[str]) -> int:
+    ap = argparse.ArgumentParser(description="虚拟验配师并发压测")
+    ap.add_argument("--load", action="store_true")
+    ap.add_argument("--server", default="", help="host:port；缺省用配置文件里的服务器")
+    ap.add_argument("--config", default=DEFAULT_CONFIG_FILE, help="作为听力图/参数基线的配置文件")
+    ap.add_argument("--templates", default=DEFAULT_TEMPLATES_FILE)
+    ap.add_argument("--clinicians", default="1,2,4", help="逐级并发数，逗号分隔")
+    ap.add_argument("--duration", type=float, default=30.0, help="每级运行秒数")
+    ap.add_argument("--think-ms", type=float, default=500.0, help="工作流之间的平均思考时间（指数分布）")
+    ap.add_argument("--mix", default="", help="工作流权重，例如 std_curves=3,io_fetch=2（缺省 %s）"
+                    % ",".join(f"{k}={v}" for k, v in LOAD_DEFAULT_MIX.items()))
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--out", default="", help="结果 JSON 路径")
+    args = ap.parse_args(argv)
+
+    mix = dict(LOAD_DEFAULT_MIX)
+    if args.mix:
+        mix = {k: 0 for k in mix}
+        for item in args.mix.split(","):
+            k, _, v = item.partition("=")
+            if k.strip() not in VirtualClinician.WORKFLOWS:
+                ap.error(f"未知工作流: {k}（可选 {', '.join(VirtualClinician.WORKFLOWS)}）")
+            mix[k.strip()] = float(v or 1)
+    cfg = load_app_config(args.config)
+    host, port = cfg.server_ip, int(cfg.server_port)
+    if args.server:
+        host, _, p = args.server.rpartition(":")
+        port = int(p)
+    templates = load_templates_list(args.templates)
+    levels = []
+    for n in [int(x) for x in args.clinicians.split(",") if x.strip()]:
+        print(f"运行 {n} 位虚拟验配师 {args.duration:.0f}s -> {host}:{port} ...", flush=True)
+        levels.append(run_load_level(n, args.duration, host, port, cfg.server_path, cfg, templates,
+                                     mix, args.think_ms / 1000.0, args.seed))
+    print(format_load_report(levels))
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"target": f"{host}:{port}{cfg.server_path}", "started": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                       "duration_s": args.duration, "think_ms": args.think_ms, "mix": mix, "levels": levels},
+                      f, ensure_ascii=False, indent=2)
+    return 0
+
+# ==============================
+# 听力图批量验配（命令行）
+# - 输入 CSV（首行表头）或 JSONL，每条一位患者：列名/键名即 AppConfig 字段名，可选 id；未给出的字段沿用 --config 基线
+#   数组字段（AC/BC/ACother 等）在 CSV 里写成 "45 40 40 ..."（空格/分号/竖线分隔），或拆成 AC_0..AC_8 多列
+# - 每条记录先跑主页 Step 1-8 的设置链，再按 --outputs 取结果；请求顺序与界面按钮一致（复用 VirtualClinician.call）
+# - 输入按生成器逐条读取、结果逐行写出并立即落盘，内存占用与数据集大小无关；stderr 显示进度与预计剩余时间
+# - 中断后加 --resume 重跑：跳过输出文件里已成功（"ok": true）的 id，失败的记录重跑，结果追加在后面（同一 id 以最后一行为准）
+# - --server 可给多台设备（逗号分隔）：每条记录经 EndpointPool 钉在一台设备上，--workers 条并行（缺省 = 设备数），
+#   结果仍按输入顺序写出；在途记录最多 2 × workers 条
+#   python nal_core.py --batch audiograms.csv --out results.jsonl --server 192.168.1.10:8080 --outputs reig,reag,mpo,ct,cr,io
+# ==============================
+BATCH_OUTPUTS = ("reig", "reag", "mpo", "ct", "cr", "io")
+BATCH_PROGRESS_INTERVAL_S = 0.5
+_BATCH_LIST_SEP = re.compile(r"[\s;|]+")
+_BATCH_INDEXED_COL = re.compile(r"^([A-Za-z]\w*?)_(\d+)$")
+_BATCH_DEFAULTS = asdict(AppConfig())
+
+def iter_audiograms(path: str) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    # 逐条产出 (记录 id, 原始字段)；缺 id 时用行号。.jsonl/.ndjson 按 JSON Lines 读，其余按 CSV 读
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        if path.lower().endswith((".jsonl", ".ndjson")):
+            for n, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                rec = json.loads(line)
+                if not isinstance(rec, dict):
+                    raise ValueError(f"{path}:{n}: 每行应为一个 JSON 对象")
+                yield str(rec.pop("id", n)), rec
+            return
+        for n, row in enumerate(csv.DictReader(f), 1):
+            rec: Dict[str, Any] = {}
+            indexed: Dict[str, Dict[int, str]] = {}
+            for k, v in row.items():
+                if k is None or v is None or not v.strip():
+                    continue
+                k = k.strip()
+                m = _BATCH_INDEXED_COL.match(k)
+                if m and isinstance(_BATCH_DEFAULTS.get(m.group(1)), list):
+                    indexed.setdefault(m.group(1), {})[int(m.group(2))] = v
+                else:
+                    rec[k] = v
+            for k, cols in indexed.items():
+                rec[k] = [cols[i] for i in sorted(cols)]
+            yield str(rec.pop("id", n)), rec
+
+def _count_records(path: str) -> int:
+    # 只数非空行，用于进度百分比和 ETA（CSV 单元格内换行时会略多，不影响结果）
+    with open(path, "r", encoding="utf-8-sig") as f:
+        n = sum(1 for line in f if line.strip())
+    return n if path.lower().endswith((".jsonl", ".ndjson")) else max(0, n - 1)
+
+def _coerce_field(name: str, value: Any, default: Any) -> Any:
+    # 按 AppConfig 默认值的类型转换；整数值的数组元素保持 int（与配置文件里的写法一致）
+    if isinstance(default, list):
+        if isinstance(value, str):
+            value = [x for x in _BATCH_LIST_SEP.split(value.strip()) if x]
+        if not isinstance(value, list):
+            raise ValueError(f"{name}: 应为数组")
+        if name not in VARIABLE_LEN_OUTPUTS and len(value) != len(default):
+            raise ValueError(f"{name}: 需要 {len(default)} 个值，实际 {len(value)} 个")
+        out = []
+        for x in value:
+            v = float(x)
+            out.append(int(v) if v.is_integer() else v)
+        return out
+    if isinstance(default, int):
+        return int(float(value))
+    if isinstance(default, float):
+        return float(value)
+    return str(value)
+
+def audiogram_config(base: AppConfig, rec: Dict[str, Any]) -> Tuple[AppConfig, List[str]]:
+    # 基线配置副本 + 本条记录的字段；返回 (配置, 未识别的字段名)。服务器地址不随记录变化
+    data = asdict(base)
+    ignored = []
+    for k, v in rec.items():
+        if k not in data or k.startswith("server_"):
+            ignored.append(k)
+            continue
+        data[k] = _coerce_field(k, v, data[k])
+    return AppConfig(**data), ignored
+
+def _output_array(resp: Dict[str, Any], function: str, key: str) -> List[float]:
+    # 结果直接取响应里的数组：通道数不是 18 时长度会变，不能经 AppConfig 字段（按默认长度校验）中转
+    v = ((resp or {}).get("output_parameters") or {}).get(key)
+    if not isinstance(v, list):
+        raise LoadError(f"{function}: 响应中没有 {key}")
+    return v
+
+def fit_audiogram(vc: VirtualClinician, outputs: Tuple[str, ...]) -> Dict[str, Any]:
+    c = vc.cfg
+    c.CT = None  # Step 8 未写回 CT 时不能把基线配置里的 CT 当成本条结果
+    vc.wf_step1_8()
+    out: Dict[str, Any] = {}
+    if "ct" in outputs:
+        if not isinstance(c.CT, list):
+            raise LoadError("CompressionThreshold_NL2: 响应中没有有效的 CT")
+        out["CT"] = list(c.CT)  # 按记录里的 selection 算出的 CT
+    if "cr" in outputs:
+        # 文档要求 centreFreq 为 channels+1 个元素；CenterFrequencies 只返回 channels 个时退回标准 1/3 倍频程
+        n_cf = int(c.channels) + 1
+        cf = c.centerF if len(c.centerF) == n_cf and any(x != 0 for x in c.centerF) else FREQS_19[:n_cf]
+        out["CR"] = _output_array(vc.call("CompressionRatio_NL2", centreFreq=cf), "CompressionRatio_NL2", "CR")
+    if "mpo" in outputs:
+        out["MPO"] = _output_array(vc.call("getMPO_NL2"), "getMPO_NL2", "MPO")
+    for mode in ("REIG", "REAG"):
+        if mode.lower() not in outputs:
+            continue
+        # 与增益/响应页“标准曲线”一致：先按模式设 selection 并重算 CT，再取 50/65/80 dB 三条
+        fn, sel = LOAD_GAIN_MODES[mode]
+        c.selection = sel
+        vc.call("CompressionThreshold_NL2")
+        out[mode] = {str(L): _output_array(vc.call(fn, L=L), fn, mode) for L in (50, 65, 80)}
+    if "io" in outputs:
+        fn = "RealEarInputOutputCurve_NL2"
+        sLv, fLv = int(c.startLevel), int(c.finishLevel)
+        n = max(0, fLv - sLv + 1)
+        resp = vc.call(fn, graphFreq=int(c.graphFreq), startLevel=sLv, finishLevel=fLv)
+        out["REIO"] = _output_array(resp, fn, "REIO")[:n]
+        out["REIOunl"] = _output_array(resp, fn, "REIOunl")[:n]
+    return out
+
+def run_batch(records, pool: EndpointPool, base_cfg: AppConfig, templates: List[Dict[str, Any]],
+              outputs: Tuple[str, ...], workers: int = 1) -> Iterator[Dict[str, Any]]:
+    # 生成器：按输入顺序产出结果；单条失败只记录错误，不中断整批
+    builder = RequestBuilder(templates)
+    response_map = compile_response_map(templates)
+
+    def fit_one(rid: str, rec: Dict[str, Any]) -> Dict[str, Any]:
+        t0 = time.perf_counter()
+        row: Dict[str, Any] = {"id": rid, "ok": False}
+        try:
+            cfg, ignored = audiogram_config(base_cfg, rec)
+            if ignored:
+                row["ignored"] = ignored
+            with pool.session(rid) as client, client.session():
+                # 设备独占之外再持有 client 的事务锁：与同一 client 上的其它有状态调用互斥
+                row["server"] = f"{client.ip}:{client.port}"
+                vc = VirtualClinician(0, client, builder, response_map, cfg, random.Random(0))
+                row["outputs"] = fit_audiogram(vc, outputs)
+            row["ok"] = True
+        except Exception as e:
+            # 任何异常都只记在本条（例如字段是 dict / 含 null 时 _coerce_field 抛 TypeError），不中断整批
+            row["error"] = f"{type(e).__name__}: {e}"
+        row["ms"] = round((time.perf_counter() - t0) * 1000, 1)
+        return row
+
+    if workers <= 1:
+        for rid, rec in records:
+            yield fit_one(rid, rec)
+        return
+    window: deque = deque()
+    with ThreadPoolExecutor(workers, thread_name_prefix="batch") as ex:
+        for rid, rec in records:
+            window.append(ex.submit(fit_one, rid, rec))
+            if len(window) >= 2 * workers:
+                yield window.popleft().result()
+        while window:
+            yield window.popleft().result()
+
+class BatchProgress:
+    def __init__(self, total: Optional[int], stream=None):
+        self.total = total
+        self.stream = stream or sys.stderr
+        self.done = 0
+        self.failed = 0
+        self.t0 = time.monotonic()
+        self._last = 0.0
+
+    def update(self, ok: bool):
+        self.done += 1
+        self.failed += 0 if ok else 1
+        now = time.monotonic()
+        if now - self._last >= BATCH_PROGRESS_INTERVAL_S:
+            self._last = now
+            self.stream.write("\r" + self.line(now))
+            self.stream.flush()
+
+    def line(self, now: float) -> str:
+        elapsed = max(1e-9, now - self.t0)
+        rate = self.done / elapsed
+        fmt = lambda sec: time.strftime("%H:%M:%S", time.gmtime(max(0, int(sec))))
+        if self.total:
+            left = (self.total - self.done) / rate if rate > 0 else 0
+            head = f"{self.done}/{self.total} {self.done * 100 / self.total:5.1f}%"
+            tail = f"ETA {fmt(left)}"
+        else:
+            head, tail = f"{self.done}", f"已用 {fmt(elapsed)}"
+        return f"{head}  {rate:.1f} 条/s  {tail}  失败 {self.failed}   "
+
+    def finish(self):
+        self.stream.write("\r" + self.line(time.monotonic()) + "\n")
+        self.stream.flush()
+
+def batch_main(argv: List[str]) -> int:
+    ap = argparse.ArgumentParser(description="听力图批量验配：CSV/JSONL 输入，JSONL 逐条输出")
+    ap.add_argument("--batch", required=True, metavar="INPUT", help="听力图数据集（.csv 或 .jsonl）")
+    ap.add_argument("--out", required=True, help="结果 JSONL 路径（每条记录一行）")
+    ap.add_argument("--server", default="", help="host:port[,host:port...]；多台设备时按会话分配，缺省用配置文件里的服务器")
+    ap.add_argument("--workers", type=int, default=0, help="并行记录数（缺省 = 设备数）")
+    ap.add_argument("--config", default=DEFAULT_CONFIG_FILE, help="基线配置：记录里没给出的字段取这里的值")
+    ap.add_argument("--templates", default=DEFAULT_TEMPLATES_FILE)
+    ap.add_argument("--outputs", default=",".join(BATCH_OUTPUTS), help="逗号分隔，可选 %s" % ",".join(BATCH_OUTPUTS))
+    ap.add_argument("--limit", type=int, default=0, help="只处理前 N 条（0 = 全部）")
+    ap.add_argument("--resume", action="store_true", help="跳过输出文件里已成功的 id，失败的重跑，结果追加")
+    args = ap.parse_args(argv)
+
+    outputs = tuple(x.strip().lower() for x in args.outputs.split(",") if x.strip())
+    unknown = [x for x in outputs if x not in BATCH_OUTPUTS]
+    if unknown:
+        ap.error(f"未知输出: {', '.join(unknown)}（可选 {', '.join(BATCH_OUTPUTS)}）")
+    cfg = load_app_config(args.config)
+    servers = [x for x in args.server.split(",") if x.strip()] or [f"{cfg.server_ip}:{cfg.server_port}"]
+    pool = EndpointPool.from_servers(servers, cfg.server_path)
+    down = pool.connect()
+    if down:
+        print(f"无法连接，已跳过: {', '.join(down)}", file=sys.stderr)
+    if not len(pool):
+        return 2
+    workers = args.workers or len(pool)
+
+    done_ids = set()
+    torn = False  # 输出文件最后一行没有换行（上次中断写了半行）：追加前先补一个换行
+    if args.resume and os.path.exists(args.out):
+        with open(args.out, "r", encoding="utf-8") as f:
+            for line in f:
+                torn = not line.endswith("\n")
+                try:
+                    row = json.loads(line)
+                    if row.get("ok") is True:
+                        done_ids.add(str(row["id"]))
+                except (ValueError, KeyError, TypeError, AttributeError):
+                    pass  # 上次中断时写了半行
+    records = ((rid, rec) for rid, rec in iter_audiograms(args.batch) if rid not in done_ids)
+    total = _count_records(args.batch) - len(done_ids)
+    if args.limit > 0:
+        records = itertools.islice(records, args.limit)
+        total = min(total, args.limit)
+    progress = BatchProgress(max(0, total))
+    print(f"批量验配 -> {', '.join(ep.name for ep in pool.endpoints)}  并行 {workers}  输出 {','.join(outputs)}"
+          + (f"（跳过已完成 {len(done_ids)} 条）" if done_ids else ""), file=sys.stderr)
+    warned = set()
+    with open(args.out, "a" if args.resume else "w", encoding="utf-8") as f:
+        if torn:
+            f.write("\n")
+        for row in run_batch(records, pool, cfg, load_templates_list(args.templates), outputs, workers):
+            f.write(json.dumps(row, ensure_ascii=False) + "\n")
+            f.flush()
+            new = set(row.get("ignored", ())) - warned
+            if new:
+                warned |= new
+                print(f"\n未识别的字段已忽略: {', '.join(sorted(new))}", file=sys.stderr)
+            progress.update(row["ok"])
+    progress.finish()
+    if len(pool) > 1:
+        for st in pool.stats():
+            print(f"  {st['server']:<22} 会话 {st['sessions']:>6}  单次调用 {st['call_ms']} ms", file=sys.stderr)
+    print(f"完成 {progress.done} 条，失败 {progress.failed} 条 -> {os.path.abspath(args.out)}", file=sys.stderr)
+    return 1 if progress.failed else 0
+
+# ==============================
+# 本机 NAL 代理：多个 GUI / 脚本共用一台设备
+# - 在本机提供与手机端相同的 POST 协议，上游是一个 NALClient（自适应超时、重试、熔断、Set* 镜像照常生效）
+# - 客户端会话按 X-NAL-Session 请求头区分（NALClient 自动带上；没有时按来源地址+端口区分）；代理记住每个会话
+#   最近一次的 Set* / CompressionThreshold_NL2 请求，轮到别的会话时先把它与设备当前状态不同的部分补发，再转发本次调用
+# - CompressionThreshold_NL2 是计算结果（取决于 setBWC 等 Set*），每次都转发；成功后才记为状态，任何 Set* 改变设备状态时作废
+# - 有状态调用进入一个 FIFO 队列，由单个设备线程依次执行（先到先服务，各会话不会互相打断）；只读查询不排队，并行转发
+# - 共享响应缓存：键 = 函数 + 参数 + 设备当前状态（只读查询不含状态），LRU 上限 PROXY_CACHE_MAX；出错的响应不缓存
+# - GET /stats 返回会话数、缓存命中、状态补发次数等计数
+# ==============================
+PROXY_SESSION_HEADER = "X-NAL-Session"
+PROXY_DEFAULT_LISTEN = "127.0.0.1:8090"
+PROXY_CACHE_MAX = 4096
+PROXY_READ_WORKERS = 4
+PROXY_SESSION_MAX = 256  # 记住状态的会话数上限，超出时丢弃最久未活动的
+
+# 有状态的计算调用：每次都转发，结果依赖 Set* 状态，同时也在 DLL 里留下状态（会话切换时要补发）
+PROXY_DERIVED_STATE_CALLS = frozenset({"CompressionThreshold_NL2"})
+
+def _resp_ok(out: Any) -> bool:
+    outp = out.get("output_parameters") if isinstance(out, dict) else None
+    return not (isinstance(outp, dict) and "error" in outp)
+
+class NALProxy:
+    def __init__(self, upstream: NALClient, host: str = "127.0.0.1", port: int = 8090,
+                 read_workers: int = 0, cache_max: int = PROXY_CACHE_MAX):
+        # read_workers=0：按设备握手给出的并发数决定只读查询的并行转发数（不认识 capabilities 的设备为 1）
+        if read_workers <= 0:
+            profile = upstream.profile
+            read_workers = (profile.max_concurrency or PROXY_READ_WORKERS) if profile is not None else 1
+        self.upstream = upstream
+        self.cache_max = cache_max
+        # 以下三项只在设备线程里读写
+        self.sessions: "OrderedDict[str, Dict[str, tuple]]" = OrderedDict()  # 会话 -> {DLL 槽位: (参数 JSON, 请求体)}，按写入先后
+        self.device_state: Dict[str, tuple] = {}  # DLL 槽位 -> (参数 JSON, 响应)：设备上当前生效的状态
+        self._owner: Optional[str] = None  # 最近一次在设备上执行有状态调用的会话
+        self._gen = upstream._state_gen
+        self._cache: "OrderedDict[tuple, Dict[str, Any]]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._device = ThreadPoolExecutor(1, thread_name_prefix="proxy-device")  # 单线程 = FIFO 串行
+        self._read_workers = read_workers
+        self._reads = ThreadPoolExecutor(read_workers, thread_name_prefix="proxy-read")
+        self._stats_lock = threading.Lock()
+        self.stats = {"requests": 0, "stateful": 0, "read_only": 0, "cache_hits": 0, "cache_misses": 0,
+                      "state_hits": 0, "switches": 0, "state_replays": 0, "upstream_calls": 0, "upstream_errors": 0}
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="nal-proxy", daemon=True)
+
+    @property
+    def port(self) -> int:
+        return self.httpd.server_address[1]
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self._device.shutdown(wait=False)
+        self._reads.shutdown(wait=False)
+
+    def _bump(self, key: str, n: int = 1):
+        with self._stats_lock:
+            self.stats[key] += n
+
+    def snapshot_stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            out = dict(self.stats)
+        with self._cache_lock:
+            out["cache_entries"] = len(self._cache)
+        out["sessions"] = len(self.sessions)
+        out["breaker"] = self.upstream.breaker.state
+        out["read_workers"] = self._read_workers
+        out["namespace"] = self._namespace()
+        return out
+
+    # ---- 请求处理 ----
+    def capabilities(self) -> Dict[str, Any]:
+        upstream = self.upstream.profile or ServerProfile()
+        return {"server": f"nal-proxy({upstream.server})", "encodings": [JSON_TYPE, MSGPACK_TYPE], "compression": [],
+                "batch": False, "max_concurrency": self._read_workers}
+
+    def process(self, sid: str, body: Dict[str, Any]) -> Dict[str, Any]:
+        function = body.get("function", "")
+        if function == CAPABILITIES_FUNCTION:
+            return {"sequence_num": body.get("sequence_num", 0), "function": function, "return": 0,
+                    "output_parameters": self.capabilities()}
+        pkey = json.dumps(body.get("input_parameters") or {}, sort_keys=True)
+        req = {"function": function, "input_parameters": body.get("input_parameters") or {}}
+        self._bump("requests")
+        if function in READ_ONLY_FUNCTIONS:
+            self._bump("read_only")
+            out = self._reads.submit(self._read_call, function, pkey, req).result()
+        else:
+            self._bump("stateful")
+            out = self._device.submit(self._stateful_call, sid, function, pkey, req).result()
+        out = dict(out)
+        out["sequence_num"] = body.get("sequence_num", 0)  # 客户端按自己的序号对应响应
+        return out
+
+    def _check_generation(self):
+        # 上游重连、网络失败或 DLL 版本变化都会作废它的镜像：设备状态与缓存一并作废
+        gen = self.upstream._state_gen
+        if gen == self._gen:
+            return
+        self._gen = gen
+        self.device_state = {}
+        self._owner = None
+        with self._cache_lock:
+            self._cache.clear()
+
+    def _namespace(self) -> str:
+        profile = self.upstream.profile
+        return profile.namespace if profile is not None else ""
+
+    def _forward(self, req: Dict[str, Any]) -> Dict[str, Any]:
+        self._bump("upstream_calls")
+        try:
+            return self.upstream.post_json(req)
+        except RequestException:
+            self._bump("upstream_errors")
+            raise
+
+    def _cached(self, key: tuple, req: Dict[str, Any]) -> Dict[str, Any]:
+        with self._cache_lock:
+            hit = self._cache.get(key)
+            if hit is not None:
+                self._cache.move_to_end(key)
+        if hit is not None:
+            self._bump("cache_hits")
+            return hit
+        self._bump("cache_misses")
+        out = self._forward(req)
+        if _resp_ok(out):
+            with self._cache_lock:
+                self._cache[key] = out
+                while len(self._cache) > self.cache_max:
+                    self._cache.popitem(last=False)
+        return out
+
+    def _read_call(self, function: str, pkey: str, req: Dict[str, Any]) -> Dict[str, Any]:
+        if function == "dllVersion":
+            return self._forward(req)  # 也用来探测设备：不走缓存
+        return self._cached(("ro", self._namespace(), function, pkey), req)
+
+    def _stateful_call(self, sid: str, function: str, pkey: str, req: Dict[str, Any]) -> Dict[str, Any]:
+        self._check_generation()
+        state = self.sessions.pop(sid, None) or {}
+        self.sessions[sid] = state
+        while len(self.sessions) > PROXY_SESSION_MAX:
+            self.sessions.popitem(last=False)
+        if sid != self._owner:
+            if self._owner is not None:
+                self._bump("switches")
+            self._sync(state)
+            self._owner = sid
+        if is_set_function(function):
+            slot = dll_slot(function)
+            old = state.pop(slot, None)
+            if old is None or old[0] != pkey:
+                self._drop_derived(state)  # 会话里先前算的 CT 已不对应它现在的 Set* 状态
+            state[slot] = (pkey, req)
+            return self._apply_state(function, pkey, req)
+        if function in PROXY_DERIVED_STATE_CALLS:
+            out = self._apply_derived(function, pkey, req)
+            state.pop(function, None)
+            if _resp_ok(out):
+                state[function] = (pkey, req)
+            return out
+        key = (self._namespace(), function, pkey, tuple(sorted((fn, v[0]) for fn, v in self.device_state.items())))
+        return self._cached(key, req)
+
+    @staticmethod
+    def _drop_derived(state: Dict[str, tuple]):
+        for function in PROXY_DERIVED_STATE_CALLS:
+            state.pop(function, None)
+
+    def _apply_state(self, function: str, pkey: str, req: Dict[str, Any]) -> Dict[str, Any]:
+        slot = dll_slot(function)
+        hit = self.device_state.get(slot)
+        if hit is not None and hit[0] == pkey:
+            self._bump("state_hits")
+            return hit[1]
+        self.device_state.pop(slot, None)
+        self._drop_derived(self.device_state)  # Set* 状态变了：设备上的 CT 结果随之作废
+        out = self._forward(req)
+        if _resp_ok(out):
+            self.device_state[slot] = (pkey, out)
+        return out
+
+    def _apply_derived(self, function: str, pkey: str, req: Dict[str, Any]) -> Dict[str, Any]:
+        # 不用 device_state 回答：设备上的结果取决于当时的 Set* 状态，只有上游成功后才记下
+        self.device_state.pop(function, None)
+        out = self._forward(req)
+        if _resp_ok(out):
+            self.device_state[function] = (pkey, out)
+        return out
+
+    def _sync(self, state: Dict[str, tuple]):
+        # 按该会话当初的先后顺序补发与设备不同的状态；某项失败时整个调用失败，由客户端重试
+        for slot, (pkey, req) in list(state.items()):
+            hit = self.device_state.get(slot)
+            if hit is not None and hit[0] == pkey:
+                continue
+            self._bump("state_replays")
+            function = req["function"]
+            if function in PROXY_DERIVED_STATE_CALLS:
+                out = self._apply_derived(function, pkey, req)
+            else:
+                out = self._apply_state(function, pkey, req)
+            if not _resp_ok(out):
+                raise RequestException(f"{function} 状态补发失败: {out.get('output_parameters', {}).get('error')}")
+
+    def _handler_class(self):
+        proxy = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, status: int, obj: Any):
+                if MSGPACK_TYPE in self.headers.get("Accept", ""):
+                    data, ctype = packb(obj), MSGPACK_TYPE
+                else:
+                    data, ctype = json.dumps(obj, ensure_ascii=False).encode("utf-8"), "application/json; charset=utf-8"
+                self.send_response(status)
+                self.send_header("Content-Type", ctype)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                if self.path.split("?")[0] == "/stats":
+                    self._reply(200, proxy.snapshot_stats())
+                else:
+                    self.send_error(404)
+
+            def do_POST(self):
+                raw = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                try:
+                    if self.headers.get("Content-Type", "").startswith(MSGPACK_TYPE):
+                        body = unpackb(raw)
+                    else:
+                        body = json.loads(raw)
+                except ValueError:
+                    body = None
+                if not isinstance(body, dict):
+                    self._reply(400, {"return": -1, "output_parameters": {"error": "请求格式错误"}})
+                    return
+                sid = self.headers.get(PROXY_SESSION_HEADER) or "%s:%s" % self.client_address[:2]
+                try:
+                    out = proxy.process(sid, body)
+                except RequestException as e:
+                    status = 503 if isinstance(e, CircuitOpenError) else 502
+                    self._reply(status, {"sequence_num": body.get("sequence_num", 0), "function": body.get("function", ""),
+                                         "return": -1, "output_parameters": {"error": f"代理转发失败: {e}"}})
+                    return
+                self._reply(200, out)
+
+        return Handler
+
+def proxy_main(argv: List[str]) -> int:
+    ap = argparse.ArgumentParser(description="本机 NAL 代理：多个客户端共用一台设备（会话状态隔离、共享缓存）")
+    ap.add_argument("--proxy", action="store_true", required=True)
+    ap.add_argument("--server", default="", help="设备 host:port，缺省用配置文件里的服务器")
+    ap.add_argument("--listen", default=PROXY_DEFAULT_LISTEN, help="监听地址 host:port（默认只接受本机连接）")
+    ap.add_argument("--config", default=DEFAULT_CONFIG_FILE)
+    ap.add_argument("--read-workers", type=int, default=0, help="只读查询的并行转发数（缺省按设备握手给出的并发数）")
+    ap.add_argument("--cache", type=int, default=PROXY_CACHE_MAX, help="响应缓存条数上限")
+    args = ap.parse_args(argv)
+
+    cfg = load_app_config(args.config)
+    server = args.server or f"{cfg.server_ip}:{cfg.server_port}"
+    host, _, port = server.rpartition(":")
+    upstream = NALClient()
+    upstream.set_server(host, int(port), cfg.server_path)
+    if not upstream.connect():
+        print(f"无法连接设备 {server}", file=sys.stderr)
+        return 2
+    lhost, _, lport = args.listen.rpartition(":")
+    proxy = NALProxy(upstream, lhost or "127.0.0.1", int(lport), args.read_workers, args.cache)
+    proxy.start()
+    print(f"NAL 代理 http://{lhost or '127.0.0.1'}:{proxy.port}{cfg.server_path} -> {server} [{upstream.profile.describe()}]"
+          f"（GET /stats 查看计数，Ctrl+C 退出）", file=sys.stderr)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    proxy.stop()
+    return 0
+
+# ==============================
+# Prometheus 文本格式指标（可选）：设置环境变量 NAL_METRICS_PORT 后由 MainWindow 在 127.0.0.1 上启动
+#   curl http://127.0.0.1:<port>/metrics
+# ==============================
+METRICS_PORT_ENV = "NAL_METRICS_PORT"
+PROM_BUCKETS_S = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _prom_label(v: str) -> str:
+    return v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _prom_histogram(out: List[str], name: str, h: Histogram, labels: str = ""):
+    # HDR 桶按上界折算到固定的秒级桶（桶边界不对齐时按上界归入，略偏保守）
+    counts = list(h.counts)
+    sep = "," if labels else ""
+    i, acc = 0, 0
+    for le in PROM_BUCKETS_S:
+        le_us = int(le * 1e6)
+        while i < HIST_BUCKETS and Histogram.bucket_upper(i) <= le_us:
+            acc += counts[i]
+            i += 1
+        out.append(f'{name}_bucket{{{labels}{sep}le="{le}"}} {acc}')
+    out.append(f'{name}_bucket{{{labels}{sep}le="+Inf"}} {h.count}')
+    tail = f"{{{labels}}}" if labels else ""
+    out.append(f"{name}_sum{tail} {h.total / 1e6:.6f}")
+    out.append(f"{name}_count{tail} {h.count}")
+
+def format_prometheus(client: "NALClient", jobs: Optional[JobExecutor] = None,
+                      save_hist: Optional[Histogram] = None, ui_lag: Optional[Histogram] = None) -> str:
+    out: List[str] = []
+    funcs = sorted(client.metrics.functions.items())
+    for metric, attr, help_text in (("nal_calls_total", "calls", "Completed NAL calls"),
+                                    ("nal_errors_total", "errors", "Failed NAL calls (after retries)"),
+                                    ("nal_retries_total", "retries", "Retried attempts"),
+                                    ("nal_set_skipped_total", "skipped", "Set* calls skipped: server already had the values")):
+        out.append(f"# HELP {metric} {help_text}")
+        out.append(f"# TYPE {metric} counter")
+        for fn, fm in funcs:
+            out.append(f'{metric}{{function="{_prom_label(fn)}"}} {getattr(fm, attr)}')
+    out.append("# HELP nal_call_duration_seconds End-to-end NAL call latency")
+    out.append("# TYPE nal_call_duration_seconds histogram")
+    for fn, fm in funcs:
+        _prom_histogram(out, "nal_call_duration_seconds", fm.total, f'function="{_prom_label(fn)}"')
+    out.append("# HELP nal_server_duration_seconds Time to response headers")
+    out.append("# TYPE nal_server_duration_seconds histogram")
+    for fn, fm in funcs:
+        _prom_histogram(out, "nal_server_duration_seconds", fm.server, f'function="{_prom_label(fn)}"')
+    for metric, attr in (("nal_request_bytes_total", "req_bytes"), ("nal_response_bytes_total", "resp_bytes"),
+                         ("nal_request_wire_bytes_total", "req_wire"), ("nal_response_wire_bytes_total", "resp_wire")):
+        out.append(f"# TYPE {metric} counter")
+        for fn, fm in funcs:
+            out.append(f'{metric}{{function="{_prom_label(fn)}"}} {getattr(fm, attr).total}')
+    out.append("# HELP nal_breaker_open Circuit breaker state (0=closed, 1=half-open, 2=open)")
+    out.append("# TYPE nal_breaker_open gauge")
+    out.append(f"nal_breaker_open {dict(closed=0, half_open=1, open=2).get(client.breaker.state, 0)}")
+    if jobs is not None:
+        snap = jobs.snapshot()
+        out.append("# HELP nal_executor_jobs Jobs in the background executor")
+        out.append("# TYPE nal_executor_jobs gauge")
+        out.append(f'nal_executor_jobs{{state="queued"}} {len(snap[Job.QUEUED])}')
+        out.append(f'nal_executor_jobs{{state="running"}} {len(snap[Job.RUNNING])}')
+    if save_hist is not None:
+        out.append("# HELP nal_config_save_duration_seconds save_config duration")
+        out.append("# TYPE nal_config_save_duration_seconds histogram")
+        _prom_histogram(out, "nal_config_save_duration_seconds", save_hist)
+    if ui_lag is not None:
+        out.append("# HELP nal_ui_loop_lag_seconds Qt event-loop lag measured by a heartbeat timer")
+        out.append("# TYPE nal_ui_loop_lag_seconds histogram")
+        _prom_histogram(out, "nal_ui_loop_lag_seconds", ui_lag)
+    return "\n".join(out) + "\n"
+
+class MetricsServer:
+    # 只绑定本机地址；collect() 返回 Prometheus 文本
+    def __init__(self, collect, port: int, host: str = "127.0.0.1"):
+        collect_fn = collect
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/metrics", "/"):
+                    self.send_error(404)
+                    return
+                try:
+                    body = collect_fn().encode("utf-8")
+                except Exception as e:
+                    self.send_error(500, str(e))
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="nal-metrics", daemon=True)
+
+    @property
+    def port(self) -> int:
+        return self.httpd.server_address[1]
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+def main(argv: Optional[List[str]] = None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+    if "--replay" in argv:
+        return replay_main(argv)
+    if "--load" in argv:
+        return load_main(argv)
+    if "--batch" in argv:
+        return batch_main(argv)
+    if "--proxy" in argv:
+        return proxy_main(argv)
+    print("用法: python nal_core.py --replay SESSION.jsonl [...] | --load [...] | --batch INPUT --out OUT [...] | --proxy [...]（加 -h 查看参数）")
+    return 2
+
+if __name__ == "__main__":
+    sys.exit(main())
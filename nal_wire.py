@@ -0,0 +1,190 @@
+"""
+NAL 二进制线格式（MessagePack，仅标准库）
+
+客户端（nal_core.NALClient / 本机代理）和替身服务器（server/nal_standin.py）共用：
+- 与 JSON 相同的数据模型：dict / list / str / int / float / bool / None
+- 长度 >= PACK_MIN_FLOATS 且元素全是 float 的列表编码为扩展类型 EXT_F64LE：小端 float64 紧凑数组，
+  解码时一次 frombytes 得到整个数组，不再逐个解析十进制文本（IO 曲线 2×100 个 double）
+- 编码协商：请求带 Accept: application/x-msgpack，服务器以同一 Content-Type 回应才改用二进制，否则一直用 JSON
+"""
+import struct
+import sys
+from array import array
+from typing import Any
+
+MSGPACK_TYPE = "application/x-msgpack"
+JSON_TYPE = "application/json"
+EXT_F64LE = 1
+PACK_MIN_FLOATS = 4
+
+class WireError(ValueError):
+    pass
+
+# ==============================
+# 编码
+# ==============================
+def _pack_len(out: bytearray, n: int, fix_base: int, fix_max: int, codes: tuple):
+    if n <= fix_max and fix_base is not None:
+        out.append(fix_base | n)
+    elif n <= 0xFF and codes[0] is not None:
+        out += struct.pack(">BB", codes[0], n)
+    elif n <= 0xFFFF:
+        out += struct.pack(">BH", codes[1], n)
+    else:
+        out += struct.pack(">BI", codes[2], n)
+
+def _pack_float_array(out: bytearray, values: list):
+    a = array("d", values)
+    if sys.byteorder == "big":
+        a.byteswap()
+    data = a.tobytes()
+    n = len(data)
+    if n <= 0xFF:
+        out += struct.pack(">BBb", 0xC7, n, EXT_F64LE)
+    elif n <= 0xFFFF:
+        out += struct.pack(">BHb", 0xC8, n, EXT_F64LE)
+    else:
+        out += struct.pack(">BIb", 0xC9, n, EXT_F64LE)
+    out += data
+
+def _pack(out: bytearray, obj: Any):
+    if obj is None:
+        out.append(0xC0)
+    elif obj is True:
+        out.append(0xC3)
+    elif obj is False:
+        out.append(0xC2)
+    elif isinstance(obj, int):
+        if 0 <= obj <= 0x7F:
+            out.append(obj)
+        elif -32 <= obj < 0:
+            out.append(obj & 0xFF)
+        elif 0 <= obj <= 0xFF:
+            out += struct.pack(">BB", 0xCC, obj)
+        elif 0 <= obj <= 0xFFFF:
+            out += struct.pack(">BH", 0xCD, obj)
+        elif 0 <= obj <= 0xFFFFFFFF:
+            out += struct.pack(">BI", 0xCE, obj)
+        elif -0x80000000 <= obj < 0:
+            out += struct.pack(">Bi", 0xD2, obj)
+        elif obj > 0:
+            out += struct.pack(">BQ", 0xCF, obj)
+        else:
+            out += struct.pack(">Bq", 0xD3, obj)
+    elif isinstance(obj, float):
+        out += struct.pack(">Bd", 0xCB, obj)
+    elif isinstance(obj, str):
+        data = obj.encode("utf-8")
+        _pack_len(out, len(data), 0xA0, 31, (0xD9, 0xDA, 0xDB))
+        out += data
+    elif isinstance(obj, (list, tuple)):
+        if len(obj) >= PACK_MIN_FLOATS and all(type(x) is float for x in obj):
+            _pack_float_array(out, obj)
+            return
+        _pack_len(out, len(obj), 0x90, 15, (None, 0xDC, 0xDD))
+        for x in obj:
+            _pack(out, x)
+    elif isinstance(obj, dict):
+        _pack_len(out, len(obj), 0x80, 15, (None, 0xDE, 0xDF))
+        for k, v in obj.items():
+            _pack(out, str(k))
+            _pack(out, v)
+    elif isinstance(obj, (bytes, bytearray)):
+        _pack_len(out, len(obj), None, -1, (0xC4, 0xC5, 0xC6))
+        out += obj
+    else:
+        raise WireError(f"无法编码的类型: {type(obj).__name__}")
+
+def packb(obj: Any) -> bytes:
+    out = bytearray()
+    _pack(out, obj)
+    return bytes(out)
+
+# ==============================
+# 解码
+# ==============================
+_U8 = struct.Struct(">B").unpack_from
+_U16 = struct.Struct(">H").unpack_from
+_U32 = struct.Struct(">I").unpack_from
+
+def _unpack(mv: memoryview, pos: int):
+    b = mv[pos]
+    pos += 1
+    if b <= 0x7F:
+        return b, pos
+    if b >= 0xE0:
+        return b - 0x100, pos
+    if 0xA0 <= b <= 0xBF:
+        n = b & 0x1F
+        return str(mv[pos:pos + n], "utf-8"), pos + n
+    if 0x90 <= b <= 0x9F:
+        return _unpack_array(mv, pos, b & 0x0F)
+    if 0x80 <= b <= 0x8F:
+        return _unpack_map(mv, pos, b & 0x0F)
+    if b == 0xC0:
+        return None, pos
+    if b == 0xC2:
+        return False, pos
+    if b == 0xC3:
+        return True, pos
+    if b == 0xCB:
+        return struct.unpack_from(">d", mv, pos)[0], pos + 8
+    if b == 0xCA:
+        return struct.unpack_from(">f", mv, pos)[0], pos + 4
+    if b in _INT_FORMATS:
+        fmt = _INT_FORMATS[b]
+        return fmt.unpack_from(mv, pos)[0], pos + fmt.size
+    if b in (0xD9, 0xDA, 0xDB, 0xC4, 0xC5, 0xC6):
+        size = {0xD9: 1, 0xDA: 2, 0xDB: 4, 0xC4: 1, 0xC5: 2, 0xC6: 4}[b]
+        n = (_U8, _U16, _U32)[size.bit_length() - 1](mv, pos)[0]
+        pos += size
+        data = mv[pos:pos + n]
+        return (str(data, "utf-8") if b >= 0xD9 else bytes(data)), pos + n
+    if b in (0xDC, 0xDD):
+        n = (_U16 if b == 0xDC else _U32)(mv, pos)[0]
+        return _unpack_array(mv, pos + (2 if b == 0xDC else 4), n)
+    if b in (0xDE, 0xDF):
+        n = (_U16 if b == 0xDE else _U32)(mv, pos)[0]
+        return _unpack_map(mv, pos + (2 if b == 0xDE else 4), n)
+    if b in (0xC7, 0xC8, 0xC9):
+        size = {0xC7: 1, 0xC8: 2, 0xC9: 4}[b]
+        n = (_U8, _U16, _U32)[size.bit_length() - 1](mv, pos)[0]
+        pos += size
+        ext = struct.unpack_from(">b", mv, pos)[0]
+        pos += 1
+        if ext != EXT_F64LE or n % 8:
+            raise WireError(f"未知的扩展类型 {ext}")
+        a = array("d")
+        a.frombytes(mv[pos:pos + n])
+        if sys.byteorder == "big":
+            a.byteswap()
+        return a.tolist(), pos + n
+    raise WireError(f"不支持的 MessagePack 类型字节 0x{b:02x}")
+
+_INT_FORMATS = {0xCC: struct.Struct(">B"), 0xCD: struct.Struct(">H"), 0xCE: struct.Struct(">I"), 0xCF: struct.Struct(">Q"),
+                0xD0: struct.Struct(">b"), 0xD1: struct.Struct(">h"), 0xD2: struct.Struct(">i"), 0xD3: struct.Struct(">q")}
+
+def _unpack_array(mv: memoryview, pos: int, n: int):
+    out = []
+    for _ in range(n):
+        v, pos = _unpack(mv, pos)
+        out.append(v)
+    return out, pos
+
+def _unpack_map(mv: memoryview, pos: int, n: int):
+    out = {}
+    for _ in range(n):
+        k, pos = _unpack(mv, pos)
+        v, pos = _unpack(mv, pos)
+        out[k] = v
+    return out, pos
+
+def unpackb(data: bytes) -> Any:
+    mv = memoryview(data)
+    try:
+        obj, pos = _unpack(mv, 0)
+    except (IndexError, struct.error, UnicodeDecodeError) as e:
+        raise WireError(f"MessagePack 数据不完整: {e}") from e
+    if pos != len(mv):
+        raise WireError("MessagePack 数据末尾有多余字节")
+    return obj
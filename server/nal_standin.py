@@ -0,0 +1,456 @@
+"""
+NAL-NL2 本地替身服务器（纯 Python，仅标准库）
+
+不需要 Android 手机即可在 Linux/Windows 上对客户端做基准测试和联调：
+- 实现 POST /api/nal2/process，请求/响应格式与手机端 App 相同
+- 响应来源（按优先级）：
+  1. server/data.json 历史记录里参数完全相同的真实响应
+  2. 之前 Set* 写入的个性化数据（例如 SetREDDindiv 之后 GetREDDindiv 返回同一组值）
+  3. 按 NAL-NL2_API_Functions.md 的输出声明合成：长度正确，数值由听力图/输入级推导，同参数结果确定
+- 参数校验与手机端一致：未知函数、缺少 input_parameters、centreFreq 长度 != channels+1 返回 return=-1
+- 故障注入：网络延迟 + 抖动、丢包（直接断开连接）、5xx 错误率
+- --concurrency 限制同时计算的请求数（模拟手机 CPU），--service-ms 为每次计算占用的时间
+- 可选：--batch 接受 JSON 数组批量请求；--compress 按 Accept-Encoding 返回 gzip/deflate；
+  --msgpack 接受 MessagePack 请求体、按 Accept 返回 MessagePack（编码见 nal_wire.py，用于对比负载大小和解码耗时）
+- 能力查询：POST {"function": "capabilities"} 按当前开关返回编码、压缩、批量、并发数（手机端 App 没有此函数）
+- GET /stats 返回计数、最大排队深度等
+
+用法:
+    python server/nal_standin.py --port 8080 --latency-ms 30 --jitter-ms 10 --loss 0.01 --concurrency 1 --service-ms 15
+"""
+import argparse
+import glob
+import gzip
+import hashlib
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_TEST_DATA = os.path.join(HERE, "test_data")
+DEFAULT_HISTORY = os.path.join(HERE, "data.json")
+DEFAULT_API_DOC = os.path.join(os.path.dirname(HERE), "NAL-NL2_API_Functions.md")
+API_PATH = "/api/nal2/process"
+
+sys.path.insert(0, os.path.dirname(HERE))  # 与客户端共用 nal_wire（同样只用标准库）
+from nal_wire import MSGPACK_TYPE, packb, unpackb  # noqa: E402
+
+# 听力图 9 点频率 / 三分之一倍频程 19 点频率
+AUDIOGRAM_FREQS = [250, 500, 1000, 1500, 2000, 3000, 4000, 6000, 8000]
+THIRD_OCT_FREQS = [125, 160, 200, 250, 315, 400, 500, 630, 800, 1000, 1250, 1600,
+                   2000, 2500, 3150, 4000, 5000, 6300, 8000]
+NO_RESPONSE = 999.0
+
+# 文档里长度写成 [] 的输出：长度与手机端实际返回一致（HttpServer.kt 里 CR 是 DoubleArray(19)）
+VARIABLE_OUTPUT_LEN = {
+    "CR": lambda p: 19,
+    "centerF": lambda p: int(p.get("channels", 18)),
+    "CFArray": lambda p: 19,
+}
+
+# 手机端输出键名与文档不同的函数：函数名 -> {文档里的名字: HttpServer.kt 的输出键}
+OUTPUT_KEY_OVERRIDES = {
+    "GetREDDindiv9": {"REDD": "REDD9"},
+    "GetREURindiv9": {"REUR": "REUR9"},
+}
+
+# ==============================
+# 夹具加载
+# ==============================
+_OUTPUT_RE = re.compile(r"^\s*output\s+(int|double)\s*(\*)?\s*(\w+)\s*(?:\[(\w*)\])?")
+_FUNC_RE = re.compile(r"^\s*(int|double|void)\s+(\w+)\s*\(")
+
+def load_output_specs(doc_path: str) -> Dict[str, Dict[str, Any]]:
+    """解析 API 文档：函数名 -> {"returns": "int"/"double"/"void", "outputs": [(name, type, len or None/"")]}"""
+    specs: Dict[str, Dict[str, Any]] = {}
+    current = None
+    with open(doc_path, "r", encoding="utf-8") as f:
+        for line in f:
+            m = _FUNC_RE.match(line)
+            if m:
+                current = specs.setdefault(m.group(2), {"returns": m.group(1), "outputs": []})
+                continue
+            m = _OUTPUT_RE.match(line)
+            if m and current is not None:
+                kind, ptr, name, size = m.groups()
+                n = None if ptr or size is None else (int(size) if size.isdigit() else "")
+                current["outputs"].append((name, kind, n))
+    return specs
+
+def load_fixture_requests(test_data_dir: str) -> Dict[str, Dict[str, Any]]:
+    """test_data/NN_<function>_data.json：函数名 -> 示例 input_parameters"""
+    out = {}
+    for path in sorted(glob.glob(os.path.join(test_data_dir, "*_data.json"))):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                body = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if isinstance(body, dict) and body.get("function"):
+            out[body["function"]] = body.get("input_parameters") or {}
+    return out
+
+def _params_key(function: str, params: Any) -> str:
+    return function + "\0" + json.dumps(params, sort_keys=True)
+
+def load_recorded_responses(history_path: str) -> Dict[str, Dict[str, Any]]:
+    """data.json 历史记录里成功的调用：(函数名, 参数) -> 响应"""
+    out: Dict[str, Dict[str, Any]] = {}
+    try:
+        with open(history_path, "r", encoding="utf-8") as f:
+            history = json.load(f).get("history", [])
+    except (OSError, ValueError):
+        return out
+    for h in history:
+        try:
+            req = json.loads(h.get("input") or "")
+            resp = json.loads(h.get("output") or "")
+        except ValueError:
+            continue
+        if not isinstance(req, dict) or not isinstance(resp, dict) or resp.get("return") != 0:
+            continue
+        out[_params_key(req.get("function", ""), req.get("input_parameters") or {})] = resp
+    return out
+
+# ==============================
+# 响应合成
+# ==============================
+def _interp_audiogram(ac: List[float]) -> List[float]:
+    # 9 点听阈插值到 19 个三分之一倍频程频点（999 视为无反应，按 120 dB 计）
+    pts = [(f, 120.0 if v >= NO_RESPONSE else float(v)) for f, v in zip(AUDIOGRAM_FREQS, ac)]
+    out = []
+    for f in THIRD_OCT_FREQS:
+        if f <= pts[0][0]:
+            out.append(pts[0][1])
+            continue
+        if f >= pts[-1][0]:
+            out.append(pts[-1][1])
+            continue
+        for (f0, v0), (f1, v1) in zip(pts, pts[1:]):
+            if f0 <= f <= f1:
+                out.append(v0 + (v1 - v0) * (f - f0) / (f1 - f0))
+                break
+    return out
+
+def _rng(function: str, params: Dict[str, Any]) -> random.Random:
+    digest = hashlib.sha1(_params_key(function, params).encode("utf-8")).digest()
+    return random.Random(int.from_bytes(digest[:8], "big"))
+
+def synthesize(function: str, params: Dict[str, Any], spec: Dict[str, Any],
+               state: Dict[str, Any]) -> Dict[str, Any]:
+    """按文档输出声明合成响应；同一 (function, params, state) 结果不变"""
+    rng = _rng(function, params)
+    ac = params.get("AC")
+    hl = _interp_audiogram(ac) if isinstance(ac, list) and len(ac) == 9 else [40.0] * 19
+    level = float(params.get("L", 65.0))
+    # 类 NAL 增益：约为听损的一半，输入级每高 1 dB 增益少 0.3 dB
+    gain = [max(0.0, 0.48 * h - 0.3 * (level - 65.0) - (6.0 if f < 500 else 0.0)) for h, f in zip(hl, THIRD_OCT_FREQS)]
+    formulas = {
+        "REIG": gain, "REAG": [g + (12.0 if 2000 <= f <= 4000 else 2.0) for g, f in zip(gain, THIRD_OCT_FREQS)],
+        "TccCG": [g + 5.0 for g in gain], "ESG": [g + 3.0 for g in gain], "MPO": [min(130.0, 90.0 + 0.3 * h) for h in hl],
+        "CT": [max(20.0, 55.0 - 0.2 * h) for h in hl], "AT": [max(0.0, h - g) for h, g in zip(hl, gain)],
+        "MAF": [0.0] * 19, "MLE": [0.0] * 19,
+    }
+    outputs: Dict[str, Any] = {}
+    renames = OUTPUT_KEY_OVERRIDES.get(function, {})
+    for name, kind, n in spec.get("outputs", []):
+        name = renames.get(name, name)
+        if n is None:
+            outputs[name] = {"major": 1, "minor": 0}.get(name, 0)
+            continue
+        size = VARIABLE_OUTPUT_LEN.get(name, lambda p: 19)(params) if n == "" else n
+        if name in state and isinstance(state[name], list) and len(state[name]) == size:
+            vals = list(state[name])
+        elif name in formulas and size == 19:
+            vals = formulas[name]
+        elif name == "CR":
+            vals = [round(1.0 + hl[min(18, i * 19 // max(1, size))] / 60.0, 2) for i in range(size)]
+        elif name == "centerF":
+            vals = [THIRD_OCT_FREQS[min(18, (i * 19) // max(1, size))] for i in range(size)]
+        elif size == 100:
+            # IO 曲线：输入 0..99 dB，输出 = 输入 + 增益（压缩后）
+            g = sum(gain) / len(gain)
+            vals = [i + max(0.0, g - 0.4 * max(0, i - 50)) for i in range(size)]
+        elif name == "lineType" or name == "FreqInCh":
+            vals = [0] * size
+        else:
+            vals = [round(rng.uniform(0.0, 30.0), 2) for _ in range(size)]
+        if kind == "int":
+            vals = [int(round(v)) for v in vals]
+        else:
+            vals = [round(float(v), 4) for v in vals]
+        outputs[name] = vals
+    if spec.get("returns") == "double":
+        ret = round(rng.uniform(0.3, 0.9), 4) if function.startswith("Get_SI") else round(sum(gain) / len(gain), 4)
+    else:
+        ret = 0
+    # Set* 在手机端只回 "return": 0，output_parameters 为空对象
+    return {"function": function, "return": ret, "output_parameters": outputs}
+
+def validate(function: str, params: Any, specs: Dict[str, Any]) -> Optional[str]:
+    # 与手机端一致的错误信息
+    if function not in specs:
+        return f"未知函数: {function}"
+    if not isinstance(params, dict):
+        return "缺少输入参数"
+    cf = params.get("centreFreq")
+    if isinstance(cf, list) and "channels" in params and len(cf) != int(params["channels"]) + 1:
+        return f"❌ 参数错误: centreFreq 长度应为 {int(params['channels']) + 1}，实际为 {len(cf)}"
+    return None
+
+# ==============================
+# 服务器
+# ==============================
+class StandInConfig:
+    def __init__(self, latency_ms: float = 0.0, jitter_ms: float = 0.0, loss: float = 0.0, error_rate: float = 0.0,
+                 concurrency: int = 0, service_ms: float = 0.0, batch: bool = False, compress: bool = False,
+                 compress_min: int = 1024, seed: Optional[int] = None, binary: bool = False):
+        self.latency_ms = latency_ms      # 网络单程延迟（计算前后各一半）
+        self.jitter_ms = jitter_ms        # 延迟抖动（均匀分布 ±）
+        self.loss = loss                  # 丢包概率：不回响应直接断开
+        self.error_rate = error_rate      # 返回 503 的概率
+        self.concurrency = concurrency    # 同时计算的请求数上限；0 = 不限
+        self.service_ms = service_ms      # 每次计算占用时间（持有并发槽位）
+        self.batch = batch
+        self.compress = compress
+        self.compress_min = compress_min
+        self.seed = seed
+        self.binary = binary              # 支持 MessagePack（请求 Content-Type / 响应 Accept）
+
+class StandInServer:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, config: Optional[StandInConfig] = None,
+                 test_data: str = DEFAULT_TEST_DATA, history: str = DEFAULT_HISTORY, api_doc: str = DEFAULT_API_DOC):
+        self.config = config or StandInConfig()
+        self.specs = load_output_specs(api_doc)
+        self.fixtures = load_fixture_requests(test_data)
+        self.recorded = load_recorded_responses(history)
+        self.state: Dict[str, Any] = {}     # Set* 写入的个性化数组（按参数名）
+        self._state_lock = threading.Lock()
+        self._rand = random.Random(self.config.seed)
+        self._slots = threading.BoundedSemaphore(self.config.concurrency) if self.config.concurrency > 0 else None
+        self._stats_lock = threading.Lock()
+        self.stats = {"requests": 0, "calls": 0, "errors": 0, "dropped": 0, "injected_5xx": 0,
+                      "in_flight": 0, "max_in_flight": 0, "waiting": 0, "max_waiting": 0,
+                      "recorded_hits": 0, "bytes_in": 0, "bytes_out": 0, "binary_in": 0, "binary_out": 0}
+        self._httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self._httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def port(self) -> int:
+        return self._httpd.server_address[1]
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="nal-standin", daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        self._httpd.serve_forever()
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def _bump(self, key: str, delta: int = 1):
+        with self._stats_lock:
+            self.stats[key] += delta
+            peak = "max_" + key
+            if peak in self.stats:
+                self.stats[peak] = max(self.stats[peak], self.stats[key])
+
+    def _sleep_network(self):
+        cfg = self.config
+        if cfg.latency_ms or cfg.jitter_ms:
+            with self._state_lock:
+                j = self._rand.uniform(-cfg.jitter_ms, cfg.jitter_ms)
+            time.sleep(max(0.0, cfg.latency_ms + j) / 2000.0)
+
+    def capabilities(self, seq: Any = 0) -> Dict[str, Any]:
+        cfg = self.config
+        caps = {"server": "nal-standin", "encodings": ["application/json"] + ([MSGPACK_TYPE] if cfg.binary else []),
+                "compression": ["gzip", "deflate"] if cfg.compress else [], "batch": cfg.batch,
+                "max_concurrency": cfg.concurrency}
+        return {"sequence_num": seq, "function": "capabilities", "return": 0, "output_parameters": caps}
+
+    def process(self, body: Any) -> Dict[str, Any]:
+        """处理单个请求体，返回响应 dict（不含网络注入）"""
+        if not isinstance(body, dict):
+            return {"sequence_num": 0, "function": "unknown", "return": -1, "output_parameters": {"error": "请求格式错误"}}
+        function = body.get("function") or "未知函数"
+        params = body.get("input_parameters")
+        seq = body.get("sequence_num", 0)
+        error = validate(function, params, self.specs)
+        if error is not None:
+            self._bump("errors")
+            return {"sequence_num": seq, "function": function, "return": -1, "output_parameters": {"error": error}}
+        if self._slots is not None:
+            self._bump("waiting")
+            self._slots.acquire()
+            self._bump("waiting", -1)
+        self._bump("in_flight")
+        try:
+            if self.config.service_ms:
+                time.sleep(self.config.service_ms / 1000.0)
+            with self._state_lock:
+                state = dict(self.state)
+            # Set* 写过的数组优先于历史记录（GetREDDindiv 等返回个性化值）
+            personalised = any(name in state for name, _k, _n in self.specs[function]["outputs"])
+            resp = None if personalised else self.recorded.get(_params_key(function, params))
+            if resp is not None:
+                self._bump("recorded_hits")
+                out = dict(resp)
+            else:
+                out = synthesize(function, params, self.specs[function], state)
+            if function.lower().startswith("set"):
+                with self._state_lock:
+                    self.state.update({k: v for k, v in params.items() if isinstance(v, list)})
+        finally:
+            self._bump("in_flight", -1)
+            if self._slots is not None:
+                self._slots.release()
+        self._bump("calls")
+        out["sequence_num"] = seq
+        out["function"] = function
+        return out
+
+    def _handler_class(self):
+        srv = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True  # 头和正文分两次写，避免与延迟 ACK 叠加出 40ms 停顿
+
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, status: int, obj: Any):
+                if srv.config.binary and MSGPACK_TYPE in self.headers.get("Accept", ""):
+                    srv._bump("binary_out")
+                    data = packb(obj)
+                    headers = {"Content-Type": MSGPACK_TYPE}
+                else:
+                    data = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+                    headers = {"Content-Type": "application/json; charset=utf-8"}
+                accept = self.headers.get("Accept-Encoding", "")
+                if srv.config.compress and len(data) >= srv.config.compress_min:
+                    if "gzip" in accept:
+                        data = gzip.compress(data, 5)
+                        headers["Content-Encoding"] = "gzip"
+                    elif "deflate" in accept:
+                        data = zlib.compress(data, 5)
+                        headers["Content-Encoding"] = "deflate"
+                srv._bump("bytes_out", len(data))
+                self.send_response(status)
+                for k, v in headers.items():
+                    self.send_header(k, v)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                path = self.path.split("?")[0]
+                if path == "/stats":
+                    with srv._stats_lock:
+                        stats = dict(srv.stats)
+                    self._reply(200, stats)
+                elif path == "/fixtures":
+                    self._reply(200, srv.fixtures)
+                else:
+                    self.send_error(404)
+
+            def do_POST(self):
+                if self.path.split("?")[0] != API_PATH:
+                    self.send_error(404)
+                    return
+                raw = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                srv._bump("requests")
+                srv._bump("bytes_in", len(raw))
+                enc = self.headers.get("Content-Encoding", "").lower()
+                binary = self.headers.get("Content-Type", "").startswith(MSGPACK_TYPE)
+                cfg = srv.config
+                with srv._state_lock:
+                    drop = cfg.loss and srv._rand.random() < cfg.loss
+                    fail = cfg.error_rate and srv._rand.random() < cfg.error_rate
+                srv._sleep_network()
+                if drop:
+                    srv._bump("dropped")
+                    self.close_connection = True
+                    return
+                if fail:
+                    srv._bump("injected_5xx")
+                    self._reply(503, {"return": -1, "output_parameters": {"error": "injected 503"}})
+                    return
+                if binary and not cfg.binary:
+                    self._reply(415, {"return": -1, "output_parameters": {"error": "未启用 MessagePack(--msgpack)"}})
+                    return
+                if enc and enc != "identity" and not cfg.compress:
+                    self._reply(415, {"return": -1, "output_parameters": {"error": f"未启用压缩(--compress): {enc}"}})
+                    return
+                try:
+                    if enc == "gzip":
+                        raw = gzip.decompress(raw)
+                    elif enc == "deflate":
+                        raw = zlib.decompress(raw)
+                    if binary:
+                        srv._bump("binary_in")
+                        body = unpackb(raw)
+                    else:
+                        body = json.loads(raw)
+                except (OSError, ValueError, zlib.error):
+                    self._reply(400, {"return": -1, "output_parameters": {"error": "请求格式错误"}})
+                    return
+                if isinstance(body, dict) and body.get("function") == "capabilities":
+                    out: Any = srv.capabilities(body.get("sequence_num", 0))
+                elif isinstance(body, list):
+                    if not cfg.batch:
+                        self._reply(400, {"return": -1, "output_parameters": {"error": "未启用批量请求(--batch)"}})
+                        return
+                    out = [srv.process(b) for b in body]  # 批内按顺序执行，保持 Set*/Get* 先后关系
+                else:
+                    out = srv.process(body)
+                srv._sleep_network()
+                self._reply(200, out)
+
+        return Handler
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="NAL-NL2 本地替身服务器")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8080)
+    ap.add_argument("--latency-ms", type=float, default=0.0, help="往返网络延迟")
+    ap.add_argument("--jitter-ms", type=float, default=0.0, help="延迟抖动（±）")
+    ap.add_argument("--loss", type=float, default=0.0, help="丢包概率 0..1（断开连接不回响应）")
+    ap.add_argument("--error-rate", type=float, default=0.0, help="返回 503 的概率 0..1")
+    ap.add_argument("--concurrency", type=int, default=1, help="同时计算的请求数（手机端 DLL 为单线程，默认 1；0 = 不限）")
+    ap.add_argument("--service-ms", type=float, default=0.0, help="每次计算耗时")
+    ap.add_argument("--batch", action="store_true", help="接受 JSON 数组批量请求")
+    ap.add_argument("--compress", action="store_true", help="按 Accept-Encoding 压缩响应")
+    ap.add_argument("--compress-min", type=int, default=1024, help="小于该字节数的响应不压缩")
+    ap.add_argument("--msgpack", action="store_true", help="支持 MessagePack 请求/响应（按 Content-Type / Accept 协商）")
+    ap.add_argument("--seed", type=int, default=None, help="故障注入随机种子")
+    ap.add_argument("--test-data", default=DEFAULT_TEST_DATA)
+    ap.add_argument("--history", default=DEFAULT_HISTORY)
+    ap.add_argument("--api-doc", default=DEFAULT_API_DOC)
+    args = ap.parse_args(argv)
+
+    cfg = StandInConfig(args.latency_ms, args.jitter_ms, args.loss, args.error_rate, args.concurrency,
+                        args.service_ms, args.batch, args.compress, args.compress_min, args.seed, args.msgpack)
+    srv = StandInServer(args.host, args.port, cfg, args.test_data, args.history, args.api_doc)
+    print(f"NAL 替身服务器: http://{args.host}:{srv.port}{API_PATH}  "
+          f"({len(srv.specs)} 个函数, {len(srv.fixtures)} 个夹具, {len(srv.recorded)} 条真实响应)")
+    try:
+        srv.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
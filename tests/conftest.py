@@ -0,0 +1,28 @@
+"""
+测试公共夹具：仓库根目录和 server/ 加入 sys.path，替身服务器在随机端口上启动
+"""
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for _p in (ROOT, os.path.join(ROOT, "server")):
+    if _p not in sys.path:
+        sys.path.insert(0, _p)
+
+import nal_standin  # noqa: E402
+
+@pytest.fixture
+def standin():
+    """standin(**StandInConfig 字段) -> 已启动的 StandInServer（端口 0），用例结束后自动停止"""
+    servers = []
+
+    def start(**kw):
+        srv = nal_standin.StandInServer("127.0.0.1", 0, nal_standin.StandInConfig(**kw)).start()
+        servers.append(srv)
+        return srv
+
+    yield start
+    for srv in servers:
+        srv.stop()
@@ -0,0 +1,68 @@
+"""
+听力图批量验配：单条记录出错不影响其它记录；--resume 只跳过已成功的记录
+"""
+import json
+import os
+
+import nal_core
+from conftest import ROOT
+
+TEMPLATES = nal_core.load_templates_list(os.path.join(ROOT, nal_core.DEFAULT_TEMPLATES_FILE))
+AC_A = [45, 40, 40, 45, 50, 55, 60, 65, 70]
+AC_B = [30, 30, 35, 40, 45, 50, 55, 60, 65]
+
+def _pool(*servers) -> nal_core.EndpointPool:
+    pool = nal_core.EndpointPool.from_servers([f"127.0.0.1:{s.port}" for s in servers], "/api/nal2/process")
+    assert pool.connect() == []
+    return pool
+
+def _run(pool, records, workers):
+    return list(nal_core.run_batch(records, pool, nal_core.AppConfig(), TEMPLATES, ("reig", "ct"), workers))
+
+def test_malformed_record_does_not_stop_batch(standin):
+    pool = _pool(standin(), standin())
+    records = [("a", {"AC": AC_A}), ("bad", {"channels": {"a": 1}}), ("nulls", {"AC": [None] * 9}), ("b", {"AC": AC_B})]
+    for workers in (1, 2):
+        rows = _run(pool, list(records), workers)
+        assert [r["id"] for r in rows] == ["a", "bad", "nulls", "b"]
+        assert [r["ok"] for r in rows] == [True, False, False, True]
+        assert rows[1]["error"].startswith("TypeError")
+        assert set(rows[3]["outputs"]) == {"REIG", "CT"}
+
+def _batch_main(tmp_path, srv, *extra) -> int:
+    return nal_core.batch_main(["--batch", str(tmp_path / "in.csv"), "--out", str(tmp_path / "out.jsonl"),
+                                "--server", f"127.0.0.1:{srv.port}", "--outputs", "reig",
+                                "--config", str(tmp_path / "missing_config.json"),
+                                "--templates", os.path.join(ROOT, nal_core.DEFAULT_TEMPLATES_FILE), *extra])
+
+def _rows(tmp_path):
+    with open(tmp_path / "out.jsonl", "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+def test_batch_then_resume(standin, tmp_path):
+    srv = standin()
+    (tmp_path / "in.csv").write_text("id,AC\na,%s\nb,%s\nc,%s\n" % (" ".join(map(str, AC_A)), "1 2 3",
+                                                                   " ".join(map(str, AC_B))), encoding="utf-8")
+    assert _batch_main(tmp_path, srv) == 1  # 有失败的记录
+    rows = _rows(tmp_path)
+    assert [(r["id"], r["ok"]) for r in rows] == [("a", True), ("b", False), ("c", True)]
+
+    # 修正 b 后续跑：只重跑失败的 b，结果追加在后面
+    (tmp_path / "in.csv").write_text("id,AC\na,%s\nb,%s\nc,%s\n" % (" ".join(map(str, AC_A)), " ".join(map(str, AC_B)),
+                                                                   " ".join(map(str, AC_B))), encoding="utf-8")
+    calls = srv.stats["calls"]
+    assert _batch_main(tmp_path, srv, "--resume") == 0
+    rows = _rows(tmp_path)
+    assert [(r["id"], r["ok"]) for r in rows] == [("a", True), ("b", False), ("c", True), ("b", True)]
+    assert srv.stats["calls"] > calls
+    assert rows[3]["outputs"]["REIG"] == rows[2]["outputs"]["REIG"]  # 同一听力图
+
+def test_resume_tolerates_truncated_line(standin, tmp_path):
+    srv = standin()
+    (tmp_path / "in.csv").write_text("id,AC\na,%s\n" % " ".join(map(str, AC_A)), encoding="utf-8")
+    (tmp_path / "out.jsonl").write_text('{"id": "a", "ok": tr', encoding="utf-8")  # 上次中断写了半行
+    assert _batch_main(tmp_path, srv, "--resume") == 0
+    with open(tmp_path / "out.jsonl", "r", encoding="utf-8") as f:
+        lines = f.read().splitlines()
+    assert lines[0] == '{"id": "a", "ok": tr'
+    assert json.loads(lines[1])["ok"] is True
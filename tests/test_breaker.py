@@ -0,0 +1,162 @@
+"""
+CircuitBreaker / HealthMonitor：状态转换；半开状态的试探请求无论以何种方式结束都要释放
+"""
+import threading
+import time
+
+import pytest
+import requests
+from requests.exceptions import ChunkedEncodingError
+
+import nal_core
+from nal_core import CircuitBreaker
+
+def _client(srv) -> nal_core.NALClient:
+    c = nal_core.NALClient()
+    c.set_server("127.0.0.1", srv.port, "/api/nal2/process")
+    assert c.connect()
+    return c
+
+def _half_open(c: nal_core.NALClient):
+    # cooldown = 0：下一次 allow() 即进入半开并放行一次试探
+    c.breaker = CircuitBreaker(threshold=1, cooldown=0.0)
+    c.breaker.record_failure()
+    assert c.breaker.state == CircuitBreaker.OPEN
+
+class _FakeSession:
+    def __init__(self, result):
+        self.result = result
+        self.calls = 0
+
+    def post(self, *args, **kwargs):
+        self.calls += 1
+        if isinstance(self.result, BaseException):
+            raise self.result
+        return self.result
+
+def _response(status: int, content: bytes) -> requests.Response:
+    r = requests.Response()
+    r.status_code = status
+    r._content = content
+    r.headers["Content-Type"] = "application/json"
+    return r
+
+# ---- 状态机 ----
+def test_transitions():
+    seen = []
+    b = CircuitBreaker(threshold=2, cooldown=0.05, on_change=seen.append)
+    assert b.allow()
+    b.record_failure()
+    assert b.state == CircuitBreaker.CLOSED
+    b.record_failure()
+    assert b.state == CircuitBreaker.OPEN and not b.allow()
+    assert 0.0 < b.retry_after() <= 0.05
+    time.sleep(0.06)
+    assert b.allow()          # 半开：只放行一个试探
+    assert not b.allow()
+    b.record_failure()        # 试探失败：重新熔断
+    assert b.state == CircuitBreaker.OPEN
+    time.sleep(0.06)
+    assert b.allow()
+    b.record_success()
+    assert b.state == CircuitBreaker.CLOSED and b.allow()
+    assert seen == ["open", "half_open", "open", "half_open", "closed"]
+
+def test_success_resets_failure_count():
+    b = CircuitBreaker(threshold=2, cooldown=1.0)
+    b.record_failure()
+    b.record_success()
+    b.record_failure()
+    assert b.state == CircuitBreaker.CLOSED
+
+def test_open_breaker_rejects_without_network(standin):
+    c = _client(standin())
+    c.breaker = CircuitBreaker(threshold=1, cooldown=60.0)
+    c.breaker.record_failure()
+    fake = c._local.session = _FakeSession(AssertionError("不应发出请求"))
+    with pytest.raises(nal_core.CircuitOpenError):
+        c.post_json({"function": "dllVersion", "input_parameters": {}})
+    assert fake.calls == 0
+
+# ---- 半开试探的各种结束方式 ----
+def test_trial_released_after_unexpected_request_exception(standin):
+    c = _client(standin())
+    _half_open(c)
+    c._local.session = _FakeSession(ChunkedEncodingError("连接中途断开"))
+    with pytest.raises(ChunkedEncodingError):
+        c.post_json({"function": "dllVersion", "input_parameters": {}})
+    assert c.breaker.state == CircuitBreaker.OPEN
+    assert c.breaker.allow()  # cooldown 为 0：可以再次试探，而不是一直卡在半开
+
+def test_trial_released_after_non_retry_status(standin):
+    c = _client(standin())
+    _half_open(c)
+    c._local.session = _FakeSession(_response(500, b'{"return": -1}'))
+    with pytest.raises(requests.HTTPError):
+        c.post_json({"function": "dllVersion", "input_parameters": {}})
+    assert c.breaker.state == CircuitBreaker.CLOSED  # 服务器有应答
+
+def test_trial_released_after_refused_wire_format(standin):
+    srv = standin(binary=True)
+    c = _client(srv)
+    srv.config.binary = False  # 415 后退回 JSON 重发：两次都有应答
+    _half_open(c)
+    c.breaker.threshold = 1
+    out = c.post_json({"function": "dllVersion", "input_parameters": {}})
+    assert out["return"] == 0
+    assert c.breaker.state == CircuitBreaker.CLOSED
+
+def test_trial_released_after_decode_error(standin):
+    c = _client(standin())
+    _half_open(c)
+    c._local.session = _FakeSession(_response(200, b"not json"))
+    with pytest.raises(ValueError):
+        c.post_json({"function": "dllVersion", "input_parameters": {}})
+    assert c.breaker.state == CircuitBreaker.CLOSED
+    assert c.breaker.allow()
+
+def test_trial_failure_reopens(standin):
+    c = _client(standin())
+    _half_open(c)
+    c._local.session = _FakeSession(requests.ConnectionError("拒绝连接"))
+    with pytest.raises(requests.ConnectionError):
+        c.post_json({"function": "dllVersion", "input_parameters": {}})
+    assert c.breaker.state == CircuitBreaker.OPEN
+
+# ---- 健康检查 ----
+def test_health_monitor_reports_and_closes_breaker(standin):
+    srv = standin()
+    c = _client(srv)
+    c.breaker = CircuitBreaker(threshold=1, cooldown=60.0)
+    c.breaker.record_failure()
+    results = []
+    got = threading.Event()
+
+    def on_result(ok, latency):
+        results.append((ok, latency))
+        got.set()
+
+    mon = nal_core.HealthMonitor(c, interval=60.0, on_result=on_result)
+    mon.start()
+    try:
+        assert got.wait(5)
+        assert results[0][0] is True and results[0][1] > 0
+        assert c.breaker.state == CircuitBreaker.CLOSED  # 探测成功即恢复
+
+        c.port = 1  # 换成没有服务的端口
+        got.clear()
+        mon.probe_now()
+        assert got.wait(5)
+        assert results[-1] == (False, None)
+        assert c.breaker.state == CircuitBreaker.OPEN
+    finally:
+        mon.stop()
+
+def test_health_monitor_idle_when_disconnected():
+    c = nal_core.NALClient()
+    results = []
+    mon = nal_core.HealthMonitor(c, interval=0.01, on_result=lambda ok, lat: results.append(ok))
+    mon.start()
+    time.sleep(0.05)
+    mon.stop()
+    assert results == []
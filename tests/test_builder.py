@@ -0,0 +1,100 @@
+"""
+RequestBuilder：别名取值、覆盖参数、JSON 片段缓存；BuiltParams 被修改后 .json 失效
+"""
+import json
+import os
+
+import pytest
+
+import nal_core
+from conftest import ROOT
+
+TEMPLATES = nal_core.load_templates_list(os.path.join(ROOT, nal_core.DEFAULT_TEMPLATES_FILE))
+
+@pytest.fixture
+def builder():
+    return nal_core.RequestBuilder(TEMPLATES)
+
+@pytest.fixture
+def cfg():
+    return nal_core.AppConfig()
+
+def test_aliases(builder, cfg):
+    cfg.CFArray = [100 + i for i in range(len(cfg.CFArray))]
+    cfg.centerF = [200 + i for i in range(len(cfg.centerF))]
+    cfg.compSpeed = 2
+    assert builder.params("setBWC", cfg)["crossOver"] == cfg.CFArray
+    assert builder.params("CompressionRatio_NL2", cfg)["centreFreq"] == cfg.centerF
+    assert builder.params("Get_SII", cfg)["nCompSpeed"] == 2
+
+def test_params_follow_template_order(builder, cfg):
+    for t in TEMPLATES:
+        p = builder.params(t["function"], cfg)
+        assert list(p) == list(t.get("params", []))
+        assert p.json == json.dumps(dict(p))
+
+def test_overrides(builder, cfg):
+    p = builder.params("CompressionRatio_NL2", cfg, channels=4, centreFreq=[1, 2, 3, 4, 5])
+    assert p["channels"] == 4 and p["centreFreq"] == [1, 2, 3, 4, 5]
+    assert p["AC"] == cfg.AC
+    assert json.loads(p.json) == dict(p)
+
+def test_request_shape(builder, cfg):
+    body = builder.request("Get_SII", cfg)
+    assert body["function"] == "Get_SII"
+    assert isinstance(body["input_parameters"], nal_core.BuiltParams)
+
+def test_fragment_cache_tracks_value_changes(builder, cfg):
+    builder.params("setBWC", cfg)
+    misses = builder.cache_misses
+    builder.params("setBWC", cfg)
+    assert builder.cache_misses == misses and builder.cache_hits >= 2
+    cfg.CFArray = list(cfg.CFArray)
+    cfg.CFArray[0] += 1
+    p = builder.params("setBWC", cfg)
+    assert builder.cache_misses == misses + 1
+    assert p.json == json.dumps(dict(p))
+    # 1 与 1.0 相等但序列化不同，不能复用
+    a = builder.params("GainAt_NL2", cfg, L=65)
+    b = builder.params("GainAt_NL2", cfg, L=65.0)
+    assert '"L": 65,' in a.json and '"L": 65.0,' in b.json
+
+# ---- BuiltParams.json 失效（630dbc9 之前 setdefault/clear/popitem/|= 会留下旧 JSON）----
+MUTATIONS = {
+    "setitem": lambda p: p.__setitem__("channels", 3),
+    "delitem": lambda p: p.__delitem__("channels"),
+    "update": lambda p: p.update(channels=3),
+    "pop": lambda p: p.pop("channels"),
+    "popitem": lambda p: p.popitem(),
+    "setdefault": lambda p: p.setdefault("extra", 1),
+    "clear": lambda p: p.clear(),
+    "ior": lambda p: p.__ior__({"channels": 3}),
+}
+
+@pytest.mark.parametrize("name", sorted(MUTATIONS))
+def test_mutation_invalidates_json(builder, cfg, name):
+    p = builder.params("setBWC", cfg)
+    assert p.json is not None
+    MUTATIONS[name](p)
+    assert p.json is None
+    body = {"function": "setBWC", "input_parameters": p, "sequence_num": 1}
+    assert nal_core.NALClient._encode(body) == json.dumps(body)
+
+def test_ior_operator_invalidates(builder, cfg):
+    p = builder.params("setBWC", cfg)
+    p |= {"channels": 3}
+    assert isinstance(p, nal_core.BuiltParams) and p.json is None
+
+def test_setdefault_existing_key_keeps_json(builder, cfg):
+    p = builder.params("setBWC", cfg)
+    p.setdefault("channels", 99)
+    assert p.json is not None and p["channels"] == cfg.channels
+
+def test_encode_fast_path_matches_json_dumps(builder, cfg):
+    for t in TEMPLATES:
+        body = builder.request(t["function"], cfg)
+        body["sequence_num"] = 7
+        assert nal_core.NALClient._encode(body) == json.dumps(body)
+    # 键顺序不同时不走快速路径
+    body = {"sequence_num": 7, **builder.request("Get_SII", cfg)}
+    assert nal_core.NALClient._encode(body) == json.dumps(body)
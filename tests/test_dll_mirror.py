@@ -0,0 +1,46 @@
+"""
+NALClient 的 DLL 状态镜像：相同的 Set* 不重发；19 点 / 9 点两种写法共用一个 DLL 槽位
+"""
+import nal_core
+
+def _client(srv) -> nal_core.NALClient:
+    c = nal_core.NALClient()
+    c.set_server("127.0.0.1", srv.port, "/api/nal2/process")
+    assert c.connect()
+    return c
+
+def _set(function: str, **params) -> dict:
+    return {"function": function, "input_parameters": params}
+
+def test_same_set_is_skipped(standin):
+    srv = standin()
+    c = _client(srv)
+    body = _set("SetAdultChild", adultChild=0, dateOfBirth=19800101)
+    c.post_json(body)
+    calls = srv.stats["calls"]
+    assert c.post_json(body)["return"] == 0
+    assert srv.stats["calls"] == calls
+    assert c.metrics.function("SetAdultChild").skipped == 1
+
+def test_sibling_set_overwrites_slot(standin):
+    srv = standin()
+    c = _client(srv)
+    a = _set("SetREDDindiv", REDD=[1.0] * 19)
+    b = _set("SetREDDindiv9", REDD9=[2.0] * 9)
+    calls = srv.stats["calls"]
+    c.post_json(a)
+    c.post_json(b)
+    c.post_json(a)  # 9 点写法已覆盖同一槽位，必须重新发出
+    assert srv.stats["calls"] == calls + 3
+    assert c.metrics.function("SetREDDindiv").skipped == 0
+
+def test_sibling_set_in_apply_sets(standin):
+    srv = standin()
+    c = _client(srv)
+    a = _set("SetRECDh_indiv_NL2", RECDh=[1.0] * 19)
+    b = _set("SetRECDh_indiv9_NL2", RECDh9=[2.0] * 9)
+    c.apply_sets([a])
+    c.apply_sets([b])
+    calls = srv.stats["calls"]
+    c.apply_sets([a, b])
+    assert srv.stats["calls"] == calls + 2
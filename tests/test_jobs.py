@@ -0,0 +1,154 @@
+"""
+JobExecutor / CancelToken：同一 lane 串行且按提交顺序，去重、latest-wins、cancel_lane、shutdown 都会回调 on_done
+"""
+import threading
+import time
+
+import pytest
+
+from nal_core import Cancelled, CancelToken, current_token, Job, JobExecutor
+
+@pytest.fixture
+def jobs():
+    ex = JobExecutor(4)
+    yield ex
+    ex.shutdown()
+
+def _blocker(jobs: JobExecutor, lane: str = "a", name: str = "block"):
+    # 占住 lane：返回 (任务, 放行事件, 已开始事件)
+    release, started = threading.Event(), threading.Event()
+
+    def fn():
+        started.set()
+        release.wait(5)
+
+    job = jobs.submit(lane, name, fn, dedupe=False)
+    assert started.wait(5)
+    return job, release
+
+def _until(cond, timeout: float = 5.0):
+    end = time.monotonic() + timeout
+    while not cond():
+        assert time.monotonic() < end
+        time.sleep(0.005)
+
+def _wait_done(*js: Job):
+    # 状态先于 history / on_done 更新：要看回调结果的用例用 _until 等回调
+    _until(lambda: all(j.state not in (Job.QUEUED, Job.RUNNING) for j in js))
+
+def test_lane_runs_in_submit_order(jobs):
+    order, running, overlap = [], [], []
+    lock = threading.Lock()
+
+    def make(i):
+        def fn():
+            with lock:
+                running.append(i)
+                overlap.append(len(running))
+            time.sleep(0.005)
+            with lock:
+                running.remove(i)
+                order.append(i)
+        return fn
+
+    js = [jobs.submit("a", f"j{i}", make(i), dedupe=False) for i in range(6)]
+    _wait_done(*js)
+    assert order == list(range(6))
+    assert max(overlap) == 1
+
+def test_lanes_run_in_parallel(jobs):
+    barrier = threading.Barrier(2, timeout=5)
+    js = [jobs.submit(lane, "x", barrier.wait) for lane in ("a", "b")]
+    _wait_done(*js)
+    assert [j.state for j in js] == [Job.DONE, Job.DONE]
+
+def test_dedupe_returns_queued_job_and_chains_on_done(jobs):
+    blocker, release = _blocker(jobs)
+    calls, done = [], []
+    first = jobs.submit("a", "refresh", lambda: calls.append(1), on_done=lambda j: done.append("first"))
+    second = jobs.submit("a", "refresh", lambda: calls.append(2), on_done=lambda j: done.append("second"))
+    third = jobs.submit("a", "refresh", lambda: calls.append(3))
+    assert first is second is third
+    release.set()
+    _until(lambda: len(done) == 2)
+    assert calls == [1]
+    assert done == ["first", "second"]
+
+def test_latest_wins_cancels_running_and_queued(jobs):
+    seen_cancel, done = threading.Event(), []
+    started = threading.Event()
+
+    def slow():
+        started.set()
+        token = current_token()
+        while not token.cancelled:
+            time.sleep(0.005)
+        seen_cancel.set()
+        token.raise_if_cancelled()
+
+    running = jobs.submit("a", "fit", slow, latest_wins=True, on_done=lambda j: done.append(("run", j.state)))
+    assert started.wait(5)
+    queued = jobs.submit("a", "fit", lambda: None, latest_wins=True, on_done=lambda j: done.append(("q", j.state)))
+    latest = jobs.submit("a", "fit", lambda: None, latest_wins=True, on_done=lambda j: done.append(("new", j.state)))
+    assert queued.state == Job.CANCELLED  # 被更新的同名任务替换，立即回调
+    _until(lambda: len(done) == 3)
+    assert seen_cancel.is_set()
+    assert running.state == Job.CANCELLED and latest.state == Job.DONE
+    assert done == [("q", Job.CANCELLED), ("run", Job.CANCELLED), ("new", Job.DONE)]
+
+def test_cancel_lane_calls_back_every_job(jobs):
+    blocker, release = _blocker(jobs)
+    done = []
+    queued = [jobs.submit("a", f"q{i}", lambda: None, dedupe=False, on_done=lambda j: done.append(j.name))
+              for i in range(3)]
+    other = jobs.submit("b", "keep", lambda: None)
+    jobs.cancel_lane("a")
+    assert blocker.token.cancelled
+    assert done == ["q0", "q1", "q2"]
+    assert all(j.state == Job.CANCELLED for j in queued)
+    release.set()
+    _wait_done(blocker, other)
+    assert blocker.state == Job.CANCELLED and other.state == Job.DONE
+
+def test_failed_and_cancelled_states(jobs):
+    def boom():
+        raise RuntimeError("坏了")
+
+    def cancel_self():
+        raise Cancelled()
+
+    finished = []
+    failed = jobs.submit("a", "boom", boom, on_done=finished.append)
+    cancelled = jobs.submit("b", "cancel", cancel_self, on_done=finished.append)
+    _until(lambda: len(finished) == 2)
+    assert failed.state == Job.FAILED and failed.error == "坏了"
+    assert cancelled.state == Job.CANCELLED
+    assert failed in jobs.history and cancelled in jobs.history
+
+def test_current_token_only_inside_job(jobs):
+    assert current_token() is None
+    seen = []
+    job = jobs.submit("a", "t", lambda: seen.append(current_token()))
+    _wait_done(job)
+    assert seen == [job.token]
+    assert current_token() is None
+
+def test_shutdown_cancels_and_calls_back():
+    ex = JobExecutor(2)
+    blocker, release = _blocker(ex)
+    done = []
+    queued = ex.submit("a", "q", lambda: done.append("ran"), on_done=lambda j: done.append(j.state))
+    ex.shutdown()
+    assert blocker.token.cancelled
+    assert queued.state == Job.CANCELLED and done == [Job.CANCELLED]
+    release.set()
+    _wait_done(blocker)
+    assert "ran" not in done
+
+def test_cancel_token():
+    t = CancelToken()
+    t.raise_if_cancelled()
+    t.cancel()
+    assert t.cancelled
+    with pytest.raises(Cancelled):
+        t.raise_if_cancelled()
@@ -0,0 +1,43 @@
+"""
+EndpointPool：会话独占按 (key, 线程) 判断，同 key 的两个线程不能同时占用一台设备
+"""
+import threading
+import time
+
+import nal_core
+
+def _pool(n: int = 1) -> nal_core.EndpointPool:
+    return nal_core.EndpointPool([nal_core.NALClient() for _ in range(n)])
+
+def test_same_key_other_thread_waits():
+    pool = _pool()
+    inside = []
+    overlap = []
+    lock = threading.Lock()
+
+    def worker():
+        with pool.session("p1"):
+            with lock:
+                inside.append(1)
+                overlap.append(len(inside))
+            time.sleep(0.05)
+            with lock:
+                inside.pop()
+
+    threads = [threading.Thread(target=worker) for _ in range(2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(5)
+    assert overlap == [1, 1]
+    assert pool.stats()[0]["sessions"] == 2
+    assert pool.stats()[0]["depth"] == 0
+
+def test_same_thread_reenters():
+    pool = _pool(2)
+    with pool.session("p1") as a:
+        with pool.session("p1") as b:
+            assert a is b
+    s = pool.stats()
+    assert sum(x["sessions"] for x in s) == 1
+    assert all(x["depth"] == 0 for x in s)
@@ -0,0 +1,64 @@
+"""
+NALProxy：Set* 按 DLL 槽位记状态；CompressionThreshold_NL2 每次都转发，Set* 变化后随之作废，会话切换时按顺序补发
+"""
+import pytest
+
+import nal_core
+
+CT_FN = "CompressionThreshold_NL2"
+
+@pytest.fixture
+def proxy(standin):
+    srv = standin()
+    up = nal_core.NALClient()
+    up.set_server("127.0.0.1", srv.port, "/api/nal2/process")
+    assert up.connect()
+    p = nal_core.NALProxy(up, port=0)
+    p.start()
+    yield p
+    p.stop()
+
+def _req(function: str, **params) -> dict:
+    return {"function": function, "input_parameters": params, "sequence_num": 1}
+
+def _bwc(channels: int) -> dict:
+    return _req("setBWC", channels=channels, crossOver=[1000.0] * (channels - 1))
+
+def _ct() -> dict:
+    return _req(CT_FN, bandWidth=0, selection=0, WBCT=50, aidType=0, direction=0, mic=0, calcCh=[1] * 19)
+
+def test_compression_threshold_always_forwarded(proxy):
+    proxy.process("a", _bwc(18))
+    proxy.process("a", _ct())
+    calls = proxy.stats["upstream_calls"]
+    proxy.process("a", _ct())
+    assert proxy.stats["upstream_calls"] == calls + 1
+    assert proxy.stats["state_hits"] == 0
+
+def test_set_change_clears_compression_threshold(proxy):
+    proxy.process("a", _bwc(18))
+    proxy.process("a", _ct())
+    assert CT_FN in proxy.device_state
+    proxy.process("a", _bwc(12))
+    assert CT_FN not in proxy.device_state
+    assert CT_FN not in proxy.sessions["a"]
+
+def test_switch_replays_sets_then_compression_threshold(proxy):
+    proxy.process("a", _bwc(18))
+    proxy.process("a", _ct())
+    proxy.process("b", _bwc(12))
+    replays = proxy.stats["state_replays"]
+    proxy.process("a", _req("GetMLE", transducer=0, direction=0, mic=0))  # 只读查询不触发切换
+    assert proxy.stats["state_replays"] == replays
+    proxy.process("a", _req("Speech_o_Gram_NL2"))
+    assert proxy.stats["state_replays"] == replays + 2
+    assert proxy.device_state["setBWC"][0] == proxy.sessions["a"]["setBWC"][0]
+    assert CT_FN in proxy.device_state
+
+def test_sibling_sets_share_slot(proxy):
+    proxy.process("a", _req("SetREDDindiv", REDD=[1.0] * 19))
+    proxy.process("a", _req("SetREDDindiv9", REDD9=[2.0] * 9))
+    calls = proxy.stats["upstream_calls"]
+    proxy.process("a", _req("SetREDDindiv", REDD=[1.0] * 19))
+    assert proxy.stats["upstream_calls"] == calls + 1
+    assert list(proxy.sessions["a"]) == ["SetREDDindiv"]
@@ -0,0 +1,69 @@
+"""
+模板编译出的响应映射表：compile_response_map / map_response_to_fields
+"""
+import os
+
+import nal_core
+from conftest import ROOT
+
+TEMPLATES = nal_core.load_templates_list(os.path.join(ROOT, nal_core.DEFAULT_TEMPLATES_FILE))
+TABLE = nal_core.compile_response_map(TEMPLATES)
+CFG = nal_core.AppConfig()
+
+def _resp(function: str, ret=0, **outputs) -> dict:
+    return {"function": function, "return": ret, "output_parameters": outputs}
+
+def test_every_template_compiles():
+    assert {t["function"] for t in TEMPLATES} <= set(TABLE)
+    for fn, rules in TABLE.items():
+        for key, name, n, variable in rules:
+            assert hasattr(CFG, name), (fn, key, name)
+            assert variable == (name in nal_core.VARIABLE_LEN_OUTPUTS)
+
+def test_fixed_length_list_output():
+    cr = [1.5] * len(CFG.CR)
+    assert nal_core.map_response_to_fields(TABLE, _resp("CompressionRatio_NL2", CR=cr)) == {"CR": cr}
+
+def test_fixed_length_mismatch_ignored():
+    out = nal_core.map_response_to_fields(TABLE, _resp("CompressionRatio_NL2", CR=[1.0] * (len(CFG.CR) - 1)))
+    assert out == {}
+
+def test_variable_length_output_accepts_shorter():
+    # CFArray / centerF 随 channels 变化：不超过字段长度即可
+    cf = [500, 1000, 2000]
+    out = nal_core.map_response_to_fields(TABLE, _resp("CrossOverFrequencies_NL2", CFArray=cf))
+    assert out == {"CFArray": cf}
+    too_long = [1000] * (len(CFG.CFArray) + 1)
+    assert nal_core.map_response_to_fields(TABLE, _resp("CrossOverFrequencies_NL2", CFArray=too_long)) == {}
+
+def test_two_keys_same_field_first_wins():
+    # CenterFrequencies 的 centerF / centreFreq 都映射到 centerF，只取第一个
+    out = nal_core.map_response_to_fields(TABLE, _resp("CenterFrequencies", centerF=[1, 2], centreFreq=[3, 4]))
+    assert out == {"centerF": [1, 2]}
+    out = nal_core.map_response_to_fields(TABLE, _resp("CenterFrequencies", centreFreq=[3, 4]))
+    assert out == {"centerF": [3, 4]}
+
+def test_return_key_maps_scalar():
+    out = nal_core.map_response_to_fields(TABLE, _resp("GainAt_NL2", ret=12.5))
+    assert out == {"gainAt_value": 12.5}
+    # 标量字段不接受 bool / 字符串 / 列表
+    for bad in (True, "12", [1]):
+        assert nal_core.map_response_to_fields(TABLE, _resp("GainAt_NL2", ret=bad)) == {}
+
+def test_error_and_unknown_responses():
+    assert nal_core.map_response_to_fields(TABLE, _resp("CompressionRatio_NL2", error="boom", CR=[1.0] * len(CFG.CR))) == {}
+    assert nal_core.map_response_to_fields(TABLE, _resp("NoSuchFunction", CR=[1.0])) == {}
+    assert nal_core.map_response_to_fields(TABLE, None) == {}
+    assert nal_core.map_response_to_fields(TABLE, {"function": "CompressionRatio_NL2", "output_parameters": None}) == {}
+
+def test_unknown_field_ignored_at_compile():
+    table = nal_core.compile_response_map([
+        {"function": "X", "outputs": {"a": "no_such_field", "b": "CR"}},
+        {"params": []},
+    ])
+    assert table == {"X": [("b", "CR", len(CFG.CR), False)]}
+
+def test_legacy_template_without_outputs_uses_builtin():
+    table = nal_core.compile_response_map([{"function": "CompressionRatio_NL2", "params": []}])
+    builtin = nal_core.compile_response_map(nal_core.DEFAULT_TEMPLATES["templates"])
+    assert table["CompressionRatio_NL2"] == builtin["CompressionRatio_NL2"]
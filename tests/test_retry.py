@@ -0,0 +1,147 @@
+"""
+NALClient 的超时自适应、重试与 Set* 补发：只对 502/503/504 和网络错误重试，退避带随机抖动
+"""
+import pytest
+import requests
+
+import nal_core
+
+SET_BODY = {"function": "SetAdultChild", "input_parameters": {"adultChild": 0, "dateOfBirth": 19800101}}
+PING = {"function": "dllVersion", "input_parameters": {}}
+
+@pytest.fixture
+def no_sleep(monkeypatch):
+    # 记录退避的随机区间，不真的等待
+    spans = []
+
+    def uniform(a, b):
+        spans.append((a, b))
+        return 0.0
+
+    monkeypatch.setattr(nal_core.random, "uniform", uniform)
+    return spans
+
+def _client(srv) -> nal_core.NALClient:
+    c = nal_core.NALClient()
+    c.set_server("127.0.0.1", srv.port, "/api/nal2/process")
+    assert c.connect()
+    c.breaker.threshold = 100  # 这里只看重试，不让熔断提前介入
+    return c
+
+class _StatusSession:
+    # 依次返回给定状态码的响应；用完后一直返回 200
+    def __init__(self, statuses):
+        self.statuses = list(statuses)
+        self.calls = 0
+
+    def post(self, *args, **kwargs):
+        self.calls += 1
+        status = self.statuses.pop(0) if self.statuses else 200
+        r = requests.Response()
+        r.status_code = status
+        r._content = b'{"function": "dllVersion", "return": 0, "output_parameters": {"major": 1, "minor": 0}}'
+        r.headers["Content-Type"] = "application/json"
+        return r
+
+# ---- 重试 ----
+@pytest.mark.parametrize("status", [502, 503, 504])
+def test_retry_status_then_success(standin, no_sleep, status):
+    c = _client(standin())
+    fake = c._local.session = _StatusSession([status, status])
+    assert c.post_json(PING)["return"] == 0
+    assert fake.calls == 3
+    fm = c.metrics.function("dllVersion")
+    assert fm.retries == 2 and fm.errors == 0
+
+@pytest.mark.parametrize("status", [400, 404, 415, 500])
+def test_other_status_not_retried(standin, no_sleep, status):
+    c = _client(standin())
+    fake = c._local.session = _StatusSession([status])
+    with pytest.raises(requests.HTTPError):
+        c.post_json(PING)
+    assert fake.calls == 1 and no_sleep == []
+
+def test_retries_exhausted_against_failing_server(standin, no_sleep):
+    srv = standin(error_rate=1.0, seed=1)
+    c = _client(srv)
+    before = srv.stats["injected_5xx"]
+    with pytest.raises(requests.HTTPError):
+        c.post_json(PING)
+    assert srv.stats["injected_5xx"] - before == nal_core.RETRY_MAX_ATTEMPTS
+    assert c.metrics.function("dllVersion").errors == 1
+
+def test_backoff_is_jittered_and_capped(standin, no_sleep):
+    srv = standin(loss=1.0, seed=1)
+    c = _client(srv)
+    with pytest.raises(requests.ConnectionError):
+        c.post_json(PING)
+    expect = [min(nal_core.RETRY_MAX_DELAY, nal_core.RETRY_BASE_DELAY * 2 ** i)
+              for i in range(nal_core.RETRY_MAX_ATTEMPTS - 1)]
+    assert no_sleep == [(0, d) for d in expect]
+
+def test_timeout_retried_and_sampled(standin, no_sleep):
+    srv = standin(service_ms=300)
+    c = _client(srv)
+    c.timeout = 0.05
+    with pytest.raises(requests.Timeout):
+        c.post_json(PING)
+    assert c.metrics.function("dllVersion").retries == nal_core.RETRY_MAX_ATTEMPTS - 1
+    # 超时按 timeout 计入样本，让之后的超时自适应放宽
+    assert c.latency.quantile("dllVersion", 1.0) == pytest.approx(0.05)
+
+# ---- Set* 结果未知时补发 ----
+def test_set_reapplied_after_network_failure(standin, no_sleep):
+    srv = standin(error_rate=1.0, seed=1)
+    c = _client(srv)
+    with pytest.raises(requests.HTTPError):
+        c.post_json(SET_BODY)
+    assert "SetAdultChild" in c.unknown_sets
+    assert "SetAdultChild" not in c.dll_state
+
+    srv.config.error_rate = 0.0
+    calls = srv.stats["calls"]
+    c.post_json({"function": "GetMLE", "input_parameters": {"transducer": 0, "direction": 0, "mic": 0}})
+    assert srv.stats["calls"] == calls + 1  # 只读查询不触发补发
+    c.post_json({"function": "Speech_o_Gram_NL2", "input_parameters": {}})
+    assert srv.stats["calls"] == calls + 3  # 先补发 SetAdultChild，再发本次调用
+    assert not c.unknown_sets
+    assert c.dll_state["SetAdultChild"][0] == "SetAdultChild"
+    # 补发成功后镜像生效：同样的 Set* 不再发出
+    c.post_json(SET_BODY)
+    assert srv.stats["calls"] == calls + 3
+
+def test_unknown_set_overridden_by_same_slot(standin, no_sleep):
+    srv = standin(error_rate=1.0, seed=1)
+    c = _client(srv)
+    with pytest.raises(requests.HTTPError):
+        c.post_json({"function": "SetREDDindiv", "input_parameters": {"REDD": [1.0] * 19}})
+    srv.config.error_rate = 0.0
+    calls = srv.stats["calls"]
+    c.post_json({"function": "SetREDDindiv9", "input_parameters": {"REDD9": [2.0] * 9}})
+    assert srv.stats["calls"] == calls + 1  # 写同一槽位：结果未知的旧值不再补发
+    assert not c.unknown_sets
+
+# ---- 自适应超时 ----
+def test_timeout_uses_default_until_enough_samples():
+    c = nal_core.NALClient()
+    for _ in range(nal_core.TIMEOUT_MIN_SAMPLES - 1):
+        c.latency.add("f", 0.5)
+    assert c.timeout_for("f") == c.timeout
+    c.latency.add("f", 0.5)
+    assert c.timeout_for("f") == pytest.approx(0.5 * nal_core.TIMEOUT_P99_FACTOR)
+
+@pytest.mark.parametrize("sample, expect", [(0.001, nal_core.TIMEOUT_MIN), (60.0, nal_core.TIMEOUT_MAX)])
+def test_timeout_clamped(sample, expect):
+    c = nal_core.NALClient()
+    for _ in range(nal_core.TIMEOUT_MIN_SAMPLES):
+        c.latency.add("f", sample)
+    assert c.timeout_for("f") == expect
+
+def test_latency_window_and_quantile():
+    stats = nal_core.LatencyStats(maxlen=10)
+    for i in range(20):
+        stats.add("f", float(i))
+    assert stats.quantile("f", 0.0) == 10.0  # 只保留最近 10 个
+    assert stats.quantile("f", 0.99) == 19.0
+    assert stats.quantile("f", 0.5, min_samples=11) is None
+    assert stats.quantile("g", 0.5) is None
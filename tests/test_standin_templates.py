@@ -0,0 +1,43 @@
+"""
+替身服务器的输出必须与手机端 HttpServer.kt 一致：每个模板的响应都能完整映射回 AppConfig 字段
+"""
+import json
+import os
+import urllib.request
+
+import pytest
+
+import nal_core
+import nal_standin
+from conftest import ROOT
+
+TEMPLATES = nal_core.load_templates_list(os.path.join(ROOT, nal_core.DEFAULT_TEMPLATES_FILE))
+
+def _post(port: int, body: dict) -> dict:
+    req = urllib.request.Request(f"http://127.0.0.1:{port}/api/nal2/process", json.dumps(body).encode("utf-8"),
+                                 {"Content-Type": "application/json"})
+    with urllib.request.urlopen(req, timeout=5) as r:
+        return json.load(r)
+
+@pytest.fixture(scope="module")
+def server():
+    srv = nal_standin.StandInServer("127.0.0.1", 0).start()
+    yield srv
+    srv.stop()
+
+def test_all_templates_present():
+    assert len(TEMPLATES) == 46
+
+@pytest.mark.parametrize("template", TEMPLATES, ids=lambda t: t["function"])
+def test_template_maps_cleanly(server, template, capsys):
+    table = nal_core.compile_response_map(TEMPLATES)
+    builder = nal_core.RequestBuilder(TEMPLATES)
+    fn = template["function"]
+    body = builder.request(fn, nal_core.AppConfig())
+    body["sequence_num"] = 1
+    resp = _post(server.port, body)
+    assert resp["return"] != -1, resp
+    updates = nal_core.map_response_to_fields(table, resp)
+    assert set(updates) == {name for _, name, _, _ in table[fn]}
+    # 长度不符 / 未知字段都会打印“已忽略”
+    assert "已忽略" not in capsys.readouterr().out
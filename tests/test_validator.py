@@ -0,0 +1,97 @@
+"""
+发送前参数校验：PARAM_RULES 类型/长度/范围、依赖 channels 的数组长度、IO 曲线电平范围、API 文档解析
+"""
+import os
+
+import pytest
+
+import nal_core
+from conftest import ROOT
+
+TEMPLATES = nal_core.load_templates_list(os.path.join(ROOT, nal_core.DEFAULT_TEMPLATES_FILE))
+BUILDER = nal_core.RequestBuilder(TEMPLATES)
+DOC = os.path.join(ROOT, nal_core.DEFAULT_API_DOC_FILE)
+
+@pytest.fixture(params=["builtin", "doc"])
+def validator(request):
+    # 内置表与 API 文档两种来源的规则行为应一致
+    return nal_core.RequestValidator(TEMPLATES, DOC if request.param == "doc" else "")
+
+def _params(function: str, **overrides) -> dict:
+    return dict(BUILDER.params(function, nal_core.AppConfig(), **overrides))
+
+def test_defaults_pass(validator):
+    for t in TEMPLATES:
+        assert validator.validate(t["function"], _params(t["function"])) == [], t["function"]
+
+def test_unknown_function_not_checked(validator):
+    assert validator.validate("NoSuchFunction", {"anything": object()}) == []
+
+def test_missing_param(validator):
+    p = _params("Get_SII")
+    del p["REAG"]
+    assert validator.validate("Get_SII", p) == ["缺少参数 REAG"]
+
+@pytest.mark.parametrize("function, name, value, expect", [
+    ("CompressionRatio_NL2", "channels", 2.5, "channels 应为整数"),
+    ("CompressionRatio_NL2", "channels", True, "channels 应为整数"),
+    ("CompressionRatio_NL2", "channels", 19, "channels=19 超出范围 1..18"),
+    ("CompressionRatio_NL2", "limiting", -1, "limiting=-1 超出范围 0..2"),
+    ("CompressionRatio_NL2", "AC", [0] * 19, "AC 长度应为 9，实际为 19"),
+    ("CompressionRatio_NL2", "AC", "x", "AC 应为长度 9 的数组"),
+    ("CompressionRatio_NL2", "AC", [0] * 8 + ["x"], "AC[8] 应为数值"),
+    ("GainAt_NL2", "freqRequired", 19, "freqRequired=19 超出范围 0..18"),
+    ("Get_SII", "REAG", [0] * 9, "REAG 长度应为 19"),
+])
+def test_param_rules(validator, function, name, value, expect):
+    errors = validator.validate(function, _params(function, **{name: value}))
+    assert len(errors) == 1 and errors[0].startswith(expect), errors
+
+def test_centre_freq_length_is_channels_plus_one(validator):
+    for ch in (1, 4, 18):
+        ok = _params("CompressionRatio_NL2", channels=ch, centreFreq=list(range(ch + 1)))
+        assert validator.validate("CompressionRatio_NL2", ok) == []
+        for n in (ch, ch + 2):
+            bad = _params("CompressionRatio_NL2", channels=ch, centreFreq=list(range(n)))
+            errors = validator.validate("CompressionRatio_NL2", bad)
+            assert len(errors) == 1 and "centreFreq 长度应为 channels+1" in errors[0]
+            with pytest.raises(nal_core.RequestValidationError):
+                validator.check({"function": "CompressionRatio_NL2", "input_parameters": bad})
+
+def test_cross_over_minimum_length(validator):
+    assert validator.validate("setBWC", _params("setBWC", channels=1, crossOver=[1000])) == []
+    assert validator.validate("setBWC", _params("setBWC", channels=4, crossOver=[1, 2, 3, 4, 5])) == []
+    errors = validator.validate("setBWC", _params("setBWC", channels=4, crossOver=[1, 2]))
+    assert len(errors) == 1 and "crossOver 长度至少为 max(1, channels-1)=3" in errors[0]
+    errors = validator.validate("setBWC", _params("setBWC", channels=1, crossOver=[]))
+    assert len(errors) == 1 and "=1，实际为 0" in errors[0]
+
+def test_io_curve_levels(validator):
+    fn = "RealEarInputOutputCurve_NL2"
+    assert validator.validate(fn, _params(fn, startLevel=40, finishLevel=139)) == []
+    errors = validator.validate(fn, _params(fn, startLevel=40, finishLevel=40))
+    assert errors and "必须大于 startLevel" in errors[0]
+    errors = validator.validate(fn, _params(fn, startLevel=40, finishLevel=140))
+    assert errors and "必须小于 100" in errors[0]
+
+def test_check_rejects_non_object(validator):
+    with pytest.raises(nal_core.RequestValidationError, match="input_parameters 必须是 JSON 对象"):
+        validator.check({"function": "Get_SII", "input_parameters": [1, 2]})
+
+def test_doc_rules_fall_back_to_builtin_range():
+    # 文档里 GainAt_NL2 的 freqRequired 没写范围：沿用内置表的 0..18
+    doc = nal_core.load_param_rules_from_doc(DOC)
+    assert doc["GainAt_NL2"]["freqRequired"][2:] == (None, None)
+    assert doc["CompressionRatio_NL2"]["channels"] == ("int", None, 1, 18)
+    assert nal_core.load_param_rules_from_doc(os.path.join(ROOT, "no_such_doc.md")) == {}
+
+def test_client_rejects_before_sending(standin):
+    srv = standin()
+    c = nal_core.NALClient()
+    c.set_server("127.0.0.1", srv.port, "/api/nal2/process")
+    assert c.connect()
+    c.validator = nal_core.RequestValidator(TEMPLATES)
+    before = srv.stats["calls"]
+    with pytest.raises(nal_core.RequestValidationError):
+        c.post_json(BUILDER.request("CompressionRatio_NL2", nal_core.AppConfig(), centreFreq=[1, 2]))
+    assert srv.stats["calls"] == before
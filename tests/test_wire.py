@@ -0,0 +1,131 @@
+"""
+NALClient 与替身服务器之间的线格式：握手、gzip/deflate、MessagePack、400/415 回退、批量 Set*
+"""
+import os
+
+import pytest
+
+import nal_core
+from conftest import ROOT
+from nal_wire import JSON_TYPE, MSGPACK_TYPE
+
+TEMPLATES = nal_core.load_templates_list(os.path.join(ROOT, nal_core.DEFAULT_TEMPLATES_FILE))
+BUILDER = nal_core.RequestBuilder(TEMPLATES)
+CFG = nal_core.AppConfig()
+BIG_REQUEST = "Get_SII"                     # 请求体 > COMPRESS_MIN_BYTES
+BIG_RESPONSE = "RealEarInputOutputCurve_NL2"  # 响应 2×100 个 double
+
+def _client(srv, offer_binary: bool = True) -> nal_core.NALClient:
+    c = nal_core.NALClient()
+    c.offer_binary = offer_binary
+    c.set_server("127.0.0.1", srv.port, "/api/nal2/process")
+    assert c.connect()
+    return c
+
+def _call(c: nal_core.NALClient, function: str) -> dict:
+    out = c.post_json(BUILDER.request(function, CFG))
+    assert out["return"] != -1, out
+    return out
+
+def _strip(out: dict) -> dict:
+    return {k: v for k, v in out.items() if k != "sequence_num"}
+
+# ---- 握手 ----
+def test_handshake_profile(standin):
+    srv = standin(compress=True, batch=True, binary=True, concurrency=2)
+    c = _client(srv)
+    p = c.profile
+    assert p.advertised and p.server == "nal-standin"
+    assert p.dll_version is not None
+    assert MSGPACK_TYPE in p.encodings
+    assert p.compression == ["gzip", "deflate"]
+    assert p.batch and p.max_concurrency == 2
+    assert c.wire == MSGPACK_TYPE and c.request_encoding == "gzip"
+
+def test_handshake_conservative_defaults(standin):
+    c = _client(standin())
+    assert c.profile.encodings == [JSON_TYPE] and not c.profile.compression and not c.profile.batch
+    assert c.wire == JSON_TYPE and c.request_encoding == ""
+
+# ---- 压缩 ----
+@pytest.mark.parametrize("encoding", ["gzip", "deflate"])
+def test_compressed_round_trip(standin, encoding):
+    srv = standin(compress=True)
+    plain = _client(standin())
+    c = _client(srv, offer_binary=False)
+    c.request_encoding = encoding
+    for function in (BIG_REQUEST, BIG_RESPONSE):
+        assert _strip(_call(c, function)) == _strip(_call(plain, function))
+    req = c.metrics.function(BIG_REQUEST)
+    assert req.req_wire.total < req.req_bytes.total
+    resp = c.metrics.function(BIG_RESPONSE)
+    assert resp.resp_wire.total < resp.resp_bytes.total
+    assert resp.wire_saving() > 0.5
+
+def test_small_request_not_compressed(standin):
+    srv = standin(compress=True)
+    c = _client(srv, offer_binary=False)
+    assert c.request_encoding == "gzip"
+    body = {"function": "SetAdultChild", "input_parameters": {"adultChild": 0, "dateOfBirth": 19800101}}
+    assert len(nal_core.NALClient._encode(dict(body, sequence_num=0))) < c.compress_min
+    before = srv.stats["bytes_in"]
+    c.post_json(body)
+    fm = c.metrics.function("SetAdultChild")
+    assert fm.req_wire.total == fm.req_bytes.total
+    assert srv.stats["bytes_in"] - before == fm.req_bytes.total
+
+def test_compression_refused_falls_back(standin):
+    srv = standin(compress=True)
+    c = _client(srv, offer_binary=False)
+    srv.config.compress = False  # 例如手机端换了不认识 Content-Encoding 的版本
+    _call(c, BIG_REQUEST)
+    assert c.request_encoding is None
+    _call(c, BIG_REQUEST)
+    fm = c.metrics.function(BIG_REQUEST)
+    assert fm.req_wire.total == fm.req_bytes.total
+    assert fm.errors == 0
+
+# ---- MessagePack ----
+def test_msgpack_negotiated(standin):
+    srv = standin(binary=True)
+    c = _client(srv)
+    plain = _client(srv, offer_binary=False)
+    assert c.wire == MSGPACK_TYPE and plain.wire == JSON_TYPE
+    before = srv.stats["binary_out"]
+    assert _strip(_call(c, BIG_RESPONSE)) == _strip(_call(plain, BIG_RESPONSE))
+    assert srv.stats["binary_out"] == before + 1
+    assert c.metrics.function(BIG_RESPONSE).resp_bytes.total < plain.metrics.function(BIG_RESPONSE).resp_bytes.total
+
+def test_msgpack_refused_falls_back(standin):
+    srv = standin(binary=True)
+    c = _client(srv)
+    srv.config.binary = False
+    _call(c, BIG_RESPONSE)
+    assert c.wire == JSON_TYPE
+    assert c.metrics.function(BIG_RESPONSE).errors == 0
+
+# ---- 批量 Set* ----
+def _sets(**overrides) -> list:
+    cfg = nal_core.AppConfig(**overrides)
+    return [BUILDER.request(function, cfg) for function in nal_core.SESSION_STATE_SETS]
+
+def test_apply_sets_batched(standin):
+    srv = standin(batch=True)
+    c = _client(srv)
+    before = srv.stats["requests"]
+    outs = c.apply_sets(_sets())
+    assert srv.stats["requests"] == before + 1
+    assert [o["function"] for o in outs] == list(nal_core.SESSION_STATE_SETS)
+    assert all(o["return"] == 0 for o in outs)
+    c.apply_sets(_sets())  # 与镜像相同：一个也不发
+    assert srv.stats["requests"] == before + 1
+
+def test_apply_sets_batch_refused_falls_back(standin):
+    srv = standin(batch=True)
+    c = _client(srv)
+    srv.config.batch = False  # 服务器回 400
+    before = srv.stats["requests"]
+    outs = c.apply_sets(_sets())
+    assert all(o["return"] == 0 for o in outs)
+    assert not c.profile.batch
+    assert srv.stats["requests"] == before + 1 + len(outs)